@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Unified command line for the LongEval WebRetrieval pipeline.
+
+    python longeval.py index    [--corpus DIR] [--index DIR] [--backend {pyserini,java}]
+    python longeval.py search   [--index DIR] [--queries FILE] [--output RUN]
+    python longeval.py optimize [--config YAML]
+    python longeval.py rerank   --model {luyu_hf,monoT5,luyu,cohere} [--run RUN] [--output RUN] [--dedup MODE]
+    python longeval.py evaluate --qrels FILE --run RUN [--output FILE]
+    python longeval.py compare  --lag6 EVAL --lag8 EVAL [--output FILE]
+    python longeval.py fuse     --rerank RUN [RUN ...] [--bm25 RUN] [--apply LAG RUN ...]
+    python longeval.py experiments [--matrix YAML] [--dry-run] [--force]
+
+Only argparse and yaml are imported at start-up; pyserini/JVM, torch,
+transformers, pytrec_eval, pygaggle and cohere are imported inside the
+command that needs them, so `--help` and typos fail fast.
+"""
+import argparse
+import os
+import sys
+import time
+
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from systems.neural.rerankers import RERANKERS       # name -> module, no heavy imports
+
+CONFIG_PATH = os.path.join(PROJECT_ROOT, 'scripts', 'config.yml')
+
+
+# --------------------------------------------------------------------------- #
+# Commands (heavy imports happen here)                                        #
+# --------------------------------------------------------------------------- #
+def cmd_index(args):
+    from scripts.build_index import CORPUS_DIR, build_index
+    build_index(args.corpus or CORPUS_DIR, args.index, threads=args.threads, backend=args.backend,
+                ram_buffer_mb=args.ram_buffer_mb, force_merge=args.force_merge, stopwords=args.stopwords,
+                jar=args.jar)
+
+
+def cmd_search(args):
+    from scripts.search import search
+    search(args.index, args.queries, args.output, args.k1, args.b, args.top_k, args.qrels or None, args.sample,
+           language=args.language)
+
+
+def cmd_optimize(args):
+    from systems.bm25_baseline.optimize import optimize
+    optimize(args.config)
+
+
+def cmd_rerank(args):
+    import importlib
+    from pathlib import Path
+
+    module = importlib.import_module(RERANKERS[args.model])
+    kwargs = {"model_name": args.model_name} if args.model_name else {}
+    output = args.output or os.path.join(args.output_dir, f"run_neural_{args.model}.txt")
+    module.rerank_run(Path(args.run), Path(args.docs), Path(args.queries), Path(output), top_k=args.top_k,
+                      dedup=args.dedup, **kwargs)
+
+
+def cmd_evaluate(args):
+    from scripts.evaluate import evaluate
+    evaluate(args.qrels, args.run, args.output)
+
+
+def cmd_compare(args):
+    from scripts.compare_eval import compare_lags
+    compare_lags(args.lag6, args.lag8, args.output)
+
+
+def cmd_fuse(args):
+    from scripts.fuse_scores import fuse_scores
+    apply = {entry[0]: entry[1:] for entry in args.apply}
+    fuse_scores(args.bm25, args.rerank, args.qrels, args.norms, args.depths, args.step, args.output_dir, apply,
+                args.lag8_qrels, args.sweep_output)
+
+
+def cmd_experiments(args):
+    from scripts.experiments import run_experiments
+    status = run_experiments(args.matrix, args.workdir, args.max_cpus, args.max_memory_gb, args.dry_run, args.force)
+    return 1 if any(s in ("failed", "blocked") for s in status.values()) else 0
+
+
+# --------------------------------------------------------------------------- #
+# Parser                                                                      #
+# --------------------------------------------------------------------------- #
+def build_parser(config) -> argparse.ArgumentParser:
+    from scripts.build_index import INDEX_LANGUAGE, JAR_PATH     # constants only, no heavy imports
+    from scripts.rerank_plan import DEDUP_MODES, DEFAULT_MODE
+
+    data_dir = config['data']['data_dir']
+    collection = os.path.join(data_dir, config['data']['train_collection'])
+    output_dir = config['general']['output_dir']
+    queries = os.path.join(data_dir, config['data']['queries_file'])
+    lag6_qrels = os.path.join(collection, config['data']['lag6_qrels_dir'], 'qrels_processed.txt')
+    lag8_qrels = os.path.join(collection, config['data']['lag8_qrels_dir'], 'qrels_processed.txt')
+    bm25 = config['bm25']
+    builder = config.get('index_builder', {})
+
+    parser = argparse.ArgumentParser(prog="longeval.py", description="LongEval WebRetrieval pipeline")
+    parser.add_argument("--timing", action="store_true", help="Print the total command time")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    p = commands.add_parser("index", help="Build the Lucene index (Pyserini or Java IndexBuilder)")
+    p.add_argument("--corpus", help="JSON documents (default: dev subset, Lag6)")
+    p.add_argument("--index", default=bm25['index_dir'])
+    p.add_argument("--backend", choices=list(INDEX_LANGUAGE), default=builder.get('backend', 'pyserini'))
+    p.add_argument("--threads", type=int, default=builder.get('threads', 2))
+    p.add_argument("--ram-buffer-mb", type=int, default=builder.get('ram_buffer_mb'), help="java: IndexWriter RAM buffer")
+    p.add_argument("--force-merge", type=int, default=builder.get('force_merge', 0), help="java: segments after forceMerge (0 = off)")
+    p.add_argument("--stopwords", default=builder.get('stopwords'), help="java: custom stopword list")
+    p.add_argument("--jar", default=builder.get('jar', JAR_PATH), help="java: IndexBuilder jar (relative to the project root)")
+    p.set_defaults(func=cmd_index)
+
+    p = commands.add_parser("search", help="BM25 search → TREC run file")
+    p.add_argument("--index", default=bm25['index_dir'])
+    p.add_argument("--queries", default=queries)
+    p.add_argument("--output", default=os.path.join(output_dir, 'run_bm25.txt'))
+    p.add_argument("--k1", type=float, help="Default: Pyserini's 0.9 (bm25.k1 in config.yml is not applied here)")
+    p.add_argument("--b", type=float, help="Default: Pyserini's 0.4 (bm25.b in config.yml is not applied here)")
+    p.add_argument("--top_k", type=int, default=bm25.get('top_k', 25))
+    p.add_argument("--qrels", default=lag6_qrels, help="Only search judged queries ('' = all queries)")
+    p.add_argument("--sample", type=int, default=1000, help="Downsample to n queries (0 = no sampling)")
+    p.add_argument("--language", default=INDEX_LANGUAGE[builder.get('backend', 'pyserini')],
+                   help="Analyzer of the index ('fr' for the Java IndexBuilder; default: from index_builder.backend)")
+    p.set_defaults(func=cmd_search)
+
+    p = commands.add_parser("optimize", help="BM25 k1/b grid search")
+    p.add_argument("--config", default=os.path.join(PROJECT_ROOT, 'systems', 'bm25_baseline', 'optimization_config.yaml'))
+    p.set_defaults(func=cmd_optimize)
+
+    p = commands.add_parser("rerank", help="Neural reranking of a run file")
+    p.add_argument("--model", choices=sorted(RERANKERS), default="luyu_hf")
+    p.add_argument("--model-name", help="Checkpoint / API model (default: the reranker's own)")
+    p.add_argument("--run", default=os.path.join(output_dir, 'run_bm25.txt'))
+    p.add_argument("--docs", default=os.path.join(collection, 'Trec', '2022-11_fr'), help="TREC documents")
+    p.add_argument("--queries", default=queries)
+    p.add_argument("--output", help="Default: <output_dir>/run_neural_<model>.txt")
+    p.add_argument("--top_k", type=int, default=bm25.get('top_k', 25))
+    p.add_argument("--dedup", choices=DEDUP_MODES, default=DEFAULT_MODE,
+                   help="Score identical (query, doc) pairs of different qids once (exact: identical text; "
+                        "basic: + case/whitespace/accents, french: + Lucene FrenchAnalyzer, both with the text "
+                        "of the first qid)")
+    p.set_defaults(func=cmd_rerank, output_dir=output_dir)
+
+    p = commands.add_parser("evaluate", help="nDCG@10 of a run file (pytrec_eval)")
+    p.add_argument("--qrels", default=lag6_qrels)
+    p.add_argument("--run", required=True)
+    p.add_argument("--output", help="Default: eval_results/<run>_eval.txt")
+    p.set_defaults(func=cmd_evaluate)
+
+    p = commands.add_parser("compare", help="Relative nDCG@10 drop Lag6 → Lag8")
+    p.add_argument("--lag6", required=True, help="evaluate output for Lag6")
+    p.add_argument("--lag8", required=True, help="evaluate output for Lag8")
+    p.add_argument("--output", default='eval_results/eval_bm25_drop.txt')
+    p.set_defaults(func=cmd_compare)
+
+    fusion = config.get('fusion', {})
+    p = commands.add_parser("fuse", help="Tune BM25 + neural score interpolation on Lag6, write fused runs")
+    p.add_argument("--bm25", default=os.path.join(output_dir, 'run_bm25.txt'))
+    p.add_argument("--rerank", nargs="+", required=True, help="Rerank runs of the BM25 candidates")
+    p.add_argument("--qrels", default=lag6_qrels)
+    p.add_argument("--lag8-qrels", default=lag8_qrels, help="Held-out check of the best configuration")
+    p.add_argument("--norms", nargs="+", choices=["minmax", "zscore", "none"], default=fusion.get('norms', ["minmax", "zscore"]))
+    p.add_argument("--depths", nargs="+", type=int, default=fusion.get('depths', [0]), help="0 = all candidates")
+    p.add_argument("--step", type=float, default=fusion.get('step', 0.01))
+    p.add_argument("--apply", nargs="+", action="append", metavar=("LAG", "RUN"), default=[],
+                   help="LAG BM25_RUN RERANK_RUN...: write the best fused run for another lag")
+    p.add_argument("--output-dir", default=output_dir)
+    p.add_argument("--sweep-output", default="eval_results/fusion_sweep.tsv")
+    p.set_defaults(func=cmd_fuse)
+
+    p = commands.add_parser("experiments", help="Run a matrix of systems × lags × parameters (cached, parallel)")
+    p.add_argument("--matrix", default=os.path.join(PROJECT_ROOT, 'scripts', 'experiments.yml'))
+    p.add_argument("--workdir", help="Default: `workdir` of the matrix")
+    p.add_argument("--max-cpus", type=int)
+    p.add_argument("--max-memory-gb", type=float)
+    p.add_argument("--dry-run", action="store_true", help="Print the graph and what would run")
+    p.add_argument("--force", action="store_true", help="Ignore the cache")
+    p.set_defaults(func=cmd_experiments)
+    return parser
+
+
+def main(argv=None) -> int:
+    start = time.perf_counter()
+    with open(CONFIG_PATH, 'r') as f:
+        config = yaml.safe_load(f)
+    args = build_parser(config).parse_args(argv)
+    code = args.func(args) or 0
+    if args.timing:
+        print(f"⏱️  longeval {args.command}: {time.perf_counter() - start:.2f}s")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
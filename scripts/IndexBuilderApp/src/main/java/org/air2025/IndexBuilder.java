@@ -1,11 +1,13 @@
 package org.air2025;
-import com.fasterxml.jackson.databind.JsonNode;
-import com.fasterxml.jackson.databind.ObjectMapper;
+import com.fasterxml.jackson.core.JsonFactory;
+import com.fasterxml.jackson.core.JsonParser;
+import com.fasterxml.jackson.core.JsonToken;
 
 import org.apache.lucene.analysis.CharArraySet;
 import org.apache.lucene.analysis.WordlistLoader;
 import org.apache.lucene.analysis.fr.FrenchAnalyzer;
 import org.apache.lucene.document.*;
+import org.apache.lucene.index.IndexOptions;
 import org.apache.lucene.index.IndexWriter;
 import org.apache.lucene.index.IndexWriterConfig;
 import org.apache.lucene.store.Directory;
@@ -15,26 +17,62 @@ import org.apache.lucene.util.BytesRef;
 import java.io.File;
 import java.io.FileReader;
 import java.io.IOException;
-import java.nio.charset.StandardCharsets;
 import java.nio.file.Files;
 import java.nio.file.Path;
 import java.nio.file.Paths;
+import java.util.ArrayList;
 import java.util.Iterator;
+import java.util.List;
+import java.util.concurrent.ArrayBlockingQueue;
+import java.util.concurrent.ThreadPoolExecutor;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.atomic.AtomicLong;
+import java.util.concurrent.atomic.AtomicReference;
 import java.util.stream.Stream;
 
 public class IndexBuilder {
+    /**
+     * Indexing options, set via the optional CLI flags
+     */
+    private static class Options {
+        int threads = Runtime.getRuntime().availableProcessors();
+        double ramBufferMB = 1024;      // Lucene default: 16 MB -> many small segments and merges
+        int forceMergeSegments = 0;     // 0 = no forceMerge at the end
+        int batchSize = 1000;           // documents per addDocuments call
+        long progressEvery = 100_000;   // print progress every n documents
+    }
+
+    /**
+     * "contents": analysed and stored; the postings keep positions (phrase queries).
+     * The term vectors hold term frequencies only -- that is all RM3 reads as document
+     * vector, same as Pyserini's --storeDocvectors (no term vector positions/offsets).
+     */
+    private static final FieldType CONTENTS_TYPE = new FieldType();
+    static {
+        CONTENTS_TYPE.setIndexOptions(IndexOptions.DOCS_AND_FREQS_AND_POSITIONS);
+        CONTENTS_TYPE.setTokenized(true);
+        CONTENTS_TYPE.setStored(true);
+        CONTENTS_TYPE.setStoreTermVectors(true);
+        CONTENTS_TYPE.freeze();
+    }
+
     /**
      * Contains a static method to index French JSON-s
      */
     private static class FrenchJsonLuceneIndexer {
         /**
-         * For indexing the French text JSONs
+         * For indexing the French text JSONs.
+         * The JSON files are parsed (streaming) in the calling thread, the documents are handed over in
+         * batches to a pool of indexing threads which analyse and add them to the shared IndexWriter.
          * @param inputFilePath JSON path
          * @param outputFilePath Index path
          * @param customStopWordListPath if there is any custom stop-word list to be used
-         * @throws IOException if files cannot be read
+         * @param options threads, RAM buffer, forceMerge
+         * @return number of indexed documents
+         * @throws IOException if files cannot be read or a document cannot be indexed
          */
-        public static void buildIndex(String inputFilePath, String outputFilePath, String customStopWordListPath) throws IOException {
+        public static long buildIndex(String inputFilePath, String outputFilePath, String customStopWordListPath,
+                                      Options options) throws IOException, InterruptedException {
             Directory dir = FSDirectory.open(Paths.get(outputFilePath));
             FrenchAnalyzer analyzer = null;
             if(customStopWordListPath != null){
@@ -44,7 +82,7 @@ public class IndexBuilder {
                     analyzer = new FrenchAnalyzer(stopwords);
                 }
                 catch(Exception exception){
-                    System.out.println("Custom stopword list could not be loaded because of the following exception:" 
+                    System.out.println("Custom stopword list could not be loaded because of the following exception:"
                     + exception.getMessage() +"The in-built list will be used!");
                     analyzer = new FrenchAnalyzer();
                 }
@@ -58,50 +96,158 @@ public class IndexBuilder {
 
             IndexWriterConfig config = new IndexWriterConfig(analyzer);
             config.setOpenMode(IndexWriterConfig.OpenMode.CREATE);
+            config.setRAMBufferSizeMB(options.ramBufferMB);
 
             IndexWriter writer = new IndexWriter(dir, config);
-            ObjectMapper mapper = new ObjectMapper();
+            JsonFactory factory = new JsonFactory();
+
+            // Bounded queue: if the indexing threads fall behind, the parsing thread indexes the batch itself
+            ThreadPoolExecutor pool = new ThreadPoolExecutor(options.threads, options.threads, 0L, TimeUnit.MILLISECONDS,
+                    new ArrayBlockingQueue<>(2 * options.threads), new ThreadPoolExecutor.CallerRunsPolicy());
+            AtomicLong indexed = new AtomicLong();
+            AtomicReference<Exception> failure = new AtomicReference<>();
+            long start = System.nanoTime();
 
+            List<Document> batch = new ArrayList<>(options.batchSize);
             try (Stream<Path> paths = Files.walk(Paths.get(inputFilePath))) {
-                paths.filter(Files::isRegularFile).forEach(path -> {
-                    try {
-                        JsonNode json = mapper.readTree(path.toFile());
+                Iterator<Path> files = paths.filter(Files::isRegularFile).sorted().iterator();
+                while (files.hasNext() && failure.get() == null) {
+                    Path path = files.next();
+                    try (JsonParser parser = factory.createParser(path.toFile())) {
+                        Document doc;
+                        while ((doc = nextDocument(parser, path.getFileName().toString())) != null) {
+                            batch.add(doc);
+                            if (batch.size() == options.batchSize) {
+                                submit(pool, writer, batch, indexed, failure, options.progressEvery, start);
+                                batch = new ArrayList<>(options.batchSize);
+                            }
+                        }
+                    } catch (IOException e) {
+                        System.err.println("Failed to index " + path + ": " + e.getMessage());
+                    }
+                }
+            }
+            if (!batch.isEmpty()) {
+                submit(pool, writer, batch, indexed, failure, options.progressEvery, start);
+            }
+            pool.shutdown();
+            pool.awaitTermination(Long.MAX_VALUE, TimeUnit.DAYS);
 
-                        for(JsonNode jsonNode : json) {
-                            String id = jsonNode.has("id") ? jsonNode.get("id").asText() : path.getFileName().toString();
-                            String body = jsonNode.has("contents") ? jsonNode.get("contents").asText() : "";
+            if (failure.get() != null) {
+                writer.rollback();
+                throw new IOException("Indexing failed: " + failure.get().getMessage(), failure.get());
+            }
 
-                            Document doc = new Document();
-                            // Add ID properly
-                            doc.add(new StringField("id", id, Field.Store.YES)); // Stored and indexed
-                            doc.add(new BinaryDocValuesField("id", new BytesRef(id))); // Required for Pyserini
+            double seconds = (System.nanoTime() - start) / 1e9;
+            System.out.printf("Total %,d documents indexed in %.1f s (%.0f docs/s, %d threads, RAM buffer %.0f MB)%n",
+                    indexed.get(), seconds, indexed.get() / seconds, options.threads, options.ramBufferMB);
 
-                            doc.add(new TextField("contents", body, Field.Store.YES)); // Pyserini reads "contents"
+            if (options.forceMergeSegments > 0) {
+                long mergeStart = System.nanoTime();
+                writer.forceMerge(options.forceMergeSegments);
+                System.out.printf("forceMerge(%d) in %.1f s%n", options.forceMergeSegments,
+                        (System.nanoTime() - mergeStart) / 1e9);
+            }
 
-                            writer.addDocument(doc);
+            writer.close();
+            System.out.println("All documents indexed to: " + outputFilePath);
+            return indexed.get();
+        }
 
-                        }
-                        System.out.println("Indexed: " + path.getFileName().toString());
+        /**
+         * Hands one batch to the indexing pool. Lucene's IndexWriter is thread-safe,
+         * each thread fills its own in-memory segment.
+         */
+        private static void submit(ThreadPoolExecutor pool, IndexWriter writer, List<Document> batch, AtomicLong indexed,
+                                   AtomicReference<Exception> failure, long progressEvery, long start) {
+            pool.execute(() -> {
+                try {
+                    writer.addDocuments(batch);
+                    long after = indexed.addAndGet(batch.size());
+                    if ((after - batch.size()) / progressEvery != after / progressEvery) {
+                        double seconds = (System.nanoTime() - start) / 1e9;
+                        System.out.printf("Indexed: %,d documents (%.0f docs/s)%n", after, after / seconds);
+                    }
+                } catch (IOException | RuntimeException e) {
+                    failure.compareAndSet(null, e);
+                }
+            });
+        }
 
+        /**
+         * Streaming parser: returns the next document of a JSON file or null at the end.
+         * Accepts an array of objects, a single object or one object per line (JSONL).
+         * Only "id" and "contents" are read, all other fields are skipped.
+         */
+        private static Document nextDocument(JsonParser parser, String fileName) throws IOException {
+            JsonToken token;
+            while ((token = parser.nextToken()) != null) {
+                if (token == JsonToken.START_OBJECT) {
+                    break;
+                }
+                if (token != JsonToken.START_ARRAY && token != JsonToken.END_ARRAY) {
+                    parser.skipChildren();
+                }
+            }
+            if (token == null) {
+                return null;
+            }
 
-                    } catch (IOException e) {
-                        System.err.println("Failed to index " + path + ": " + e.getMessage());
-                    }
-                });
+            String id = fileName;
+            String body = "";
+            while (parser.nextToken() == JsonToken.FIELD_NAME) {
+                String field = parser.currentName();
+                JsonToken value = parser.nextToken();
+                if ("id".equals(field) && value.isScalarValue()) {
+                    id = parser.getValueAsString(fileName);
+                } else if ("contents".equals(field) && value.isScalarValue()) {
+                    body = parser.getValueAsString("");
+                } else {
+                    parser.skipChildren();
+                }
             }
 
-            writer.close();
-            System.out.println("sAll documents indexed to: " + outputFilePath);
+            Document doc = new Document();
+            // Add ID properly
+            doc.add(new StringField("id", id, Field.Store.YES)); // Stored and indexed
+            doc.add(new BinaryDocValuesField("id", new BytesRef(id))); // Required for Pyserini
+
+            doc.add(new Field("contents", body, CONTENTS_TYPE)); // Pyserini reads "contents"
+            return doc;
         }
     }
+
+    private static void usage() {
+        System.err.println("Usage: java IndexBuilder <input_json_path> <output_index_path> (optional) <custom_stopword_list_file_path>"
+                + " [--threads N] [--ram-buffer-mb MB] [--force-merge SEGMENTS] [--batch-size N] [--progress-every N]"
+                + " Remember to specify absolute paths!");
+        System.exit(1);
+    }
+
     public static void main(String[] args) {
-        if (args.length > 3 || args.length < 2) {
-            System.err.println("Usage: java IndexBuilder <input_json_path> <output_index_path> (optional) <custom_stopword_list_file_path> Remember to specify absolute paths!");
-            System.exit(1);
+        Options options = new Options();
+        List<String> positional = new ArrayList<>();
+        try {
+            for (int i = 0; i < args.length; i++) {
+                switch (args[i]) {
+                    case "--threads" -> options.threads = Integer.parseInt(args[++i]);
+                    case "--ram-buffer-mb" -> options.ramBufferMB = Double.parseDouble(args[++i]);
+                    case "--force-merge" -> options.forceMergeSegments = Integer.parseInt(args[++i]);
+                    case "--batch-size" -> options.batchSize = Integer.parseInt(args[++i]);
+                    case "--progress-every" -> options.progressEvery = Long.parseLong(args[++i]);
+                    default -> positional.add(args[i]);
+                }
+            }
+        } catch (ArrayIndexOutOfBoundsException | NumberFormatException e) {
+            usage();
+        }
+        if (positional.size() > 3 || positional.size() < 2 || options.threads < 1 || options.batchSize < 1
+                || options.progressEvery < 1) {
+            usage();
         }
 
-        String inputDataPath = args[0];
-        String outputIndexPath = args[1];
+        String inputDataPath = positional.get(0);
+        String outputIndexPath = positional.get(1);
 
         // Check input data path
         if (!Files.exists(Paths.get(inputDataPath))) {
@@ -111,15 +257,15 @@ public class IndexBuilder {
 
         // Check output data path, try to create if it does not exist
         if (!Files.exists(Paths.get(outputIndexPath))) {
-            if(new File(outputIndexPath).mkdirs()){
+            if(!new File(outputIndexPath).mkdirs()){
                 System.err.println("Output index path does not exist AND couldn't be created! " + outputIndexPath);
             }
         }
 
         // Check custom stopwords file (if specified)
         String stopWordListPath = null;
-        if (args.length == 3){
-            stopWordListPath = args[2];
+        if (positional.size() == 3){
+            stopWordListPath = positional.get(2);
             if (!Files.exists(Paths.get(stopWordListPath))){
                 System.err.println("File with custom stopword list does not exist: " + inputDataPath + ". The in-built list will be used.");
                 System.exit(1);
@@ -128,12 +274,13 @@ public class IndexBuilder {
 
         // Now the indexing part
         try{
-            FrenchJsonLuceneIndexer.buildIndex(inputDataPath, outputIndexPath, stopWordListPath);
+            FrenchJsonLuceneIndexer.buildIndex(inputDataPath, outputIndexPath, stopWordListPath, options);
             System.out.println("Index built successfully!");
         }
         catch(Exception e) {
             System.err.println("Error building index: " + e.getMessage());
+            System.exit(1);
         }
 
     }
-}
\ No newline at end of file
+}
@@ -0,0 +1,706 @@
+"""
+Offline benchmark suite for the LongEval pipeline.
+
+Generates a synthetic collection (see `scripts/synthetic_collection.py`) and
+times every pipeline stage on it: indexing, BM25 search, document loading
+for the rerankers, evaluation and reranking with tiny randomly
+initialised models. Nothing is downloaded.
+
+Each stage runs in a fresh (spawned) interpreter by default, so peak RSS and
+import costs are attributed to the stage that caused them. Stages whose
+dependencies are missing (pyserini, torch, cohere, ...) are reported as
+"skipped" instead of failing the whole run.
+
+Results are written as JSON (default: bench_results/benchmark_<commit>.json);
+pass `--compare <old.json>` to flag regressions against an earlier commit.
+
+    python scripts/benchmark.py --scale small
+    python scripts/benchmark.py --scale small --compare bench_results/benchmark_83340ec.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from scripts.instrumentation import peak_rss_mb
+
+SCALES = {
+    "tiny":   {"num_docs": 1000,   "num_queries": 50,   "doc_length": 80},
+    "small":  {"num_docs": 10000,  "num_queries": 200,  "doc_length": 120},
+    "medium": {"num_docs": 100000, "num_queries": 1000, "doc_length": 150},
+    "large":  {"num_docs": 500000, "num_queries": 5000, "doc_length": 150},
+}
+LAG6, LAG8 = "2022-11", "2023-01"
+TOP_K = 25
+REFERENCE_PAIRS = 200      # monoT5: pairs also scored with generate() (reference)
+PARITY_TOLERANCE = 1e-4    # monoT5: max |single-step score - generate() score|, larger fails the stage
+DEDUP_EVERY = 4            # rerank:dedup: every n-th query is repeated under a new qid (case/whitespace variant)
+
+
+# --------------------------------------------------------------------------- #
+# Measurement                                                                 #
+# --------------------------------------------------------------------------- #
+class Measure:
+    """
+    Context manager timing the measured region of a stage.
+
+    Setup work done before entering (imports, model construction, loading
+    inputs) is not part of `wall_s` / `cpu_s`; `rss_peak_delta_mb` is how much
+    the process peak RSS grew inside the region.
+    """
+
+    def __init__(self, unit: str = "items"):
+        self.unit = unit
+        self.items = 0
+        self.extra: Dict[str, float] = {}
+
+    def __enter__(self):
+        self._rss_before = peak_rss_mb()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_s = time.perf_counter() - self._wall
+        self.cpu_s = time.process_time() - self._cpu
+        self.rss_peak_mb = peak_rss_mb()
+        self.rss_peak_delta_mb = (self.rss_peak_mb - self._rss_before
+                                  if self.rss_peak_mb is not None and self._rss_before is not None else None)
+        return False
+
+    def as_dict(self) -> Dict:
+        result = {
+            "wall_s": round(self.wall_s, 4),
+            "cpu_s": round(self.cpu_s, 4),
+            "rss_peak_mb": round(self.rss_peak_mb, 1) if self.rss_peak_mb is not None else None,
+            "rss_peak_delta_mb": round(self.rss_peak_delta_mb, 1) if self.rss_peak_delta_mb is not None else None,
+            "items": self.items,
+            "unit": self.unit,
+            "throughput": round(self.items / self.wall_s, 2) if self.wall_s > 0 else None,
+        }
+        result.update(self.extra)
+        return result
+
+
+# --------------------------------------------------------------------------- #
+# Helpers shared by stages                                                    #
+# --------------------------------------------------------------------------- #
+def read_run(path: str, k: int = TOP_K) -> Dict[str, List[str]]:
+    run: Dict[str, List[str]] = {}
+    with open(path) as f:
+        for line in f:
+            qid, _, docid, *_ = line.split()
+            docs = run.setdefault(qid, [])
+            if len(docs) < k:
+                docs.append(docid)
+    return run
+
+
+def read_queries(path: str) -> Dict[str, str]:
+    mapping, qid = {}, None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("<num>"):
+                qid = line.replace("<num>", "").replace("</num>", "").replace("Number:", "").strip()
+            elif line.startswith("<title>"):
+                mapping[qid] = line.replace("<title>", "").strip()
+    return mapping
+
+
+def write_candidate_run(qrels_file: str, num_docs: int, path: str, k: int = TOP_K, seed: int = 42) -> None:
+    """
+    Fallback run (judged docs padded with random docs) used by the rerank
+    stages when no BM25 run could be produced (e.g. pyserini not installed).
+    """
+    rng = random.Random(seed)
+    judged: Dict[str, List[str]] = {}
+    with open(qrels_file) as f:
+        for line in f:
+            qid, _, docid, _ = line.split()
+            judged.setdefault(qid, []).append(docid)
+    with open(path, "w") as f:
+        for qid, docs in judged.items():
+            docs = list(dict.fromkeys(docs))[:k]
+            while len(docs) < min(k, num_docs):
+                candidate = str(rng.randrange(num_docs))
+                if candidate not in docs:
+                    docs.append(candidate)
+            for rank, docid in enumerate(docs, 1):
+                f.write(f"{qid} Q0 doc{docid} {rank} {1.0 / rank:.4f} candidates\n")
+
+
+def corpus_texts(ctx: Dict) -> List[str]:
+    """Queries and document texts of the synthetic collection (tokenizer training data)."""
+    from systems.dense_retrieval.dense_retrieval import iter_json_docs
+
+    return list(read_queries(ctx["queries"]).values()) + [t for _, t in iter_json_docs(ctx["json_dir"])]
+
+
+def tiny_tokenizer(texts: List[str], vocab_size: int = 8000, append_eos: bool = False, keep: List[str] = ()):
+    """
+    Word-level fast tokenizer trained on `texts`, normally corpus_texts() (no download).
+    Words in `keep` are added if they did not make it into the vocabulary.
+    """
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    tok = Tokenizer(models.WordLevel(unk_token="[UNK]"))
+    tok.pre_tokenizer = pre_tokenizers.Whitespace()
+    trainer = trainers.WordLevelTrainer(vocab_size=vocab_size,
+                                        special_tokens=["[PAD]", "[UNK]", "[CLS]", "[SEP]", "</s>"])
+    tok.train_from_iterator(texts, trainer)
+    tok.add_tokens([word for word in keep if tok.token_to_id(word) is None])
+    if append_eos:
+        # T5-style: every sequence ends with </s>
+        tok.post_processor = processors.TemplateProcessing(
+            single="$A </s>", special_tokens=[("</s>", tok.token_to_id("</s>"))])
+    return PreTrainedTokenizerFast(tokenizer_object=tok, pad_token="[PAD]", unk_token="[UNK]",
+                                   cls_token="[CLS]", sep_token="[SEP]", eos_token="</s>")
+
+
+def rerank_inputs(ctx: Dict):
+    from scripts.docstore import DocStore
+
+    run = read_run(ctx["rerank_run"])
+    needed = {d for docs in run.values() for d in docs}
+    docs = DocStore.from_trec(Path(ctx["trec_dir"]), needed)
+    queries = read_queries(ctx["queries"])
+    return run, docs, queries
+
+
+def rerank_batches(ctx: Dict) -> List:
+    """[(query, [document texts])] of the candidate run."""
+    run, docs, queries = rerank_inputs(ctx)
+    return [(queries[qid], [docs[d] for d in docids if d in docs])
+            for qid, docids in run.items() if qid in queries]
+
+
+def time_rerank(ctx: Dict, name: str, score: Callable) -> Measure:
+    """Time `score(query, texts, trace)` over all candidate lists of the run."""
+    from scripts.instrumentation import Instrumentation
+
+    batches = rerank_batches(ctx)
+    trace = Instrumentation(f"benchmark:{name}")
+    with Measure(unit="pairs") as m:
+        for query, texts in batches:
+            if texts:
+                score(query, texts, trace)
+                m.items += len(texts)
+    trace.close()
+    m.extra["padding_ratio"] = trace.summary().get("padding_ratio")
+    for stage_name, stage in trace.stages.items():
+        m.extra[f"{stage_name}_s"] = round(stage["wall_s"], 4)
+    return m
+
+
+# --------------------------------------------------------------------------- #
+# Stages                                                                      #
+# --------------------------------------------------------------------------- #
+def stage_index(ctx: Dict) -> Measure:
+    import importlib.util
+    from scripts.build_index import build_index
+
+    if importlib.util.find_spec("pyserini") is None:
+        raise ModuleNotFoundError("No module named 'pyserini'", name="pyserini")
+    with Measure(unit="docs") as m:
+        build_index(ctx["json_dir"], ctx["index_dir"], threads=ctx["threads"])
+        m.items = ctx["num_docs"]
+    return m
+
+
+def stage_index_java(ctx: Dict) -> Measure:
+    """Custom IndexBuilder (FrenchAnalyzer, thread pool) into a separate index."""
+    import shutil
+    from scripts.build_index import JAR_PATH, build_index
+
+    jar = str(PROJECT_ROOT / JAR_PATH)
+    if not Path(jar).exists() or shutil.which("java") is None:
+        raise ModuleNotFoundError("IndexBuilderApp jar or java not found", name="IndexBuilderApp")
+    with Measure(unit="docs") as m:
+        stats = build_index(ctx["json_dir"], str(Path(ctx["workdir"]) / "index_java"), threads=ctx["threads"],
+                            backend="java", jar=jar)
+        m.items = stats["docs"] or ctx["num_docs"]
+    return m
+
+
+def stage_bm25(ctx: Dict) -> Measure:
+    from systems.bm25_baseline.bm25_baseline import BM25Baseline
+
+    if not Path(ctx["index_dir"]).exists():
+        raise FileNotFoundError(f"no index at {ctx['index_dir']} (index stage did not run)")
+    bm25 = BM25Baseline(ctx["index_dir"], ctx["queries"], ctx["bm25_run"])
+    with Measure(unit="queries") as m:
+        bm25.run_search(k1=0.9, b=0.4, top_k=TOP_K)
+        m.items = ctx["num_queries"]
+    return m
+
+
+def stage_bm25_rm3(ctx: Dict) -> Measure:
+    from systems.bm25_baseline.rm3 import BM25RM3
+
+    if not Path(ctx["index_dir"]).exists():
+        raise FileNotFoundError(f"no index at {ctx['index_dir']} (index stage did not run)")
+    rm3 = BM25RM3(ctx["index_dir"], ctx["queries"], ctx["rm3_run"])
+    with Measure(unit="queries") as m:
+        # second weight reuses the cached feedback terms
+        for weight in (0.5, 0.7):
+            rm3.run_search(k1=0.9, b=0.4, top_k=TOP_K, original_query_weight=weight, threads=ctx["threads"])
+        m.items = 2 * ctx["num_queries"]
+    return m
+
+
+def _stage_load_docs(ctx: Dict, load: Callable) -> Measure:
+    import tracemalloc
+
+    run = read_run(ctx["rerank_run"])
+    needed = {d for docs in run.values() for d in docs}
+    with Measure(unit="docs") as m:
+        store = load(Path(ctx["trec_dir"]), needed)
+        for d in needed:
+            store.get(d)
+        m.items = len(needed)
+    # Second pass under tracemalloc (too slow to time): Python heap held by the store
+    del store
+    tracemalloc.start()
+    store = load(Path(ctx["trec_dir"]), needed)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    m.extra["py_retained_mb"] = round(retained / 2**20, 2)
+    m.extra["py_peak_mb"] = round(peak / 2**20, 2)
+    return m
+
+
+def stage_load_docs_docstore(ctx: Dict) -> Measure:
+    from scripts.docstore import DocStore
+    return _stage_load_docs(ctx, DocStore.from_trec)
+
+
+def stage_load_docs_lazy(ctx: Dict) -> Measure:
+    from scripts.docstore import LazyDocStore
+    return _stage_load_docs(ctx, LazyDocStore.from_trec)
+
+
+def stage_evaluate(ctx: Dict) -> Measure:
+    from scripts.evaluate import evaluate
+
+    with Measure(unit="queries") as m:
+        evaluate(ctx["qrels_lag6"], ctx["rerank_run"], ctx["eval_out"])
+        m.items = len(read_run(ctx["rerank_run"]))
+    return m
+
+
+def stage_fuse_sweep(ctx: Dict) -> Measure:
+    """Interpolation sweep (2 norms × 2 depths × weight grid of 3 systems) over the candidate run."""
+    from scripts.evaluate import load_qrels
+    from scripts.fuse_scores import ScoreTable, sweep
+
+    # two noisy "rerankers" of the candidate run: relevance + gaussian noise
+    rng = random.Random(0)
+    qrels = load_qrels(ctx["qrels_lag6"])
+    paths = [str(Path(ctx["workdir"]) / "runs" / f"run_fuse_{name}.txt") for name in ("a", "b")]
+    for path, noise in zip(paths, (1.0, 2.0)):
+        with open(ctx["rerank_run"]) as fin, open(path, "w") as fout:
+            for line in fin:
+                qid, _, docid, *_ = line.split()
+                rel = qrels.get(qid, {}).get(docid[3:] if docid.startswith("doc") else docid, 0)
+                fout.write(f"{qid} Q0 {docid} 0 {rel + rng.gauss(0, noise):.4f} noisy\n")
+
+    with Measure(unit="configs") as m:
+        table = ScoreTable(ctx["rerank_run"], paths)
+        results = sweep(table, qrels, ["minmax", "zscore"], [0, 10], 0.02)
+        m.items = len(results)
+    m.extra["best_ndcg"] = round(max(r["ndcg"] for r in results), 4)
+    return m
+
+
+def stage_rerank_luyu_hf(ctx: Dict) -> Measure:
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification
+    import systems.neural.rerank_luyu_hf as module
+
+    torch.manual_seed(0)
+    tok = tiny_tokenizer(corpus_texts(ctx))
+    config = BertConfig(vocab_size=len(tok), hidden_size=64, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=128, num_labels=2)
+    model = BertForSequenceClassification(config).to(module.DEVICE).eval()
+    return time_rerank(ctx, "rerank_luyu_hf",
+                       lambda query, texts, trace: module.rerank(model, tok, query, texts, trace=trace))
+
+
+def stage_rerank_dedup(ctx: Dict) -> Measure:
+    """rerank:luyu_hf through RerankPlan ('basic'), with near-duplicate queries under new qids."""
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification
+    from scripts.instrumentation import Instrumentation
+    from scripts.rerank_plan import RerankPlan
+    import systems.neural.rerank_luyu_hf as module
+
+    torch.manual_seed(0)
+    run, docs, queries = rerank_inputs(ctx)
+    for qid in list(run)[::DEDUP_EVERY]:
+        if qid in queries:
+            queries[f"{qid}-dup"] = "  " + queries[qid].upper()
+            run[f"{qid}-dup"] = run[qid]
+    tok = tiny_tokenizer(corpus_texts(ctx))
+    config = BertConfig(vocab_size=len(tok), hidden_size=64, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=128, num_labels=2)
+    model = BertForSequenceClassification(config).to(module.DEVICE).eval()
+
+    trace = Instrumentation("benchmark:rerank_dedup")
+    with Measure(unit="pairs") as m:
+        plan = RerankPlan(run, queries, available=docs, mode="basic")
+
+        def score_jobs(jobs):
+            return module.score_pairs(model, tok, [(q, docs[d]) for q, d in jobs], trace)
+
+        for qid, docids in run.items():
+            docids = [d for d in docids if d in docs]
+            if qid in queries and docids:
+                plan.resolve([(qid, docids)], score_jobs)
+                m.items += len(docids)
+    trace.close()
+    m.extra.update({"dedup_ratio": round(plan.ratio, 2), "pairs_scored": plan.scored,
+                    "forward_passes_saved": plan.saved})
+    return m
+
+
+def stage_rerank_monot5(ctx: Dict) -> Measure:
+    import numpy as np
+    import torch
+    from transformers import T5Config, T5ForConditionalGeneration
+    from systems.neural.monot5 import MonoT5Scorer, generate_scores
+
+    torch.manual_seed(0)
+    # the prompt words and the answer tokens must be in the word-level vocabulary
+    tok = tiny_tokenizer(corpus_texts(ctx), append_eos=True, keep=["Query", "Document", "Relevant", ":", "true", "false"])
+    config = T5Config(vocab_size=len(tok), d_model=64, d_ff=128, d_kv=32, num_layers=2,
+                      num_heads=2, pad_token_id=tok.pad_token_id, eos_token_id=tok.eos_token_id,
+                      decoder_start_token_id=tok.pad_token_id)
+    model = T5ForConditionalGeneration(config).eval()
+    scorer = MonoT5Scorer(model, tok, batch_size=64, max_length=256)
+    m = time_rerank(ctx, "rerank_monoT5", scorer.score)
+
+    # Reference: generate() with full-vocabulary scores on a subset of the pairs
+    pairs = [(query, text) for query, docs in rerank_batches(ctx) for text in docs][:REFERENCE_PAIRS]
+    start = time.perf_counter()
+    reference = np.array(generate_scores(model, tok, pairs, batch_size=16, max_length=256))
+    reference_s = time.perf_counter() - start
+    start = time.perf_counter()
+    fast = np.array(scorer.score_pairs(pairs))
+    fast_s = time.perf_counter() - start
+    m.extra["reference_pairs_per_s"] = round(len(pairs) / reference_s, 1)
+    m.extra["speedup_vs_generate"] = round(reference_s / fast_s, 2)
+    m.extra["max_abs_diff"] = float(np.abs(fast - reference).max())
+    if not m.extra["max_abs_diff"] <= PARITY_TOLERANCE:
+        raise RuntimeError(f"monoT5 single-step scores differ from generate() by {m.extra['max_abs_diff']:.2e} "
+                           f"(tolerance {PARITY_TOLERANCE:.0e})")
+    return m
+
+
+def stage_server_rerank(ctx: Dict) -> Measure:
+    import threading
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification
+    from scripts.instrumentation import NO_TRACE
+    from scripts.load_generator import build_payloads, run_load
+    from scripts.server import LongEvalServer, RerankBackend
+    import systems.neural.rerank_luyu_hf as module
+
+    torch.manual_seed(0)
+    run, docs, queries = rerank_inputs(ctx)
+    tok = tiny_tokenizer(corpus_texts(ctx))
+    config = BertConfig(vocab_size=len(tok), hidden_size=64, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=128, num_labels=2)
+    model = BertForSequenceClassification(config).to(module.DEVICE).eval()
+    payloads = build_payloads("rerank", queries, TOP_K, run)
+
+    server = LongEvalServer(("127.0.0.1", 0), rerank=RerankBackend(model, tok, docs, NO_TRACE),
+                            max_batch=16, window_ms=5.0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        run_load(server.url, "rerank", payloads, num_requests=min(len(payloads), 16), concurrency=4)  # warm-up
+        with Measure(unit="requests") as m:
+            result = run_load(server.url, "rerank", payloads, num_requests=2 * len(payloads), concurrency=16)
+            m.items = result["requests"] - result["errors"]
+        batches = server.batchers["rerank"].stats.snapshot()
+    finally:
+        server.shutdown()
+        server.server_close()
+    m.extra.update({"p50_ms": result["p50_ms"], "p99_ms": result["p99_ms"],
+                    "errors": result["errors"], "mean_batch": batches["mean_batch"]})
+    return m
+
+
+def stage_cli_startup(ctx: Dict) -> Measure:
+    """`longeval.py <command> --help` per command (best of 3) plus the import time of the command's module."""
+    modules = {
+        "index": "scripts.build_index", "search": "scripts.search",
+        "optimize": "systems.bm25_baseline.optimize", "rerank": "systems.neural.rerank_luyu_hf",
+        "evaluate": "scripts.evaluate", "compare": "scripts.compare_eval",
+        "experiments": "scripts.experiments", "fuse": "scripts.fuse_scores",
+    }
+
+    def best_of(cmd: List[str], n: int = 3) -> float:
+        times = []
+        for _ in range(n):
+            start = time.perf_counter()
+            subprocess.run(cmd, cwd=PROJECT_ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    with Measure(unit="commands") as m:
+        for command, module in modules.items():
+            m.extra[f"help_{command}_s"] = round(best_of([sys.executable, "longeval.py", command, "--help"]), 3)
+            try:
+                m.extra[f"import_{command}_s"] = round(best_of([sys.executable, "-c", f"import {module}"], n=1), 3)
+            except subprocess.CalledProcessError:
+                m.extra[f"import_{command}_s"] = None       # optional dependency missing
+            m.items += 1
+    return m
+
+
+def tiny_encoder(ctx: Dict):
+    """Randomly initialised 2-layer BERT encoder (deterministic across stages)."""
+    import torch
+    from transformers import BertConfig, BertModel
+    from systems.dense_retrieval.dense_retrieval import Encoder
+
+    torch.manual_seed(0)
+    tok = tiny_tokenizer(corpus_texts(ctx))
+    config = BertConfig(vocab_size=len(tok), hidden_size=64, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=128)
+    return Encoder(BertModel(config).eval(), tok, batch_size=64, max_length=128, name="tiny-random-bert")
+
+
+def stage_dense_encode(ctx: Dict) -> Measure:
+    import shutil
+    from systems.dense_retrieval.dense_retrieval import DenseIndex
+
+    encoder = tiny_encoder(ctx)
+    shutil.rmtree(ctx["dense_dir"], ignore_errors=True)
+    with Measure(unit="docs") as m:
+        DenseIndex(ctx["dense_dir"]).encode_corpus(ctx["json_dir"], encoder, shard_size=max(1000, ctx["num_docs"] // 4))
+        m.items = ctx["num_docs"]
+    return m
+
+
+def _stage_dense_search(ctx: Dict, ivf: bool) -> Measure:
+    import numpy as np
+    from systems.dense_retrieval.dense_retrieval import DenseIndex
+
+    index = DenseIndex(ctx["dense_dir"])
+    if not (index.index_dir / "embeddings.npy").exists():
+        raise FileNotFoundError(f"no dense index at {ctx['dense_dir']} (dense:encode did not run)")
+    queries = tiny_encoder(ctx).encode(list(read_queries(ctx["queries"]).values()))
+    if ivf:
+        index.build_ivf(n_lists=max(4, int(ctx["num_docs"] ** 0.5)))
+    exact = index.search(queries, TOP_K)[1]
+    with Measure(unit="queries") as m:
+        rows = index.search_ivf(queries, TOP_K, nprobe=8)[1] if ivf else index.search(queries, TOP_K)[1]
+        m.items = len(queries)
+    m.extra["recall_vs_exact"] = round(float(np.mean(
+        [len(set(a) & set(b)) / len(b) for a, b in zip(rows, exact)])), 4) if ivf else 1.0
+    return m
+
+
+def stage_dense_search(ctx: Dict) -> Measure:
+    return _stage_dense_search(ctx, ivf=False)
+
+
+def stage_dense_search_ivf(ctx: Dict) -> Measure:
+    return _stage_dense_search(ctx, ivf=True)
+
+
+STAGES: Dict[str, Callable[[Dict], Measure]] = {
+    "cli:startup": stage_cli_startup,
+    "index": stage_index,
+    "index:java": stage_index_java,
+    "bm25": stage_bm25,
+    "bm25:rm3": stage_bm25_rm3,
+    "load_docs:docstore": stage_load_docs_docstore,
+    "load_docs:lazy": stage_load_docs_lazy,
+    "evaluate": stage_evaluate,
+    "fuse:sweep": stage_fuse_sweep,
+    "rerank:luyu_hf": stage_rerank_luyu_hf,
+    "rerank:monoT5": stage_rerank_monot5,
+    "rerank:dedup": stage_rerank_dedup,
+    "server:rerank": stage_server_rerank,
+    "dense:encode": stage_dense_encode,
+    "dense:search": stage_dense_search,
+    "dense:search_ivf": stage_dense_search_ivf,
+}
+
+
+# --------------------------------------------------------------------------- #
+# Runner                                                                      #
+# --------------------------------------------------------------------------- #
+def run_stage(name: str, ctx: Dict) -> Dict:
+    """Run one stage and turn its outcome into a JSON-serialisable record."""
+    os.chdir(ctx["workdir"])     # stages write relative files (eval_results/ ...) here
+    try:
+        result = {"stage": name, "status": "ok"}
+        result.update(STAGES[name](ctx).as_dict())
+    except ImportError as e:
+        result = {"stage": name, "status": "skipped", "reason": f"missing dependency: {e.name or e}"}
+    except Exception as e:
+        result = {"stage": name, "status": "failed", "reason": f"{type(e).__name__}: {e}"}
+    return result
+
+
+def run_isolated(name: str, ctx: Dict) -> Dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        try:
+            return pool.submit(run_stage, name, ctx).result()
+        except BrokenProcessPool as e:
+            # the child died without a result (JVM abort, OOM kill, segfault): record it like any failed stage
+            return {"stage": name, "status": "failed", "reason": f"stage process died: {e}"}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: Dict, previous: Dict, baseline_file: str, tolerance: float) -> int:
+    """Print per-stage wall time ratios against a previous result."""
+    baseline = {s["stage"]: s for s in previous["stages"]}
+    regressions = 0
+    print(f"\nComparison against {baseline_file} (tolerance {tolerance:.0%}):")
+    for stage in current["stages"]:
+        old = baseline.get(stage["stage"])
+        if stage["status"] != "ok" or not old or old.get("status") != "ok":
+            continue
+        ratio = stage["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        print(f"  {stage['stage']:<20} {old['wall_s']:>9.3f}s -> {stage['wall_s']:>9.3f}s  (x{ratio:.2f}){flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the LongEval pipeline on a synthetic collection")
+    parser.add_argument("--scale", choices=SCALES, default="small", help="Preset collection size")
+    parser.add_argument("--num-docs", type=int, help="Override number of documents")
+    parser.add_argument("--num-queries", type=int, help="Override number of queries")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to run")
+    parser.add_argument("--workdir", help="Where to put the synthetic collection, index and runs (default: temp dir)")
+    parser.add_argument("--threads", type=int, default=2, help="Indexing threads")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the synthetic collection")
+    parser.add_argument("--no-isolate", action="store_true", help="Run all stages in this process")
+    parser.add_argument("--output", help="Result JSON (default: bench_results/benchmark_<commit>.json)")
+    parser.add_argument("--compare", help="Previous result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before flagging a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with 1 if a regression is found")
+    args = parser.parse_args(argv)
+
+    from scripts.synthetic_collection import generate_collection
+
+    # Read the baseline up front, --output may point to the same file
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    scale = dict(SCALES[args.scale])
+    if args.num_docs:
+        scale["num_docs"] = args.num_docs
+    if args.num_queries:
+        scale["num_queries"] = args.num_queries
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="longeval_bench_")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    gen_start = time.perf_counter()
+    paths = generate_collection(workdir / "data", seed=args.seed, snapshots=[LAG6, LAG8], **scale)
+    gen_wall = time.perf_counter() - gen_start
+
+    ctx = {
+        "workdir": str(workdir),
+        "num_docs": scale["num_docs"],
+        "num_queries": scale["num_queries"],
+        "threads": args.threads,
+        "queries": paths["queries"],
+        "json_dir": paths[f"json_{LAG6}"],
+        "trec_dir": paths[f"trec_{LAG6}"],
+        "qrels_lag6": paths[f"qrels_{LAG6}"],
+        "qrels_lag8": paths[f"qrels_{LAG8}"],
+        "index_dir": str(workdir / "index"),
+        "dense_dir": str(workdir / "index_dense"),
+        "bm25_run": str(workdir / "runs" / "run_bm25.txt"),
+        "rm3_run": str(workdir / "runs" / "run_bm25_rm3.txt"),
+        "candidate_run": str(workdir / "runs" / "run_candidates.txt"),
+        "eval_out": str(workdir / "eval_results" / "eval_bench.txt"),
+    }
+    (workdir / "runs").mkdir(exist_ok=True)
+    write_candidate_run(ctx["qrels_lag6"], scale["num_docs"], ctx["candidate_run"], seed=args.seed)
+
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = [{"stage": "generate", "status": "ok", "wall_s": round(gen_wall, 4),
+                "items": scale["num_docs"], "unit": "docs",
+                "throughput": round(scale["num_docs"] / gen_wall, 2)}]
+    cwd = os.getcwd()
+    for name in stages:
+        # Rerank stages use the real BM25 run once one exists, candidates otherwise
+        ctx["rerank_run"] = ctx["bm25_run"] if Path(ctx["bm25_run"]).exists() else ctx["candidate_run"]
+        print(f"⏱️  {name} ...")
+        result = run_stage(name, ctx) if args.no_isolate else run_isolated(name, ctx)
+        os.chdir(cwd)
+        results.append(result)
+        if result["status"] == "ok":
+            print(f"   {result['wall_s']:.3f}s, {result['throughput']} {result['unit']}/s, "
+                  f"peak RSS {result['rss_peak_mb']} MB")
+        else:
+            print(f"   {result['status']}: {result['reason']}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "scale": args.scale,
+            "isolated": not args.no_isolate,
+            "seed": args.seed,
+            **scale,
+        },
+        "stages": results,
+    }
+
+    output = Path(args.output or PROJECT_ROOT / "bench_results" / f"benchmark_{report['meta']['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"✅ Benchmark results written to {output}")
+
+    if previous is not None:
+        regressions = compare(report, previous, args.compare, args.tolerance)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,135 @@
+import argparse
 import os
+import re
 import subprocess
+import sys
+import time
 import yaml
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yml')
 
-with open(config_path, 'r') as f:
-    config = yaml.safe_load(f)
-
-# Get paths from config
+# Default corpus location (dev subset, Lag6 JSON documents)
 CORPUS_DIR = "data/lag6_lag8_subset/French/LongEval Train Collection/Json/2022-11_fr"
 
-INDEX_DIR = config['bm25']['index_dir']
+# Custom Java builder (FrenchAnalyzer), built with `mvn package` in scripts/IndexBuilderApp
+JAR_PATH = "scripts/IndexBuilderApp/target/IndexBuilderApp-1.2-jar-with-dependencies.jar"
+
+BACKENDS = ("pyserini", "java")
+
+# Analyzer language of the index per backend (None = Pyserini's default English analyzer).
+# Searching a java index needs `set_language('fr')`, otherwise queries are not stemmed like the documents.
+INDEX_LANGUAGE = {"pyserini": None, "java": "fr"}
+
+# "Total 1,234 documents indexed in ..." (Anserini and IndexBuilder)
+DOCS_INDEXED = re.compile(r"Total ([\d,]+) documents indexed")
+
+
+def pyserini_command(corpus_dir, index_dir, threads):
+    command = [
+        sys.executable, '-m', 'pyserini.index.lucene',
+        '--collection', 'JsonCollection',
+        '--input', corpus_dir,
+        '--index', index_dir,
+        '--generator', 'DefaultLuceneDocumentGenerator',
+        '--threads', str(threads),
+        '--storePositions',
+        '--storeDocvectors',
+        '--storeRaw'
+    ]
+    return command
+
+
+def java_command(corpus_dir, index_dir, threads, ram_buffer_mb=None, force_merge=0, stopwords=None,
+                 jar=JAR_PATH, java="java"):
+    # relative jar paths (config.yml) are relative to the project root, not to the current directory
+    jar = os.path.join(PROJECT_ROOT, jar)
+    if not os.path.exists(jar):
+        raise FileNotFoundError(f"{jar} not found, build it with `mvn package` in scripts/IndexBuilderApp")
+    ram_buffer_mb = ram_buffer_mb or 1024
+    # the RAM buffer is shared by all indexing threads and must fit into the heap
+    heap_mb = int(ram_buffer_mb * 1.5) + 1024
+    command = [java, f'-Xmx{heap_mb}m', '-jar', jar, os.path.abspath(corpus_dir), os.path.abspath(index_dir)]
+    if stopwords:
+        command.append(os.path.abspath(stopwords))
+    command += ['--threads', str(threads), '--ram-buffer-mb', str(ram_buffer_mb)]
+    if force_merge:
+        command += ['--force-merge', str(force_merge)]
+    return command
+
+
+def build_index(corpus_dir, index_dir, threads=2, backend="pyserini", ram_buffer_mb=None, force_merge=0,
+                stopwords=None, jar=JAR_PATH, java="java"):
+    """
+    Build a Lucene index with Pyserini (StandardAnalyzer) or the custom Java
+    IndexBuilder (FrenchAnalyzer). Returns {backend, docs, wall_s, docs_per_s}.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r} (one of {', '.join(BACKENDS)})")
+    # Create output directory if needed
+    os.makedirs(index_dir, exist_ok=True)
+
+    # Build the command
+    if backend == "java":
+        command = java_command(corpus_dir, index_dir, threads, ram_buffer_mb, force_merge, stopwords, jar, java)
+    else:
+        # RAM buffer and forceMerge are java-only; Pyserini keeps its own defaults
+        if force_merge:
+            print("⚠️ --force-merge is only supported by the java backend, ignored")
+        command = pyserini_command(corpus_dir, index_dir, threads)
+
+    print(f"🔨 Start indexing ({backend}, {threads} threads)...")
+
+    # Execute the command, pass the output through and pick up the document count
+    start = time.perf_counter()
+    docs = None
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as process:
+        for line in process.stdout:
+            sys.stdout.write(line)
+            match = DOCS_INDEXED.search(line)
+            if match:
+                docs = int(match.group(1).replace(',', ''))
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        print("❌ Error during indexing:")
+        error = subprocess.CalledProcessError(process.returncode, command)
+        print(error)
+        raise error
 
-# Create output directory if needed
-os.makedirs(INDEX_DIR, exist_ok=True)
+    stats = {"backend": backend, "docs": docs, "wall_s": round(wall, 2),
+             "docs_per_s": round(docs / wall, 1) if docs else None}
+    rate = f"{docs:,} docs, {stats['docs_per_s']:,} docs/s" if docs else "document count not reported"
+    print(f"✅ Index successfully created at: {index_dir} ({wall:.1f}s, {rate})")
+    return stats
 
-# Build the command
-command = [
-    'python', '-m', 'pyserini.index.lucene',
-    '--collection', 'JsonCollection',
-    '--input', CORPUS_DIR,
-    '--index', INDEX_DIR,
-    '--generator', 'DefaultLuceneDocumentGenerator',
-    '--threads', '2',
-    '--storePositions',
-    '--storeDocvectors',
-    '--storeRaw'
-]
 
-print("🔨 Start indexing...")
+def main(argv=None):
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    builder = config.get('index_builder', {})
 
-# Execute the command
-try:
-    subprocess.run(command, check=True)
-    print(f"✅ Index successfully created at: {INDEX_DIR}")
-except subprocess.CalledProcessError as e:
-    print("❌ Error during indexing:")
-    print(e)
+    parser = argparse.ArgumentParser(description="Build the Lucene index (Pyserini or custom Java IndexBuilder)")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="JSON documents")
+    parser.add_argument("--index", default=config['bm25']['index_dir'])
+    parser.add_argument("--backend", choices=BACKENDS, default=builder.get('backend', 'pyserini'))
+    parser.add_argument("--threads", type=int, default=builder.get('threads', 2))
+    parser.add_argument("--ram-buffer-mb", type=int, default=builder.get('ram_buffer_mb'),
+                        help="java: IndexWriter RAM buffer (default 1024)")
+    parser.add_argument("--force-merge", type=int, default=builder.get('force_merge', 0),
+                        help="java: forceMerge to n segments at the end (0 = off)")
+    parser.add_argument("--stopwords", default=builder.get('stopwords'), help="java: custom stopword list")
+    parser.add_argument("--jar", default=builder.get('jar', JAR_PATH))
+    parser.add_argument("--java", default=builder.get('java', 'java'), help="Java executable")
+    args = parser.parse_args(argv)
 
+    try:
+        build_index(args.corpus, args.index, args.threads, args.backend, args.ram_buffer_mb, args.force_merge,
+                    args.stopwords, args.jar, args.java)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        if isinstance(e, FileNotFoundError):
+            print(f"❌ {e}")
+        sys.exit(1)
 
 
+if __name__ == "__main__":
+    main()
@@ -10,15 +10,10 @@ def extract_avg_ndcg(filepath):
                     return float(match.group(1))
     raise ValueError(f"No average nDCG@10 found in {filepath}")
 
-def main():
-    parser = argparse.ArgumentParser(description="Compare Lag6 and Lag8 nDCG@10 and compute relative drop")
-    parser.add_argument('--lag6', required=True, help='Path to eval file for Lag6')
-    parser.add_argument('--lag8', required=True, help='Path to eval file for Lag8')
-    parser.add_argument('--output', default='eval_results/eval_bm25_drop.txt', help='Output file for drop result')
-    args = parser.parse_args()
-
-    ndcg6 = extract_avg_ndcg(args.lag6)
-    ndcg8 = extract_avg_ndcg(args.lag8)
+def compare_lags(lag6_file, lag8_file, output_path=None):
+    """Relative nDCG@10 drop between two evaluate.py result files."""
+    ndcg6 = extract_avg_ndcg(lag6_file)
+    ndcg8 = extract_avg_ndcg(lag8_file)
 
     if ndcg6 == 0:
         drop = float('inf')
@@ -32,8 +27,19 @@ def main():
     )
 
     print(result)
-    with open(args.output, 'w') as f:
-        f.write(result)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(result)
+    return drop
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare Lag6 and Lag8 nDCG@10 and compute relative drop")
+    parser.add_argument('--lag6', required=True, help='Path to eval file for Lag6')
+    parser.add_argument('--lag8', required=True, help='Path to eval file for Lag8')
+    parser.add_argument('--output', default='eval_results/eval_bm25_drop.txt', help='Output file for drop result')
+    args = parser.parse_args(argv)
+
+    compare_lags(args.lag6, args.lag8, args.output)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,236 @@
+"""
+Compact document stores for reranking.
+
+LongEval document ids come as "doc123" (collection, BM25Baseline runs) or
+"123" (scripts/search.py runs, qrels). `normalize_docid` maps both to the
+integer 123, so every store is keyed once by int instead of twice by string.
+
+* DocStore      - all needed texts in one UTF-8 buffer plus an offset array;
+                  ids are kept in a sorted int64 array and looked up by bisection.
+* TrecOffsetIndex / LazyDocStore
+                - only (file, byte offset, length) per document is kept in memory;
+                  texts are read on demand through a size-bounded LRU cache.
+
+Both behave like a read-only `Dict[docid, str]` (`store[d]`, `d in store`,
+`store.get(d)`, `len(store)`) and accept either id form.
+"""
+import re
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from tqdm import tqdm
+
+DocId = Union[str, int]
+
+DOC_START = re.compile(r"<DOC>")
+DOC_END = re.compile(r"</DOC>")
+DOCNO = re.compile(r"<DOCNO>(.*?)</DOCNO>", re.I)
+
+
+def normalize_docid(docid: DocId) -> int:
+    """'doc123', '123' and 123 -> 123 (only the exact "doc" prefix is removed)."""
+    if isinstance(docid, int):
+        return docid
+    plain = docid.strip()
+    if plain.startswith("doc"):
+        plain = plain[3:]
+    try:
+        return int(plain)
+    except ValueError:
+        raise ValueError(f"Unsupported document id: {docid!r} (expected 'doc<digits>' or '<digits>')") from None
+
+
+def iter_trec_docs(directory: Path, desc: str = "📖 reading .trec") -> Iterator[Tuple[str, str]]:
+    """Yield (docid, text) for every <DOC> in the *.trec files below `directory`."""
+    for fp in tqdm(sorted(Path(directory).rglob("*.trec")), desc=desc):
+        with fp.open(encoding="utf-8") as f:
+            in_doc, buf, did = False, [], None
+            for ln in f:
+                if DOC_START.match(ln):
+                    in_doc, buf, did = True, [], None
+                    continue
+                if in_doc and DOC_END.match(ln):
+                    in_doc = False
+                    if did:
+                        yield did, " ".join(buf)
+                    continue
+                if in_doc:
+                    if did is None and (m := DOCNO.search(ln)):
+                        did = m.group(1).strip()
+                    else:
+                        buf.append(ln.strip())
+
+
+class DocStore:
+    """Append-only text store: one UTF-8 buffer, int64 offsets, sorted int ids."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._offsets = array("q", [0])     # text i = buf[offsets[i]:offsets[i + 1]]
+        self._ids = array("q")              # insertion order
+        self._sorted_ids = array("q")
+        self._sorted_slots = array("q")
+        self._dirty = False
+
+    @classmethod
+    def from_trec(cls, directory: Path, needed: Iterable[DocId]) -> "DocStore":
+        """Load the texts of all `needed` ids from the *.trec files below `directory`."""
+        wanted: Set[int] = {normalize_docid(d) for d in needed}
+        store = cls()
+        for did, text in iter_trec_docs(directory):
+            key = normalize_docid(did)
+            if key in wanted:
+                store.add(key, text)
+                wanted.discard(key)
+                if not wanted:
+                    break
+        print(f"✅ loaded {len(store)} documents | missing: {len(wanted)} | {store.nbytes / 2**20:.1f} MB")
+        return store
+
+    def add(self, docid: DocId, text: str) -> None:
+        self._buf += text.encode("utf-8")
+        self._offsets.append(len(self._buf))
+        self._ids.append(normalize_docid(docid))
+        self._dirty = True
+
+    def _slot(self, docid: DocId) -> int:
+        if self._dirty:
+            order = sorted(range(len(self._ids)), key=self._ids.__getitem__)
+            self._sorted_ids = array("q", (self._ids[i] for i in order))
+            self._sorted_slots = array("q", order)
+            self._dirty = False
+        key = normalize_docid(docid)
+        i = bisect_left(self._sorted_ids, key)
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == key:
+            return self._sorted_slots[i]
+        return -1
+
+    def __getitem__(self, docid: DocId) -> str:
+        slot = self._slot(docid)
+        if slot < 0:
+            raise KeyError(docid)
+        return self._buf[self._offsets[slot]:self._offsets[slot + 1]].decode("utf-8")
+
+    def __contains__(self, docid: DocId) -> bool:
+        try:
+            return self._slot(docid) >= 0
+        except ValueError:
+            return False
+
+    def get(self, docid: DocId, default: Optional[str] = None) -> Optional[str]:
+        return self[docid] if docid in self else default
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the store (buffer + index arrays)."""
+        arrays = (self._offsets, self._ids, self._sorted_ids, self._sorted_slots)
+        return len(self._buf) + sum(a.itemsize * len(a) for a in arrays)
+
+
+class TrecOffsetIndex:
+    """docid -> (file, byte offset, byte length) of its <DOC> block, for on-demand reads."""
+
+    def __init__(self, files: List[Path], ids: array, file_nos: array, offsets: array, lengths: array):
+        self.files = files
+        self.ids, self.file_nos, self.offsets, self.lengths = ids, file_nos, offsets, lengths
+
+    @classmethod
+    def build(cls, directory: Path, needed: Optional[Iterable[DocId]] = None) -> "TrecOffsetIndex":
+        """Scan the *.trec files once; restrict the index to `needed` if given."""
+        wanted = {normalize_docid(d) for d in needed} if needed is not None else None
+        files = sorted(Path(directory).rglob("*.trec"))
+        entries: List[Tuple[int, int, int, int]] = []
+        docno = re.compile(rb"<DOCNO>(.*?)</DOCNO>", re.I)
+        for file_no, fp in enumerate(tqdm(files, desc="📇 indexing .trec offsets")):
+            with fp.open("rb") as f:
+                pos, start, did = 0, None, None
+                for ln in f:
+                    if ln.startswith(b"<DOC>"):
+                        start, did = pos, None
+                    elif start is not None and did is None and (m := docno.search(ln)):
+                        did = normalize_docid(m.group(1).decode("utf-8"))
+                    pos += len(ln)
+                    if ln.startswith(b"</DOC>") and start is not None:
+                        if did is not None and (wanted is None or did in wanted):
+                            entries.append((did, file_no, start, pos - start))
+                        start = None
+        entries.sort()
+        return cls(files,
+                   array("q", (e[0] for e in entries)), array("l", (e[1] for e in entries)),
+                   array("q", (e[2] for e in entries)), array("q", (e[3] for e in entries)))
+
+    def locate(self, docid: DocId) -> Optional[Tuple[Path, int, int]]:
+        key = normalize_docid(docid)
+        i = bisect_left(self.ids, key)
+        if i < len(self.ids) and self.ids[i] == key:
+            return self.files[self.file_nos[i]], self.offsets[i], self.lengths[i]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class LazyDocStore:
+    """Reads documents on demand via a TrecOffsetIndex, caching up to `max_bytes` of UTF-8 text (LRU)."""
+
+    def __init__(self, index: TrecOffsetIndex, max_bytes: int = 256 * 2**20):
+        self.index = index
+        self.max_bytes = max_bytes
+        self._cache: "OrderedDict[int, Tuple[str, int]]" = OrderedDict()     # key -> (text, UTF-8 bytes)
+        self._cached_bytes = 0
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_trec(cls, directory: Path, needed: Optional[Iterable[DocId]] = None,
+                  max_bytes: int = 256 * 2**20) -> "LazyDocStore":
+        return cls(TrecOffsetIndex.build(directory, needed), max_bytes)
+
+    def _read(self, path: Path, offset: int, length: int) -> str:
+        with path.open("rb") as f:
+            f.seek(offset)
+            block = f.read(length).decode("utf-8")
+        buf, seen_docno = [], False
+        for ln in block.splitlines()[1:-1]:         # drop <DOC> / </DOC>
+            if not seen_docno and DOCNO.search(ln):
+                seen_docno = True
+            else:
+                buf.append(ln.strip())
+        return " ".join(buf)
+
+    def __getitem__(self, docid: DocId) -> str:
+        key = normalize_docid(docid)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+        location = self.index.locate(key)
+        if location is None:
+            raise KeyError(docid)
+        self.misses += 1
+        text = self._read(*location)
+        size = len(text.encode("utf-8"))       # accented French text: up to 2 bytes per character
+        self._cache[key] = (text, size)
+        self._cached_bytes += size
+        while self._cached_bytes > self.max_bytes and len(self._cache) > 1:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted
+        return text
+
+    def __contains__(self, docid: DocId) -> bool:
+        try:
+            return self.index.locate(docid) is not None
+        except ValueError:
+            return False
+
+    def get(self, docid: DocId, default: Optional[str] = None) -> Optional[str]:
+        return self[docid] if docid in self else default
+
+    def __len__(self) -> int:
+        return len(self.index)
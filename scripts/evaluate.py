@@ -1,7 +1,14 @@
 import argparse
+import os
+import sys
 import pytrec_eval
 from pathlib import Path
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.instrumentation import Instrumentation
+
 def load_qrels(qrels_file):
     qrels = {}
     with open(qrels_file, 'r') as f:
@@ -21,21 +28,29 @@ def load_run(run_file):
     return run
 
 def evaluate(qrels_file, run_file, output_path=None):
-    qrels_data = load_qrels(qrels_file)
-    run_data = load_run(run_file)
+    trace = Instrumentation("evaluate", qrels=str(qrels_file), run=str(run_file))
+    with trace.stage("qrels_load"):
+        qrels_data = load_qrels(qrels_file)
+    with trace.stage("run_load"):
+        run_data = load_run(run_file)
 
     # Filter to matching queries only
     common_qids = set(qrels_data.keys()) & set(run_data.keys())
+    trace.count("queries_qrels", len(qrels_data))
+    trace.count("queries_run", len(run_data))
+    trace.count("queries_evaluated", len(common_qids))
     if not common_qids:
         print("Warning: No matching queries between Qrels and Runfile! Skipping evaluation.")
+        trace.close()
         return
     qrels_data = {qid: qrels_data[qid] for qid in common_qids}
     run_data = {qid: run_data[qid] for qid in common_qids}
     print(f"✅ Evaluating {len(common_qids)} matching queries")
 
     # Evaluate
-    evaluator = pytrec_eval.RelevanceEvaluator(qrels_data, {'ndcg_cut.10'})
-    results = evaluator.evaluate(run_data)
+    with trace.stage("evaluate"):
+        evaluator = pytrec_eval.RelevanceEvaluator(qrels_data, {'ndcg_cut.10'})
+        results = evaluator.evaluate(run_data)
 
     # Prepare output path
     if output_path is None:
@@ -48,19 +63,23 @@ def evaluate(qrels_file, run_file, output_path=None):
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
     # Write results
-    with open(output_path, "w") as fout:
+    with trace.stage("write"), open(output_path, "w") as fout:
         for qid, metric_values in results.items():
             fout.write(f'{qid}: nDCG@10 = {metric_values["ndcg_cut_10"]:.4f}\n')
         avg_ndcg = sum(m["ndcg_cut_10"] for m in results.values()) / len(results)
         fout.write(f'\nAverage nDCG@10 = {avg_ndcg:.4f}\n')
 
+    trace.close()
     print(f"Evaluation results saved to {output_path}")
 
-if __name__ == "__main__":
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Evaluate run file against qrels using nDCG@10")
     parser.add_argument("--qrels", required=True, help="Path to Qrels-file (TREC-Format)")
     parser.add_argument("--run", required=True, help="Path to Run-file (TREC-Format)")
     parser.add_argument("--output", required=True, help="Optional path to output file")
 
-    args = parser.parse_args()
-    evaluate(args.qrels, args.run, args.output)
\ No newline at end of file
+    args = parser.parse_args(argv)
+    evaluate(args.qrels, args.run, args.output)
+
+if __name__ == "__main__":
+    main()
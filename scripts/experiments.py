@@ -0,0 +1,533 @@
+"""
+Declarative experiment runner.
+
+Reads a YAML matrix (systems × lags × parameters, see scripts/experiments.yml)
+and builds a dependency graph of nodes
+
+    index → bm25 / rm3 run → rerank → eval → drop
+
+Identical nodes are shared: e.g. one index for all lags with the same corpus,
+one BM25 run for every reranker that uses the same first stage and queries.
+
+* Independent nodes run in parallel, each in its own process, as long as the
+  sum of their `cpus` / `memory_gb` stays inside the budget. A node started
+  with n cpus gets OMP/MKL threads = n.
+* Every node has a hash over its kind, parameters, source code, input files
+  (size + mtime) and the hashes of its upstream nodes. A node whose hash and
+  output are unchanged since an earlier run is skipped.
+* stdout/stderr of every node go to <workdir>/logs/<node>.log.
+
+At the end <workdir>/report.md lists nDCG@10 per lag and the relative drop
+for every system variant.
+
+    python scripts/experiments.py --dry-run
+    python scripts/experiments.py --matrix scripts/experiments.yml --max-cpus 8
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.build_index import INDEX_LANGUAGE, JAR_PATH
+from systems.neural.rerankers import RERANKERS
+
+MATRIX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'experiments.yml')
+
+
+# Source files whose content is part of a node's hash
+CODE = {
+    "index": ["scripts/build_index.py"],
+    "bm25": ["systems/bm25_baseline/bm25_baseline.py"],
+    "rm3": ["systems/bm25_baseline/bm25_baseline.py", "systems/bm25_baseline/rm3.py"],
+    "rerank": ["scripts/docstore.py", "scripts/rerank_plan.py"],
+    "eval": ["scripts/evaluate.py"],
+    "drop": ["scripts/compare_eval.py"],
+}
+RERANK_CODE = {"monoT5": ["systems/neural/monot5.py"]}
+JAVA_INDEX_CODE = ["scripts/IndexBuilderApp/src/main/java/org/air2025/IndexBuilder.java"]
+
+DEFAULT_RESOURCES = {
+    "index": {"cpus": 4, "memory_gb": 4},
+    "bm25": {"cpus": 1, "memory_gb": 2},
+    "rm3": {"cpus": 4, "memory_gb": 3},
+    "rerank": {"cpus": 4, "memory_gb": 6},
+    "eval": {"cpus": 1, "memory_gb": 1},
+    "drop": {"cpus": 1, "memory_gb": 0.5},
+}
+
+STATE_FILE = "experiments_state.json"
+
+
+# --------------------------------------------------------------------------- #
+# Hashing                                                                     #
+# --------------------------------------------------------------------------- #
+def digest(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def path_fingerprint(path: str) -> List:
+    """(relative path, size, mtime) of a file or of every file below a directory."""
+    p = Path(path)
+    if p.is_file():
+        stat = p.stat()
+        return [[p.name, stat.st_size, stat.st_mtime_ns]]
+    if not p.is_dir():
+        return [["missing", str(path)]]
+    entries = []
+    for root, dirs, files in os.walk(p):
+        dirs.sort()
+        for name in sorted(files):
+            full = Path(root) / name
+            stat = full.stat()
+            entries.append([str(full.relative_to(p)), stat.st_size, stat.st_mtime_ns])
+    return entries
+
+
+def code_fingerprint(files: List[str]) -> Dict[str, str]:
+    result = {}
+    for rel in files:
+        path = Path(PROJECT_ROOT) / rel
+        result[rel] = hashlib.sha256(path.read_bytes()).hexdigest() if path.exists() else "missing"
+    return result
+
+
+# --------------------------------------------------------------------------- #
+# Graph                                                                       #
+# --------------------------------------------------------------------------- #
+class Node:
+    """One step of the graph; `inputs` maps names to files or to upstream nodes."""
+
+    def __init__(self, kind: str, label: str, params: Dict, inputs: Dict, resources: Dict):
+        self.kind = kind
+        self.params = params
+        self.inputs = inputs
+        self.cpus = max(1, int(resources.get("cpus", 1)))
+        self.memory_gb = float(resources.get("memory_gb", 1))
+        self.key = digest([kind, params, {name: (v.key if isinstance(v, Node) else v) for name, v in inputs.items()}])
+        self.id = f"{label}-{self.key[:6]}"
+        self.output: Optional[str] = None
+        self.hash: Optional[str] = None
+        self.lock: Optional[str] = None      # nodes with the same lock never run at the same time
+
+    @property
+    def deps(self) -> List["Node"]:
+        return [v for v in self.inputs.values() if isinstance(v, Node)]
+
+    def resolved_inputs(self) -> Dict[str, str]:
+        return {name: (v.output if isinstance(v, Node) else v) for name, v in self.inputs.items()}
+
+    def compute_hash(self) -> str:
+        code = list(CODE[self.kind])
+        if self.kind == "rerank":
+            model = self.params["model"]
+            code += [RERANKERS[model].replace(".", "/") + ".py"] + RERANK_CODE.get(model, [])
+        if self.kind == "index" and self.params.get("backend") == "java":
+            code += JAVA_INDEX_CODE
+        content = {
+            "kind": self.kind,
+            "params": self.params,
+            "code": code_fingerprint(code),
+            "inputs": {name: (v.hash if isinstance(v, Node) else path_fingerprint(v))
+                       for name, v in sorted(self.inputs.items())},
+        }
+        if self.kind == "index" and self.params.get("backend") == "java":
+            # a rebuilt jar changes the index even if the Python side is unchanged
+            content["jar"] = path_fingerprint(os.path.join(PROJECT_ROOT, self.params.get("jar") or JAR_PATH))
+        self.hash = digest(content)
+        return self.hash
+
+
+def slug(text: str) -> str:
+    return "".join(c if c.isalnum() or c in "._=-" else "_" for c in text)
+
+
+def expand(system: Dict) -> List[Dict]:
+    """Cartesian product over all list values of a system: [(swept values, sections)]."""
+    axes = [(section, key, values) for section, params in system.items()
+            for key, values in (params or {}).items() if isinstance(values, list)]
+    variants = []
+    for combo in itertools.product(*[values for _, _, values in axes]):
+        sections = {section: dict(params or {}) for section, params in system.items()}
+        swept = {}
+        for (section, key, _), value in zip(axes, combo):
+            sections[section][key] = value
+            swept[key] = value
+        variants.append({"swept": swept, "sections": sections})
+    return variants
+
+
+class Graph:
+    def __init__(self, matrix: Dict, workdir: Path):
+        self.workdir = workdir
+        self.nodes: Dict[str, Node] = {}          # key → node, in creation (= topological) order
+        self.resources = {kind: dict(DEFAULT_RESOURCES[kind], **(matrix.get("resources") or {}).get(kind, {}))
+                          for kind in DEFAULT_RESOURCES}
+        self.lags = matrix["lags"]
+        self.index_builder = matrix.get("index_builder") or {}     # backend, ram_buffer_mb, force_merge, ...
+        self.variants: List[Dict] = []            # one entry per system variant (report rows)
+        for name, system in matrix["systems"].items():
+            for variant in expand(system):
+                self._add_variant(name, variant)
+
+    def _add(self, kind: str, label: str, params: Dict, inputs: Dict, output: str) -> Node:
+        node = Node(kind, slug(label), params, inputs, self.resources[kind])
+        if node.key in self.nodes:
+            return self.nodes[node.key]
+        node.output = str(self.workdir / output.format(id=node.id))
+        self.nodes[node.key] = node
+        return node
+
+    def _add_variant(self, name: str, variant: Dict) -> None:
+        sections, swept = variant["sections"], variant["swept"]
+        label = name + "".join(f"_{k}={v}" for k, v in swept.items())
+        bm25 = dict({"k1": 0.9, "b": 0.4, "top_k": 25}, **sections.get("bm25", {}))
+        first_stage = f"k1={bm25['k1']}_b={bm25['b']}"
+        row = {"system": name, "params": swept, "label": label, "eval": {}, "drop": {}}
+
+        for lag, spec in self.lags.items():
+            if "runs" in sections:
+                # existing first-stage run per lag (e.g. runs/run_dense.txt)
+                run = sections["runs"][lag]
+                stage_label = Path(run).stem
+            else:
+                if spec.get("index"):
+                    index = spec["index"]
+                    language = spec.get("language")
+                else:
+                    index = self._add("index", f"index_{Path(spec['corpus']).name}",
+                                      dict(self.index_builder, threads=self.resources["index"]["cpus"]),
+                                      {"corpus": spec["corpus"]}, "index/{id}")
+                    language = INDEX_LANGUAGE[self.index_builder.get("backend", "pyserini")]
+                # queries must go through the analyzer of the index (FrenchAnalyzer for java)
+                search = dict(bm25, language=language) if language else bm25
+                if "rm3" in sections:
+                    rm3 = dict(sections["rm3"])
+                    run = self._add("rm3", f"rm3_{first_stage}_w={rm3.get('original_query_weight')}",
+                                    dict(search, **rm3, threads=self.resources["rm3"]["cpus"]),
+                                    {"index": index, "queries": spec["queries"]}, "runs/{id}.txt")
+                    # the feedback cache is shared by all RM3 runs of one index / k1 / b
+                    cache_key = digest([index.key if isinstance(index, Node) else index, bm25["k1"], bm25["b"]])[:8]
+                    run.lock = str(self.workdir / "cache" / f"rm3_feedback_{cache_key}.json")
+                else:
+                    run = self._add("bm25", f"bm25_{first_stage}", search,
+                                    {"index": index, "queries": spec["queries"]}, "runs/{id}.txt")
+                stage_label = run.id.rsplit("-", 1)[0]
+
+            if "rerank" in sections:
+                rerank = dict({"top_k": bm25["top_k"]}, **sections["rerank"])
+                if rerank["model"] not in RERANKERS:
+                    raise ValueError(f"{name}: unknown reranker {rerank['model']!r} (one of {', '.join(RERANKERS)})")
+                run = self._add("rerank", f"rerank_{rerank['model']}_{stage_label}", rerank,
+                                {"run": run, "documents": spec["documents"], "queries": spec["queries"]},
+                                "runs/{id}.txt")
+
+            row["eval"][lag] = self._add("eval", f"eval_{label}_{lag}", {},
+                                         {"run": run, "qrels": spec["qrels"]}, "eval_results/{id}.txt")
+
+        lags = list(self.lags)
+        for lag in lags[1:]:
+            row["drop"][lag] = self._add("drop", f"drop_{label}_{lags[0]}_{lag}", {},
+                                         {"reference": row["eval"][lags[0]], "other": row["eval"][lag]},
+                                         "eval_results/{id}.txt")
+        self.variants.append(row)
+
+
+# --------------------------------------------------------------------------- #
+# Node execution (runs in a fresh worker process)                             #
+# --------------------------------------------------------------------------- #
+def node_index(params: Dict, inputs: Dict, output: str) -> None:
+    from scripts.build_index import build_index
+    build_index(inputs["corpus"], output, **params)
+
+
+def node_bm25(params: Dict, inputs: Dict, output: str) -> None:
+    from systems.bm25_baseline.bm25_baseline import BM25Baseline
+    BM25Baseline(inputs["index"], inputs["queries"], output, language=params.get("language")).run_search(
+        k1=params["k1"], b=params["b"], top_k=params["top_k"])
+
+
+def node_rm3(params: Dict, inputs: Dict, output: str) -> None:
+    from systems.bm25_baseline.rm3 import BM25RM3
+    rm3 = BM25RM3(inputs["index"], inputs["queries"], output, cache_file=inputs.get("cache"),
+                  language=params.get("language"))
+    rm3.run_search(k1=params["k1"], b=params["b"], top_k=params["top_k"],
+                   fb_docs=params.get("fb_docs", 10), fb_terms=params.get("fb_terms", 10),
+                   original_query_weight=params.get("original_query_weight", 0.5),
+                   threads=params.get("threads", 4))
+
+
+def node_rerank(params: Dict, inputs: Dict, output: str) -> None:
+    import importlib
+
+    module = importlib.import_module(RERANKERS[params["model"]])
+    kwargs = {"model_name": params["model_name"]} if params.get("model_name") else {}
+    if params.get("dedup"):
+        kwargs["dedup"] = params["dedup"]
+    module.rerank_run(Path(inputs["run"]), Path(inputs["documents"]), Path(inputs["queries"]), Path(output),
+                      top_k=params["top_k"], **kwargs)
+
+
+def node_eval(params: Dict, inputs: Dict, output: str) -> None:
+    from scripts.evaluate import evaluate
+    evaluate(inputs["qrels"], inputs["run"], output)
+
+
+def node_drop(params: Dict, inputs: Dict, output: str) -> None:
+    from scripts.compare_eval import compare_lags
+    compare_lags(inputs["reference"], inputs["other"], output)
+
+
+NODE_KINDS = {
+    "index": node_index,
+    "bm25": node_bm25,
+    "rm3": node_rm3,
+    "rerank": node_rerank,
+    "eval": node_eval,
+    "drop": node_drop,
+}
+
+
+def run_node(kind: str, params: Dict, inputs: Dict, output: str, cpus: int, log_file: str) -> Dict:
+    """Worker entry point: thread limits, log redirection, peak RSS."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(cpus)
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    # fd level, so subprocesses (pyserini indexer, JVM) are captured too
+    log_fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+
+    from scripts.instrumentation import peak_rss_mb
+
+    start = time.perf_counter()
+    NODE_KINDS[kind](params, inputs, output)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if not os.path.exists(output):
+        raise RuntimeError(f"{kind} wrote no output (see {log_file})")
+    return {"wall_s": round(time.perf_counter() - start, 3), "peak_rss_mb": round(peak_rss_mb() or 0, 1)}
+
+
+# --------------------------------------------------------------------------- #
+# Scheduler                                                                   #
+# --------------------------------------------------------------------------- #
+def load_state(path: Path) -> Dict:
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(path: Path, state: Dict) -> None:
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_cached(node: Node, state: Dict) -> bool:
+    record = state.get(node.id)
+    return bool(record and record.get("hash") == node.hash and os.path.exists(node.output)
+                and record.get("output") == path_fingerprint(node.output))
+
+
+def default_budget() -> Dict:
+    try:
+        memory_gb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30 * 0.75
+    except (ValueError, OSError, AttributeError):
+        memory_gb = 8.0
+    return {"cpus": os.cpu_count() or 1, "memory_gb": round(memory_gb, 1)}
+
+
+def critical_path(nodes: List[Node], state: Dict) -> Dict[str, float]:
+    """Estimated seconds from the start of a node to the end of its longest downstream chain."""
+    children: Dict[str, List[Node]] = {n.id: [] for n in nodes}
+    for n in nodes:
+        for d in n.deps:
+            children[d.id].append(n)
+    length: Dict[str, float] = {}
+    for n in reversed(nodes):                     # nodes are in topological order
+        own = state.get(n.id, {}).get("wall_s", 1.0)
+        length[n.id] = own + max((length[c.id] for c in children[n.id]), default=0.0)
+    return length
+
+
+def schedule(graph: Graph, budget: Dict, state: Dict, state_path: Path, force: bool = False) -> Dict[str, str]:
+    """Run all nodes that are not cached; returns {node id: cached|ok|failed|blocked}."""
+    nodes = list(graph.nodes.values())
+    status: Dict[str, str] = {}
+    for node in nodes:                            # upstream hashes first
+        node.compute_hash()
+        if not force and is_cached(node, state):
+            status[node.id] = "cached"
+
+    pending = [n for n in nodes if n.id not in status]
+    priority = critical_path(nodes, state)
+    running: Dict = {}
+    used = {"cpus": 0, "memory_gb": 0.0}
+    locks = set()
+    log_dir = graph.workdir / "logs"
+
+    def memory_of(node: Node) -> float:
+        observed = state.get(node.id, {}).get("peak_rss_mb", 0) / 1024
+        return max(node.memory_gb, observed)
+
+    context = multiprocessing.get_context("spawn")
+    try:
+        while pending or running:
+            for node in list(pending):
+                if any(status.get(d.id) in ("failed", "blocked") for d in node.deps):
+                    status[node.id] = "blocked"
+                    pending.remove(node)
+                    print(f"⚠️  {node.id}: blocked by a failed upstream node")
+
+            ready = [n for n in pending if all(status.get(d.id) in ("cached", "ok") for d in n.deps)]
+            ready.sort(key=lambda n: -priority[n.id])
+            for node in ready:
+                cpus, memory = min(node.cpus, budget["cpus"]), memory_of(node)
+                fits = (used["cpus"] + cpus <= budget["cpus"] and used["memory_gb"] + memory <= budget["memory_gb"])
+                # a node larger than the whole budget still runs, alone
+                if node.lock in locks or not (fits or not running):
+                    continue
+                inputs = node.resolved_inputs()
+                if node.kind == "rm3":
+                    inputs["cache"] = node.lock      # written by the node itself, not part of the hash
+                # one fresh worker process per node (no state left over from earlier nodes)
+                pool = ProcessPoolExecutor(max_workers=1, mp_context=context)
+                future = pool.submit(run_node, node.kind, node.params, inputs, node.output,
+                                     cpus, str(log_dir / f"{node.id}.log"))
+                running[future] = (node, cpus, memory, pool)
+                used["cpus"] += cpus
+                used["memory_gb"] += memory
+                if node.lock:
+                    locks.add(node.lock)
+                pending.remove(node)
+                print(f"⏳ {node.id} ({cpus} cpus, {memory:.1f} GB) | running {len(running)}")
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node, cpus, memory, pool = running.pop(future)
+                pool.shutdown()
+                used["cpus"] -= cpus
+                used["memory_gb"] -= memory
+                locks.discard(node.lock)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    status[node.id] = "failed"
+                    print(f"❌ {node.id}: {type(e).__name__}: {e} (log: {log_dir / f'{node.id}.log'})")
+                    continue
+                status[node.id] = "ok"
+                state[node.id] = dict(result, hash=node.hash, output=path_fingerprint(node.output),
+                                      finished=time.strftime("%Y-%m-%dT%H:%M:%S"))
+                save_state(state_path, state)
+                print(f"✅ {node.id}: {result['wall_s']:.1f}s, peak RSS {result['peak_rss_mb']} MB")
+    finally:
+        for *_, pool in running.values():         # interrupted: do not leave workers behind
+            pool.shutdown(wait=False, cancel_futures=True)
+    return status
+
+
+# --------------------------------------------------------------------------- #
+# Report                                                                      #
+# --------------------------------------------------------------------------- #
+def write_report(graph: Graph, path: Path) -> None:
+    from scripts.compare_eval import extract_avg_ndcg
+
+    lags = list(graph.lags)
+    header = ["System", "Parameters"] + [f"{lag} nDCG@10" for lag in lags] + [f"Drop {lags[0]}→{lag}" for lag in lags[1:]]
+    lines = ["| " + " | ".join(header) + " |", "|" + "--|" * len(header)]
+    rows = []
+    for row in graph.variants:
+        ndcg = {}
+        for lag, node in row["eval"].items():
+            try:
+                ndcg[lag] = extract_avg_ndcg(node.output)
+            except (OSError, ValueError):
+                ndcg[lag] = None
+        cells = [row["system"], ", ".join(f"{k}={v}" for k, v in row["params"].items()) or "-"]
+        cells += [f"{ndcg[lag]:.4f}" if ndcg[lag] is not None else "-" for lag in lags]
+        for lag in lags[1:]:
+            if ndcg[lags[0]] and ndcg[lag] is not None:
+                cells.append(f"{(ndcg[lags[0]] - ndcg[lag]) / ndcg[lags[0]]:.2%}")
+            else:
+                cells.append("-")
+        rows.append((ndcg[lags[0]] or -1.0, cells))
+    # best system (reference lag) first
+    for _, cells in sorted(rows, key=lambda r: -r[0]):
+        lines.append("| " + " | ".join(cells) + " |")
+    path.write_text("\n".join(lines) + "\n")
+    print(f"✅ Report written to {path}")
+
+
+def run_experiments(matrix_path: str = MATRIX_PATH, workdir: Optional[str] = None, max_cpus: Optional[int] = None,
+                    max_memory_gb: Optional[float] = None, dry_run: bool = False, force: bool = False) -> Dict[str, str]:
+    with open(matrix_path, 'r') as f:
+        matrix = yaml.safe_load(f)
+    workdir = Path(workdir or matrix.get("workdir", "./experiments")).resolve()
+    graph = Graph(matrix, workdir)
+
+    budget = dict(default_budget(), **(matrix.get("budget") or {}))
+    if max_cpus:
+        budget["cpus"] = max_cpus
+    if max_memory_gb:
+        budget["memory_gb"] = max_memory_gb
+
+    state_path = workdir / STATE_FILE
+    state = load_state(state_path)
+    nodes = list(graph.nodes.values())
+    print(f"🗂️  {len(graph.variants)} system variants × {len(graph.lags)} lags → {len(nodes)} nodes "
+          f"| budget {budget['cpus']} cpus, {budget['memory_gb']} GB")
+
+    if dry_run:
+        for node in nodes:
+            node.compute_hash()
+            mark = "cached" if not force and is_cached(node, state) else "run"
+            deps = ", ".join(d.id for d in node.deps) or "-"
+            print(f"  {mark:<7} {node.id:<60} {node.cpus} cpus {node.memory_gb:>4} GB  ← {deps}")
+        return {}
+
+    (workdir / "cache").mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    status = schedule(graph, budget, state, state_path, force)
+    counts = {s: sum(1 for v in status.values() if v == s) for s in ("ok", "cached", "failed", "blocked")}
+    print(f"🏁 {len(status)} nodes in {time.perf_counter() - start:.1f}s | run {counts['ok']} | "
+          f"cached {counts['cached']} | failed {counts['failed']} | blocked {counts['blocked']}")
+    write_report(graph, workdir / "report.md")
+    return status
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run a matrix of systems × lags × parameters")
+    parser.add_argument("--matrix", default=MATRIX_PATH, help="Experiment matrix (YAML)")
+    parser.add_argument("--workdir", help="Artifacts, logs and cache state (default: `workdir` of the matrix)")
+    parser.add_argument("--max-cpus", type=int, help="CPU budget for all running nodes")
+    parser.add_argument("--max-memory-gb", type=float, help="Memory budget for all running nodes")
+    parser.add_argument("--dry-run", action="store_true", help="Print the graph and what would run")
+    parser.add_argument("--force", action="store_true", help="Ignore the cache, run every node")
+    args = parser.parse_args(argv)
+
+    status = run_experiments(args.matrix, args.workdir, args.max_cpus, args.max_memory_gb, args.dry_run, args.force)
+    return 1 if any(s in ("failed", "blocked") for s in status.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
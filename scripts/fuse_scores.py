@@ -0,0 +1,327 @@
+"""
+Score interpolation tuner for BM25 + neural rerank runs.
+
+The BM25 run and one or more rerank runs (e.g. runs/run_neural_monoT5_2.txt)
+are aligned into per-query score arrays [system, query, doc]; the candidate
+list of a query is the BM25 list. For every configuration
+
+    normalisation (minmax / zscore / none, per query)
+    × rerank depth (only the BM25 top-d are fused, the rest follows in BM25 order; 0 = all)
+    × weights (grid on the simplex, step --step: α·BM25 + (1−α)·neural for one reranker)
+
+the fused ranking and nDCG@10 are computed with numpy against the Lag6
+qrels in memory (no run files, no pytrec_eval in the loop). Thousands of
+configurations take a few seconds. The best configuration is written as a
+fused run for every lag and re-checked with pytrec_eval.
+
+    python scripts/fuse_scores.py --bm25 runs/run_bm25.txt \
+        --rerank runs/run_neural_monoT5_2.txt runs/run_neural_luyu_opt_2.txt \
+        [--apply Lag8 runs/run_bm25_lag8.txt runs/run_monoT5_lag8.txt runs/run_luyu_lag8.txt]
+
+Ties are broken like trec_eval (docid descending), so the in-memory nDCG
+matches `scripts/evaluate.py` on the written run.
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+import warnings
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pytrec_eval
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.evaluate import load_qrels, load_run
+from scripts.instrumentation import Instrumentation
+
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yml')
+
+NORMS = ("minmax", "zscore", "none")
+
+# elements of the [configs, relevant documents, docs] block scored at once
+BLOCK_ELEMENTS = 20_000_000
+
+# discount of ranks 0..9, 0 from rank 10 on
+DISCOUNT = np.append(1.0 / np.log2(np.arange(2, 12)), 0.0)
+
+# score difference of a document outside the rerank depth (below every fused score)
+BELOW = -1e6
+
+
+class ScoreTable:
+    """
+    Scores of the BM25 run and the rerank runs of one lag, aligned to the BM25
+    candidates: scores [S, Q, D] (NaN = not scored by that system), valid [Q, D],
+    bm25_rank [Q, D]. Columns are sorted by docid descending (trec_eval tie order),
+    padding columns come last.
+    """
+
+    def __init__(self, bm25_run: str, rerank_runs: List[str]):
+        runs = [load_run(bm25_run)] + [load_run(path) for path in rerank_runs]
+        self.names = ["bm25"] + [os.path.splitext(os.path.basename(path))[0] for path in rerank_runs]
+        bm25 = runs[0]
+        self.qids = sorted(bm25, key=lambda q: (len(q), q))
+        depth = max(len(docs) for docs in bm25.values())
+
+        q, s = len(self.qids), len(runs)
+        self.docids: List[List[str]] = []
+        self.scores = np.full((s, q, depth), np.nan)
+        self.valid = np.zeros((q, depth), dtype=bool)
+        self.bm25_rank = np.full((q, depth), depth, dtype=np.int64)
+        for i, qid in enumerate(self.qids):
+            docs = bm25[qid]
+            ranked = sorted(docs, key=lambda d: (-docs[d], d))
+            rank = {d: r for r, d in enumerate(ranked)}
+            columns = sorted(docs, reverse=True)
+            self.docids.append(columns)
+            n = len(columns)
+            self.valid[i, :n] = True
+            self.bm25_rank[i, :n] = [rank[d] for d in columns]
+            for k, run in enumerate(runs):
+                scored = run.get(qid, {})
+                self.scores[k, i, :n] = [scored.get(d, np.nan) for d in columns]
+        self.coverage = (~np.isnan(self.scores)).sum(axis=(1, 2)) / max(self.valid.sum(), 1)
+
+    def relevant(self, qrels: Dict[str, Dict[str, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        Cells with a positive judgment: query rows, doc columns and gain / ideal DCG@10,
+        plus the number of evaluated (judged) queries. Only these cells contribute to nDCG.
+        """
+        rows, cols, weights = [], [], []
+        judged = 0
+        for i, qid in enumerate(self.qids):
+            if qid not in qrels:
+                continue
+            judged += 1
+            rels = qrels[qid]
+            ideal = sorted((r for r in rels.values() if r > 0), reverse=True)[:10]
+            idcg = sum(r / np.log2(k + 2) for k, r in enumerate(ideal))
+            for j, docid in enumerate(self.docids[i]):
+                if rels.get(docid, 0) > 0:
+                    rows.append(i)
+                    cols.append(j)
+                    weights.append(rels[docid] / idcg)
+        return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(weights), judged
+
+def normalize(table: ScoreTable, method: str, depth: int) -> np.ndarray:
+    """Per-query normalised scores [S, Q, D] of the BM25 top-`depth` (NaN elsewhere, missing = query minimum)."""
+    head = table.valid & (table.bm25_rank < depth if depth else True)
+    x = np.where(head, table.scores, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN rows
+        if method == "minmax":
+            lo = np.nanmin(x, axis=-1, keepdims=True)
+            hi = np.nanmax(x, axis=-1, keepdims=True)
+            x = (x - lo) / np.where(hi > lo, hi - lo, 1.0)
+        elif method == "zscore":
+            mean = np.nanmean(x, axis=-1, keepdims=True)
+            std = np.nanstd(x, axis=-1, keepdims=True)
+            x = (x - mean) / np.where(std > 0, std, 1.0)
+        elif method != "none":
+            raise ValueError(f"unknown normalisation {method!r} (one of {', '.join(NORMS)})")
+        fill = np.nanmin(x, axis=-1, keepdims=True)
+    fill = np.where(np.isnan(fill), 0.0, fill)
+    x = np.where(np.isnan(x) & head, fill, x)
+    return x
+
+
+def fuse(normalized: np.ndarray, valid: np.ndarray, bm25_rank: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Fused scores [C, Q, D]: weighted sum in the head, BM25 order below it, -inf for padding."""
+    head = ~np.isnan(normalized[0])
+    fused = np.einsum("cs,sqd->cqd", weights, np.nan_to_num(normalized))
+    tail = -1e12 - bm25_rank.astype(np.float64)
+    return np.where(head, fused, np.where(valid, tail, -np.inf))
+
+
+def ndcg10(weights: np.ndarray, diff: np.ndarray, earlier: np.ndarray, gains: np.ndarray) -> np.ndarray:
+    """
+    DCG@10 of the relevant head documents for a block of weight vectors [C, S].
+    diff [S, R, D] holds score(doc) − score(relevant doc) of the query of every
+    relevant cell; the rank of a relevant document is the number of documents
+    with a higher fused score plus the tied ones in an earlier column
+    (trec_eval order), so no sort is needed.
+    """
+    s, r, d = diff.shape
+    delta = (weights.astype(np.float32) @ diff.reshape(s, -1)).reshape(len(weights), r, d)
+    above = (delta > 0) | ((delta == 0) & earlier)
+    rank = above.sum(axis=-1, dtype=np.int32)
+    return DISCOUNT[np.minimum(rank, 10)] @ gains
+
+
+def weight_grid(systems: int, step: float) -> np.ndarray:
+    """All weight vectors with entries in multiples of `step` that sum to 1."""
+    n = int(round(1 / step))
+    grid = []
+    for bars in itertools.combinations(range(n + systems - 1), systems - 1):
+        edges = (-1,) + bars + (n + systems - 1,)
+        grid.append([edges[k + 1] - edges[k] - 1 for k in range(systems)])
+    return np.array(grid, dtype=np.float64)[::-1] / n
+
+
+def sweep(table: ScoreTable, qrels: Dict, norms: List[str], depths: List[int], step: float) -> List[Dict]:
+    """nDCG@10 of every (normalisation, depth, weights) configuration."""
+    rows, cols, gains, judged = table.relevant(qrels)
+    if not judged:
+        raise ValueError("no query of the BM25 run is judged in the qrels")
+    weights = weight_grid(len(table.names), step)
+    results = []
+    for method in norms:
+        for depth in depths:
+            normalized = normalize(table, method, depth)
+            # relevant documents below the depth keep their BM25 rank
+            rank = table.bm25_rank[rows, cols]
+            head = rank < depth if depth else np.ones(len(rows), dtype=bool)
+            tail_dcg = DISCOUNT[np.minimum(rank[~head], 10)] @ gains[~head]
+
+            n = normalized[:, rows[head]]
+            own = n[:, np.arange(head.sum()), cols[head]]
+            # documents outside the head stay below every head document (weights sum to 1)
+            diff = np.where(np.isnan(n), BELOW, n - own[..., None]).astype(np.float32)
+            earlier = np.arange(n.shape[-1]) < cols[head][:, None]
+
+            per_block = max(1, BLOCK_ELEMENTS // max(diff[0].size, 1))
+            for start in range(0, len(weights), per_block):
+                block = weights[start:start + per_block]
+                scores = (ndcg10(block, diff, earlier, gains[head]) + tail_dcg) / judged
+                results += [{"norm": method, "depth": depth, "weights": w, "ndcg": float(s)}
+                            for w, s in zip(block, scores)]
+    return results
+
+
+def describe(config: Dict, names: List[str]) -> str:
+    weights = " ".join(f"{name}={w:.2f}" for name, w in zip(names, config["weights"]))
+    return f"{config['norm']:<6} depth={config['depth'] or 'all':<4} {weights}"
+
+
+def write_fused_run(table: ScoreTable, config: Dict, path: str, run_id: str = "fused") -> Dict[str, Dict[str, float]]:
+    """TREC run of one configuration (all BM25 candidates); returns it as {qid: {docid: score}}."""
+    normalized = normalize(table, config["norm"], config["depth"])
+    fused = fuse(normalized, table.valid, table.bm25_rank, config["weights"][None])[0]
+    run: Dict[str, Dict[str, float]] = {}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for i, qid in enumerate(table.qids):
+            n = len(table.docids[i])
+            order = np.argsort(-fused[i, :n], kind="stable")
+            head = fused[i, :n][np.isfinite(fused[i, :n]) & (fused[i, :n] > -1e11)]
+            floor = head.min() if head.size else 0.0
+            run[qid] = {}
+            for rank, col in enumerate(order, start=1):
+                score = fused[i, col]
+                if score <= -1e11:      # below the rerank depth: keep the BM25 order under the head
+                    score = floor - 1.0 - (table.bm25_rank[i, col] / n)
+                run[qid][table.docids[i][col]] = float(score)
+                f.write(f"{qid} Q0 {table.docids[i][col]} {rank} {score:.6f} {run_id}\n")
+    return run
+
+
+def pytrec_ndcg(qrels: Dict, run: Dict) -> float:
+    common = set(qrels) & set(run)
+    evaluator = pytrec_eval.RelevanceEvaluator({q: qrels[q] for q in common}, {'ndcg_cut.10'})
+    results = evaluator.evaluate({q: run[q] for q in common})
+    return sum(m["ndcg_cut_10"] for m in results.values()) / len(results)
+
+
+def fuse_scores(bm25_run: str, rerank_runs: List[str], qrels_file: str, norms: List[str], depths: List[int],
+                step: float, output_dir: str, apply: Optional[Dict[str, List[str]]] = None,
+                lag8_qrels: Optional[str] = None, sweep_output: Optional[str] = None) -> Dict:
+    """
+    Tune on the Lag6 runs, write the best fused run per lag
+    (<output_dir>/run_fused_<lag>.txt) and return the best configuration.
+    """
+    trace = Instrumentation("fuse_scores", bm25=bm25_run, rerank=",".join(rerank_runs), step=step)
+    with trace.stage("load"):
+        table = ScoreTable(bm25_run, rerank_runs)
+        qrels = load_qrels(qrels_file)
+    print(f"✅ {len(table.qids)} queries × {table.valid.shape[1]} candidates, systems: {', '.join(table.names)}")
+    for name, coverage in zip(table.names[1:], table.coverage[1:]):
+        if coverage < 0.5:
+            print(f"⚠️ {name} scores only {coverage:.0%} of the BM25 candidates (missing = query minimum)")
+
+    start = time.perf_counter()
+    with trace.stage("sweep"):
+        results = sweep(table, qrels, norms, depths, step)
+    elapsed = time.perf_counter() - start
+    trace.count("configurations", len(results))
+    print(f"⏱️  {len(results):,} configurations in {elapsed:.2f}s ({len(results) / elapsed:,.0f}/s)")
+
+    ranked = sorted(results, key=lambda r: -r["ndcg"])     # stable: first configuration wins ties
+    best = ranked[0]
+    for name in table.names:
+        single = [r for r in results if r["weights"][table.names.index(name)] == 1.0 and r["depth"] == 0]
+        if single:
+            print(f"   {name:<28} alone: nDCG@10 = {single[0]['ndcg']:.4f}")
+    print("🏁 Top configurations (Lag6):")
+    for r in ranked[:5]:
+        print(f"   {r['ndcg']:.4f}  {describe(r, table.names)}")
+
+    if sweep_output:
+        os.makedirs(os.path.dirname(sweep_output) or ".", exist_ok=True)
+        with open(sweep_output, "w") as f:
+            f.write("ndcg@10\tnorm\tdepth\t" + "\t".join(table.names) + "\n")
+            for r in ranked:
+                f.write(f"{r['ndcg']:.4f}\t{r['norm']}\t{r['depth']}\t" + "\t".join(f"{w:.2f}" for w in r["weights"]) + "\n")
+        print(f"✅ Sweep saved to {sweep_output}")
+
+    # Best configuration → fused run per lag
+    lags = {"Lag6": table}
+    with trace.stage("write"):
+        for lag, runs in (apply or {}).items():
+            if len(runs) != len(table.names):
+                raise ValueError(f"{lag}: expected {len(table.names)} runs (bm25 + rerankers), got {len(runs)}")
+            lags[lag] = ScoreTable(runs[0], runs[1:])
+        fused_runs = {}
+        for lag, lag_table in lags.items():
+            path = os.path.join(output_dir, f"run_fused_{lag}.txt")
+            fused_runs[lag] = write_fused_run(lag_table, best, path)
+            print(f"✅ {lag}: fused run saved to {path}")
+
+    check = pytrec_ndcg(qrels, fused_runs["Lag6"])
+    print(f"✅ Lag6 nDCG@10 = {best['ndcg']:.4f} (pytrec_eval on the written run: {check:.4f})")
+    if lag8_qrels and os.path.exists(lag8_qrels):
+        lag8 = pytrec_ndcg(load_qrels(lag8_qrels), fused_runs.get("Lag8", fused_runs["Lag6"]))
+        drop = (best["ndcg"] - lag8) / best["ndcg"] if best["ndcg"] else float("inf")
+        print(f"✅ Lag8 nDCG@10 = {lag8:.4f} (relative drop {drop:.2%})")
+    trace.close()
+    return best
+
+
+def main(argv=None):
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    data_dir = config['data']['data_dir']
+    collection = os.path.join(data_dir, config['data']['train_collection'])
+    fusion = config.get('fusion', {})
+
+    parser = argparse.ArgumentParser(description="Tune α·BM25 + (1−α)·neural score interpolation on Lag6")
+    parser.add_argument("--bm25", default=os.path.join(config['general']['output_dir'], 'run_bm25.txt'))
+    parser.add_argument("--rerank", nargs="+", required=True, help="Rerank runs of the BM25 candidates")
+    parser.add_argument("--qrels", default=os.path.join(collection, config['data']['lag6_qrels_dir'], 'qrels_processed.txt'))
+    parser.add_argument("--lag8-qrels", default=os.path.join(collection, config['data']['lag8_qrels_dir'], 'qrels_processed.txt'),
+                        help="Held-out check of the best configuration")
+    parser.add_argument("--norms", nargs="+", choices=NORMS, default=fusion.get('norms', ["minmax", "zscore"]))
+    parser.add_argument("--depths", nargs="+", type=int, default=fusion.get('depths', [0]),
+                        help="Rerank depths to sweep (0 = all candidates)")
+    parser.add_argument("--step", type=float, default=fusion.get('step', 0.01), help="Weight grid step")
+    parser.add_argument("--apply", nargs="+", action="append", metavar=("LAG", "RUN"), default=[],
+                        help="LAG BM25_RUN RERANK_RUN...: write the best fused run for another lag")
+    parser.add_argument("--output-dir", default=config['general']['output_dir'])
+    parser.add_argument("--sweep-output", default="eval_results/fusion_sweep.tsv")
+    args = parser.parse_args(argv)
+
+    apply = {}
+    for entry in args.apply:
+        if len(entry) < 2:
+            parser.error("--apply needs a lag name and the runs")
+        apply[entry[0]] = entry[1:]
+    fuse_scores(args.bm25, args.rerank, args.qrels, args.norms, args.depths, args.step, args.output_dir,
+                apply, args.lag8_qrels, args.sweep_output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Lightweight stage timing and resource instrumentation.
+
+Usage:
+
+    trace = Instrumentation("bm25_baseline", k1=0.9, b=0.4)
+    with trace.stage("searcher_init"):
+        searcher = LuceneSearcher(index_path)
+    trace.count("docs_missing", 3)
+    trace.close()
+
+Per stage, wall time (perf_counter) and CPU time (process_time) are summed
+over all calls. `close()` appends one JSON line per stage plus a summary line
+(counters, peak RSS, padding ratio) to the trace log.
+
+Environment variables:
+
+* LONGEVAL_TRACE          JSONL log path (default: logs/trace.jsonl), "off" disables logging
+* LONGEVAL_PROFILE        "cprofile" or "sampling" to profile the instrumented run
+* LONGEVAL_PROFILE_DIR    where profiles are written (default: logs/)
+* LONGEVAL_SAMPLE_INTERVAL  sampling interval in seconds (default: 0.005)
+"""
+import atexit
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+DEFAULT_LOG = "logs/trace.jsonl"
+
+_active_profiler = None     # only one profiler can run per process
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None if unavailable)."""
+    # VmHWM is per process image; ru_maxrss survives exec() and would report
+    # the parent's peak in spawned workers (benchmark stages, experiment nodes)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class _SamplingProfiler:
+    """
+    Signal based sampling profiler (Unix, main thread only).
+
+    Every `interval` seconds of CPU time the current Python stack is recorded;
+    the result is written in collapsed-stack format ("a;b;c <count>"), which
+    flamegraph.pl / speedscope can read directly.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+
+    def _handler(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._handler)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self, path: Path):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        with open(path, "w") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+class _NoTrace:
+    """Stand-in for library callers that do not pass an Instrumentation."""
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def count_padding(self, attention_mask) -> None:
+        pass
+
+
+NO_TRACE = _NoTrace()
+
+
+class Instrumentation:
+    """Collects per-stage wall/CPU time and counters for one component run."""
+
+    def __init__(self, component: str, log_path: Optional[str] = None, **meta):
+        self.component = component
+        self.meta = meta
+        self.run_id = f"{component}-{os.getpid()}-{int(time.time() * 1000)}"
+        env_log = os.getenv("LONGEVAL_TRACE", DEFAULT_LOG)
+        self.log_path = None if env_log.lower() in ("", "0", "off", "false") else Path(log_path or env_log)
+        self.stages: Dict[str, Dict[str, float]] = defaultdict(lambda: {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+        self.counters: Counter = Counter()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._closed = False
+        self._profiler = None
+        self._profile_path = None
+        self._start_profiler()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------ #
+    @contextmanager
+    def stage(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages[name]
+            entry["calls"] += 1
+            entry["wall_s"] += time.perf_counter() - wall
+            entry["cpu_s"] += time.process_time() - cpu
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def count_padding(self, attention_mask) -> None:
+        """Record real vs. padded token positions of a (batch, seq) attention mask."""
+        total = attention_mask.numel()
+        real = int(attention_mask.sum())
+        self.counters["tokens_total"] += total
+        self.counters["tokens_padding"] += total - real
+
+    # ------------------------------------------------------------------ #
+    def _start_profiler(self) -> None:
+        global _active_profiler
+        mode = os.getenv("LONGEVAL_PROFILE", "").lower()
+        if not mode or _active_profiler is not None:
+            return
+        profile_dir = Path(os.getenv("LONGEVAL_PROFILE_DIR", "logs"))
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        if mode == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profile_path = profile_dir / f"{self.run_id}.prof"
+            self._profiler.enable()
+        elif mode == "sampling":
+            if not hasattr(signal, "setitimer"):
+                print("⚠️ sampling profiler needs a Unix platform, profiling disabled")
+                return
+            self._profiler = _SamplingProfiler(float(os.getenv("LONGEVAL_SAMPLE_INTERVAL", "0.005")))
+            self._profile_path = profile_dir / f"{self.run_id}.collapsed"
+            self._profiler.start()
+        else:
+            print(f"⚠️ unknown LONGEVAL_PROFILE={mode!r} (use cprofile or sampling)")
+            return
+        _active_profiler = self._profiler
+
+    def _stop_profiler(self) -> None:
+        global _active_profiler
+        if self._profiler is None:
+            return
+        if isinstance(self._profiler, _SamplingProfiler):
+            self._profiler.stop(self._profile_path)
+        else:
+            self._profiler.disable()
+            self._profiler.dump_stats(str(self._profile_path))
+        _active_profiler = None
+        print(f"📈 Profile written to {self._profile_path}")
+
+    # ------------------------------------------------------------------ #
+    def summary(self) -> Dict:
+        summary = {
+            "type": "summary",
+            "run_id": self.run_id,
+            "component": self.component,
+            "host": socket.gethostname(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "meta": self.meta,
+            "wall_s": round(time.perf_counter() - self._start_wall, 4),
+            "cpu_s": round(time.process_time() - self._start_cpu, 4),
+            "peak_rss_mb": round(rss, 1) if (rss := peak_rss_mb()) is not None else None,
+            "counters": dict(self.counters),
+        }
+        if self.counters.get("tokens_total"):
+            summary["padding_ratio"] = round(self.counters["tokens_padding"] / self.counters["tokens_total"], 4)
+        return summary
+
+    def close(self) -> None:
+        """Write the stage and summary records; safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._stop_profiler()
+        stages = " | ".join(f"{name} {s['wall_s']:.2f}s" for name, s in self.stages.items())
+        rss = peak_rss_mb()
+        print(f"⏱️  {self.component}: {stages}" + (f" (peak RSS {rss:.0f} MB)" if rss else ""))
+        if self.log_path is None:
+            return
+        records = [
+            {"type": "stage", "run_id": self.run_id, "component": self.component, "stage": name,
+             "calls": s["calls"], "wall_s": round(s["wall_s"], 4), "cpu_s": round(s["cpu_s"], 4)}
+            for name, s in self.stages.items()
+        ]
+        records.append(self.summary())
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
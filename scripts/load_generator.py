@@ -0,0 +1,184 @@
+"""
+Load generator for scripts/server.py.
+
+Sends /search or /rerank requests built from queries.trec (and, for /rerank,
+the candidate documents of a run file) and reports client-side latency
+percentiles and throughput next to the server's own /stats.
+
+* closed loop (default): `--concurrency` clients, each sends its next request
+  as soon as the previous one returned
+* open loop (`--rate`): requests are started at a fixed rate; latency is
+  measured from the scheduled start, so queueing delay is not hidden
+
+    python scripts/load_generator.py --endpoint search --concurrency 16 --requests 2000
+    python scripts/load_generator.py --endpoint rerank --run runs/run_bm25.txt --rate 50
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.server import latency_summary
+
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yml')
+
+
+def parse_queries(path: str) -> Dict[str, str]:
+    mapping, qid = {}, None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("<num>"):
+                qid = line.replace("<num>", "").replace("</num>", "").replace("Number:", "").strip()
+            elif line.startswith("<title>"):
+                mapping[qid] = line.replace("<title>", "").strip()
+    return mapping
+
+
+def load_run(path: str, k: int) -> Dict[str, List[str]]:
+    run: Dict[str, List[str]] = {}
+    with open(path) as f:
+        for line in f:
+            qid, _, docid, *_ = line.split()
+            docs = run.setdefault(qid, [])
+            if len(docs) < k:
+                docs.append(docid)
+    return run
+
+
+def build_payloads(endpoint: str, queries: Dict[str, str], k: int, run: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+    if endpoint == "search" or run is None:
+        return [{"query": q, "k": k} for q in queries.values()]
+    return [{"query": queries[qid], "docids": docids} for qid, docids in run.items() if qid in queries]
+
+
+class _Client:
+    """One keep-alive HTTP connection per load-generator thread."""
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urlparse(url)
+        self.host, self.port, self.timeout = parsed.hostname, parsed.port or 80, timeout
+        self._local = threading.local()
+
+    def post(self, path: str, payload: Dict) -> Dict:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        body = json.dumps(payload).encode("utf-8")   # bytes: sent together with the headers
+        try:
+            conn.request("POST", path, body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = json.loads(response.read())
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self._local.conn = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(data.get("error", response.status))
+        return data
+
+
+def run_load(url: str, endpoint: str, payloads: List[Dict], num_requests: Optional[int] = None,
+             concurrency: int = 8, rate: Optional[float] = None, timeout: float = 120.0) -> Dict:
+    """Send `num_requests` requests (payloads are cycled) and summarise client-side latency."""
+    n = num_requests or len(payloads)
+    client = _Client(url, timeout)
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def one(i: int, scheduled: float) -> None:
+        try:
+            client.post(f"/{endpoint}", payloads[i % len(payloads)])
+            ok, message = True, None
+        except Exception as e:
+            ok, message = False, f"{type(e).__name__}: {e}"
+        latency = time.perf_counter() - scheduled
+        with lock:
+            (latencies.append(latency) if ok else errors.append(message))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rate:
+            for i in range(n):
+                scheduled = start + i / rate
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+                pool.submit(one, i, scheduled)
+        else:
+            counter = itertools.count()
+
+            def worker() -> None:
+                while (i := next(counter)) < n:
+                    one(i, time.perf_counter())
+
+            for _ in range(concurrency):
+                pool.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    result = {"endpoint": endpoint, "requests": n, "errors": len(errors), "concurrency": concurrency,
+              "rate": rate, "wall_s": round(elapsed, 3), "throughput_rps": round(len(latencies) / elapsed, 2)}
+    result.update(latency_summary(latencies))
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def fetch_stats(url: str, timeout: float = 10.0) -> Dict:
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    try:
+        conn.request("GET", "/stats")
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def main(argv=None) -> None:
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    server_cfg = config.get('server', {})
+
+    parser = argparse.ArgumentParser(description="Load generator for scripts/server.py")
+    parser.add_argument("--url", default=f"http://{server_cfg.get('host', '127.0.0.1')}:{server_cfg.get('port', 8765)}")
+    parser.add_argument("--endpoint", choices=["search", "rerank"], default="search")
+    parser.add_argument("--queries", default=os.path.join(config['data']['data_dir'], config['data']['queries_file']))
+    parser.add_argument("--run", help="Run file with the candidates for /rerank (default: server-side BM25)")
+    parser.add_argument("--top_k", type=int, default=config['bm25'].get('top_k', 25))
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, help="Open loop: requests per second")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    queries = parse_queries(args.queries)
+    run = load_run(args.run, args.top_k) if args.run else None
+    payloads = build_payloads(args.endpoint, queries, args.top_k, run)
+    mode = f"{args.rate} req/s" if args.rate else f"concurrency {args.concurrency}"
+    print(f"⏳ {args.requests} /{args.endpoint} requests ({mode}) → {args.url}")
+
+    result = run_load(args.url, args.endpoint, payloads, args.requests, args.concurrency, args.rate)
+    result["server"] = fetch_stats(args.url)
+    print(f"✅ {result['throughput_rps']} req/s | p50 {result['p50_ms']} ms | p99 {result['p99_ms']} ms"
+          f" | errors {result['errors']}")
+    server_side = result["server"]["endpoints"].get(args.endpoint, {})
+    print(f"   server: mean batch {server_side.get('mean_batch')} | batches {server_side.get('batches')}")
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
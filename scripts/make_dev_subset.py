@@ -0,0 +1,479 @@
+"""
+Streaming dev-collection subsetter (reads the LongEval zips directly).
+
+Instead of unzipping whole snapshots (get_dev_subset.sh), the members of the
+train collection archives are streamed and only a small, self-consistent
+collection is written:
+
+1. queries and the qrels of the selected lags are read (small files)
+2. a seeded, stratified sample of the judged queries is drawn
+   (strata: lags with judgments × relevant document judged × query length)
+3. per lag, a BM25 candidate pool for the sampled queries is computed in two
+   streaming passes over the documents (pass 1: number of documents, average
+   length and df of the query terms; pass 2: scores, best `pool_depth`
+   documents per query in a heap)
+4. judged documents + pool are written as TREC and JSON (file names of the
+   archive are kept), queries and qrels are restricted to the sample
+
+Memory depends on the sample (query terms, heaps, selected ids), not on the
+size of the archives. The same archives, arguments and seed give the same
+subset (see subset_manifest.json in the output).
+
+    python scripts/make_dev_subset.py \
+        --archives data/raw/Longeval_2025_Train_Collection_p1.zip data/raw/Longeval_2025_Train_Collection_p2.zip \
+        --output data/dev_sample --lags 2022-11,2023-01 --num-queries 200 --seed 42
+
+Output layout (same as the dev subset, usable as `data_dir` in scripts/config.yml):
+
+    <output>/French/queries.trec
+    <output>/French/LongEval Train Collection/Trec/<lag>_fr/*.trec
+    <output>/French/LongEval Train Collection/Json/<lag>_fr/*.json
+    <output>/French/LongEval Train Collection/qrels/<lag>_fr/qrels_processed.txt
+"""
+import argparse
+import heapq
+import io
+import json
+import math
+import os
+import random
+import re
+import sys
+import zipfile
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from tqdm import tqdm
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.docstore import DOCNO, normalize_docid
+
+COLLECTION = "LongEval Train Collection"
+MEMBER = re.compile(r"(?:^|/)French/LongEval Train Collection/(Trec|Json|qrels)/(\d{4}-\d{2})_fr/(?:.*/)?([^/]+)$")
+QUERIES = re.compile(r"(?:^|/)French/queries\.trec$")
+TOKEN = re.compile(r"\w+")
+
+DocKey = Union[int, str]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def doc_key(docid: str) -> DocKey:
+    """'doc123' / '123' -> 123 (as in scripts/docstore.py), other ids unchanged."""
+    try:
+        return normalize_docid(docid)
+    except ValueError:
+        return docid.strip()
+
+
+def qid_order(qid: str):
+    return (len(qid), qid)
+
+
+# --------------------------------------------------------------------------- #
+# Archive access                                                              #
+# --------------------------------------------------------------------------- #
+class Member:
+    """One file inside a zip archive (or below an extracted directory), read as a text stream."""
+
+    def __init__(self, archive: Union[zipfile.ZipFile, str], name: str):
+        self.archive = archive
+        self.name = name
+
+    @property
+    def basename(self) -> str:
+        return self.name.rsplit("/", 1)[-1]
+
+    def open(self):
+        if isinstance(self.archive, zipfile.ZipFile):
+            return io.TextIOWrapper(self.archive.open(self.name), encoding="utf-8", errors="replace")
+        return open(os.path.join(self.archive, self.name), encoding="utf-8", errors="replace")
+
+
+class Catalog:
+    """Members of all archives, grouped by kind (Trec / Json / qrels) and lag."""
+
+    def __init__(self, paths: List[str]):
+        self.archives: List[zipfile.ZipFile] = []
+        self.queries: List[Member] = []
+        self.members: Dict[str, Dict[str, List[Member]]] = {"Trec": defaultdict(list), "Json": defaultdict(list),
+                                                            "qrels": defaultdict(list)}
+        for path in paths:
+            if os.path.isdir(path):
+                archive = path
+                names = [os.path.relpath(os.path.join(root, f), path).replace(os.sep, "/")
+                         for root, _, files in os.walk(path) for f in files]
+            else:
+                archive = zipfile.ZipFile(path)       # reads only the central directory
+                self.archives.append(archive)
+                names = [n for n in archive.namelist() if not n.endswith("/")]
+            for name in sorted(names):
+                if QUERIES.search(name):
+                    self.queries.append(Member(archive, name))
+                    continue
+                m = MEMBER.search(name)
+                if not m:
+                    continue
+                kind, lag, filename = m.groups()
+                if kind == "Trec" and filename == "queries.trec":
+                    self.queries.append(Member(archive, name))
+                elif kind != "qrels" or filename.startswith("qrels"):
+                    self.members[kind][lag].append(Member(archive, name))
+
+    def qrels_member(self, lag: str) -> Optional[Member]:
+        members = self.members["qrels"].get(lag, [])
+        processed = [m for m in members if m.basename == "qrels_processed.txt"]
+        return (processed or members or [None])[0]
+
+    def close(self) -> None:
+        for archive in self.archives:
+            archive.close()
+
+
+# --------------------------------------------------------------------------- #
+# Streaming parsers                                                           #
+# --------------------------------------------------------------------------- #
+def iter_trec(stream) -> Iterator[Tuple[str, str, str]]:
+    """(docid, text, raw <DOC> block) for every document of a TREC stream."""
+    in_doc, raw, text, docid = False, [], [], None
+    for line in stream:
+        if line.startswith("<DOC>"):
+            in_doc, raw, text, docid = True, [line], [], None
+            continue
+        if not in_doc:
+            continue
+        raw.append(line)
+        if line.startswith("</DOC>"):
+            in_doc = False
+            if docid:
+                yield docid, " ".join(text), "".join(raw)
+            continue
+        if docid is None and (m := DOCNO.search(line)):
+            docid = m.group(1).strip()
+            continue
+        stripped = line.strip()
+        if stripped not in ("<TEXT>", "</TEXT>"):
+            text.append(stripped)
+
+
+def iter_json_objects(stream, chunk_size: int = 1 << 20) -> Iterator[Dict]:
+    """Objects of a JSON array, of concatenated objects or of JSONL, decoded incrementally."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                return
+            buf, pos = stream.read(chunk_size), 0
+            eof = not buf
+            continue
+        try:
+            obj, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = stream.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if isinstance(obj, dict):
+            yield obj
+
+
+def iter_documents(catalog: Catalog, lag: str, desc: str) -> Iterator[Tuple[str, str]]:
+    """(docid, text) of a lag, from the TREC files (or the JSON files if there are none)."""
+    if catalog.members["Trec"].get(lag):
+        for member in tqdm(catalog.members["Trec"][lag], desc=desc):
+            with member.open() as f:
+                for docid, text, _ in iter_trec(f):
+                    yield docid, text
+    else:
+        for member in tqdm(catalog.members["Json"].get(lag, []), desc=desc):
+            with member.open() as f:
+                for obj in iter_json_objects(f):
+                    yield str(obj.get("id", "")), str(obj.get("contents", ""))
+
+
+# --------------------------------------------------------------------------- #
+# Queries, qrels, sampling                                                    #
+# --------------------------------------------------------------------------- #
+def parse_queries(stream) -> Dict[str, str]:
+    mapping, qid = {}, None
+    for line in stream:
+        if line.startswith("<num>"):
+            qid = line.replace("<num>", "").replace("</num>", "").replace("Number:", "").strip()
+        elif line.startswith("<title>"):
+            mapping[qid] = line.replace("<title>", "").strip()
+    return mapping
+
+
+def parse_qrels(stream) -> Dict[str, Dict[str, int]]:
+    qrels: Dict[str, Dict[str, int]] = {}
+    for line in stream:
+        parts = line.split()
+        if len(parts) == 4:
+            qid, _, docid, rel = parts
+            qrels.setdefault(qid, {})[docid] = int(rel)
+    return qrels
+
+
+def stratified_sample(queries: Dict[str, str], qrels: Dict[str, Dict], lags: List[str], n: int,
+                      seed: int) -> Tuple[List[str], Dict[str, List[int]]]:
+    """
+    Seeded sample of the judged queries, proportional to the strata
+    (lags with judgments, relevant document judged, query length 1/2/3/4+).
+    Returns the sampled qids and {stratum: [available, sampled]}.
+    """
+    strata: Dict[Tuple, List[str]] = defaultdict(list)
+    for qid, text in queries.items():
+        judged = tuple(lag for lag in lags if qid in qrels[lag])
+        if not judged:
+            continue
+        relevant = any(rel > 0 for lag in judged for rel in qrels[lag][qid].values())
+        strata[(judged, relevant, min(len(tokenize(text)), 4))].append(qid)
+
+    keys = sorted(strata)
+    total = sum(len(strata[k]) for k in keys)
+    n = min(n, total)
+    quota = {k: n * len(strata[k]) / total for k in keys} if total else {}
+    alloc = {k: int(quota[k]) for k in keys}
+    # largest remainder, ties broken by stratum order
+    for k in sorted(keys, key=lambda k: (alloc[k] - quota[k], keys.index(k)))[:n - sum(alloc.values())]:
+        alloc[k] += 1
+
+    rng = random.Random(seed)
+    sample: List[str] = []
+    for k in keys:
+        sample += rng.sample(sorted(strata[k], key=qid_order), alloc[k])
+    stats = {f"{'+'.join(k[0])}|{'rel' if k[1] else 'norel'}|len{k[2]}": [len(strata[k]), alloc[k]] for k in keys}
+    return sorted(sample, key=qid_order), stats
+
+
+# --------------------------------------------------------------------------- #
+# BM25 candidate pool                                                         #
+# --------------------------------------------------------------------------- #
+def bm25_pool(catalog: Catalog, lag: str, queries: Dict[str, str], depth: int,
+              k1: float = 0.9, b: float = 0.4) -> Dict[str, List[str]]:
+    """Top-`depth` BM25 documents per query in two streaming passes (Lucene BM25 idf)."""
+    query_terms = {qid: Counter(tokenize(text)) for qid, text in queries.items()}
+    term_queries: Dict[str, List[str]] = defaultdict(list)
+    for qid, terms in query_terms.items():
+        for term in terms:
+            term_queries[term].append(qid)
+    vocabulary = set(term_queries)
+
+    # Pass 1: collection statistics for the query terms only
+    n_docs, total_length, df = 0, 0, Counter()
+    for _, text in iter_documents(catalog, lag, f"📖 {lag} pass 1/2"):
+        tokens = tokenize(text)
+        n_docs += 1
+        total_length += len(tokens)
+        df.update(vocabulary.intersection(tokens))
+    if n_docs == 0:
+        return {}
+    avgdl = total_length / n_docs
+    idf = {t: math.log(1 + (n_docs - df[t] + 0.5) / (df[t] + 0.5)) for t in vocabulary}
+
+    # Pass 2: scores; one min-heap of (score, docid) per query
+    heaps: Dict[str, List[Tuple[float, str]]] = {qid: [] for qid in queries}
+    for docid, text in iter_documents(catalog, lag, f"📖 {lag} pass 2/2"):
+        tokens = tokenize(text)
+        tf = Counter(tokens)
+        matched = vocabulary.intersection(tf)
+        if not matched:
+            continue
+        norm = k1 * (1 - b + b * len(tokens) / avgdl)
+        scores: Dict[str, float] = defaultdict(float)
+        for term in matched:
+            weight = idf[term] * tf[term] / (tf[term] + norm)
+            for qid in term_queries[term]:
+                scores[qid] += weight * query_terms[qid][term]
+        for qid, score in scores.items():
+            heap, item = heaps[qid], (score, docid)
+            if len(heap) < depth:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    return {qid: [d for _, d in sorted(heap, reverse=True)] for qid, heap in heaps.items()}
+
+
+# --------------------------------------------------------------------------- #
+# Writing                                                                     #
+# --------------------------------------------------------------------------- #
+class _JsonArrayWriter:
+    def __init__(self, path: Path):
+        self.f = open(path, "w", encoding="utf-8")
+        self.f.write("[")
+        self.first = True
+
+    def write(self, obj: Dict) -> None:
+        self.f.write(("" if self.first else ",\n") + json.dumps(obj, ensure_ascii=False))
+        self.first = False
+
+    def close(self) -> None:
+        self.f.write("]\n")
+        self.f.close()
+
+
+def write_documents(catalog: Catalog, lag: str, selected: Set[DocKey], trec_dir: Path, json_dir: Path) -> Set[DocKey]:
+    """
+    Copy the selected documents of a lag (one output file per archive file).
+    TREC is generated from JSON and vice versa if the archives only contain one format.
+    Returns the keys of the written documents.
+    """
+    trec_members = catalog.members["Trec"].get(lag, [])
+    json_members = catalog.members["Json"].get(lag, [])
+    trec_dir.mkdir(parents=True, exist_ok=True)
+    json_dir.mkdir(parents=True, exist_ok=True)
+    written: Set[DocKey] = set()
+
+    for member in tqdm(trec_members, desc=f"✍️  {lag} TREC"):
+        out = trec_dir / member.basename
+        generated = None if json_members else _JsonArrayWriter(json_dir / (Path(member.basename).stem + ".json"))
+        count = 0
+        with member.open() as f, open(out, "w", encoding="utf-8") as fout:
+            for docid, text, raw in iter_trec(f):
+                key = doc_key(docid)
+                if key in selected:
+                    fout.write(raw)
+                    written.add(key)
+                    count += 1
+                    if generated:
+                        generated.write({"id": docid, "contents": text})
+        if generated:
+            generated.close()
+        if count == 0:
+            out.unlink()
+            if generated:
+                (json_dir / (Path(member.basename).stem + ".json")).unlink()
+
+    for member in tqdm(json_members, desc=f"✍️  {lag} JSON"):
+        out = json_dir / member.basename
+        writer = _JsonArrayWriter(out)
+        generated = None if trec_members else open(trec_dir / (Path(member.basename).stem + ".trec"), "w", encoding="utf-8")
+        count = 0
+        with member.open() as f:
+            for obj in iter_json_objects(f):
+                docid = str(obj.get("id", ""))
+                key = doc_key(docid)
+                if key in selected:
+                    writer.write(obj)
+                    written.add(key)
+                    count += 1
+                    if generated:
+                        generated.write(f"<DOC>\n<DOCNO>{docid}</DOCNO>\n<TEXT>\n{obj.get('contents', '')}\n</TEXT>\n</DOC>\n")
+        writer.close()
+        if generated:
+            generated.close()
+        if count == 0:
+            out.unlink()
+            if generated:
+                (trec_dir / (Path(member.basename).stem + ".trec")).unlink()
+    return written
+
+
+def write_queries(path: Path, queries: Dict[str, str], qids: List[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for qid in qids:
+            f.write(f"<top>\n<num>Number: {qid}</num>\n<title>{queries[qid]}\n</top>\n\n")
+
+
+# --------------------------------------------------------------------------- #
+# Main                                                                        #
+# --------------------------------------------------------------------------- #
+def make_dev_subset(archives: List[str], output: str, lags: List[str], num_queries: int = 200,
+                    pool_depth: int = 50, seed: int = 42, k1: float = 0.9, b: float = 0.4) -> Dict:
+    catalog = Catalog(archives)
+    try:
+        if not catalog.queries:
+            raise FileNotFoundError("no French/queries.trec in the archives")
+        queries: Dict[str, str] = {}
+        for member in catalog.queries:
+            with member.open() as f:
+                for qid, text in parse_queries(f).items():
+                    queries.setdefault(qid, text)
+
+        qrels: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for lag in lags:
+            member = catalog.qrels_member(lag)
+            if member is None:
+                raise FileNotFoundError(f"no qrels for {lag} in the archives")
+            with member.open() as f:
+                qrels[lag] = parse_qrels(f)
+
+        sample, strata = stratified_sample(queries, qrels, lags, num_queries, seed)
+        sampled = {qid: queries[qid] for qid in sample}
+        print(f"✅ {len(sample)} of {len(queries)} queries sampled ({len(strata)} strata, seed {seed})")
+
+        french_dir = Path(output) / "French"
+        collection_dir = french_dir / COLLECTION
+        write_queries(french_dir / "queries.trec", queries, sample)
+        manifest = {"archives": [{"path": str(a), "bytes": os.path.getsize(a) if os.path.isfile(a) else None}
+                                 for a in archives],
+                    "seed": seed, "num_queries": len(sample), "pool_depth": pool_depth, "bm25": {"k1": k1, "b": b},
+                    "strata": strata, "lags": {}}
+
+        for lag in lags:
+            judged = {doc_key(d) for qid in sample for d in qrels[lag].get(qid, {})}
+            has_docs = bool(catalog.members["Trec"].get(lag) or catalog.members["Json"].get(lag))
+            written: Optional[Set[DocKey]] = None
+            pool: Set[DocKey] = set()
+            if has_docs:
+                pool = {doc_key(d) for docs in bm25_pool(catalog, lag, sampled, pool_depth, k1, b).values()
+                        for d in docs}
+                written = write_documents(catalog, lag, judged | pool,
+                                          collection_dir / "Trec" / f"{lag}_fr", collection_dir / "Json" / f"{lag}_fr")
+                write_queries(collection_dir / "Trec" / f"{lag}_fr" / "queries.trec", queries, sample)
+            else:
+                print(f"⚠️ no documents for {lag} in the archives, only qrels are written")
+
+            # qrels: sampled queries, and only documents that exist in the subset (if it has documents)
+            qrels_path = collection_dir / "qrels" / f"{lag}_fr" / "qrels_processed.txt"
+            qrels_path.parent.mkdir(parents=True, exist_ok=True)
+            n_qrels = 0
+            with open(qrels_path, "w") as f:
+                for qid in sample:
+                    for docid, rel in qrels[lag].get(qid, {}).items():
+                        if written is None or doc_key(docid) in written:
+                            f.write(f"{qid} 0 {docid} {rel}\n")
+                            n_qrels += 1
+            manifest["lags"][lag] = {"documents": len(written) if written is not None else 0,
+                                     "judged_documents": len(judged), "pool_documents": len(pool),
+                                     "judged_missing": len(judged - written) if written is not None else None,
+                                     "qrels": n_qrels}
+            print(f"✅ {lag}: {manifest['lags'][lag]['documents']:,} documents | {n_qrels:,} qrels")
+
+        with open(Path(output) / "subset_manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+    finally:
+        catalog.close()
+    print(f"🏁 Dev subset written to {output}")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sample a small LongEval collection directly from the zip archives")
+    parser.add_argument("--archives", nargs="+", required=True, help="Train collection zips (or extracted directories)")
+    parser.add_argument("--output", default="data/dev_sample", help="Output directory")
+    parser.add_argument("--lags", default="2022-11,2023-01", help="Comma-separated snapshots, e.g. 2022-11,2023-01")
+    parser.add_argument("--num-queries", type=int, default=200, help="Sampled (judged) queries")
+    parser.add_argument("--pool-depth", type=int, default=50, help="BM25 candidates per query and lag")
+    parser.add_argument("--k1", type=float, default=0.9)
+    parser.add_argument("--b", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args(argv)
+
+    make_dev_subset(args.archives, args.output, args.lags.split(","), args.num_queries, args.pool_depth,
+                    args.seed, args.k1, args.b)
+
+
+if __name__ == "__main__":
+    main()
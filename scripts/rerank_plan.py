@@ -0,0 +1,129 @@
+"""
+Scoring plan for the rerankers: (query, document) pairs are deduplicated across qids.
+
+LongEval topic files contain many qids with the same query text up to case,
+whitespace or accents ("Météo Paris" / "meteo  paris"). The plan maps every
+(qid, docid) of a run to a scoring job keyed by (normalised query, docid);
+each job goes through the model once, with the query text of the first qid
+of its key, and its score is copied back to every qid that shares it.
+
+    plan = RerankPlan(run, queries, available=docs, mode="exact")
+    plan.print_summary()
+    scores = plan.resolve([(qid, docids)], lambda jobs: model_scores(jobs))
+    ...
+    plan.report(trace)
+
+Modes (default: exact, which cannot change any score; with basic/french the
+scores of case- or accent-sensitive rerankers such as monoT5 and Cohere can change):
+
+* off     no merging across qids (duplicate docids of one qid are still scored once)
+* exact   only byte-identical query texts are merged
+* basic   case, whitespace and accents are normalised
+* french  Lucene FrenchAnalyzer (elision, stopwords, light stemming, via pyserini)
+          followed by the basic normalisation
+"""
+import re
+import unicodedata
+from typing import Callable, Container, Dict, List, Optional, Tuple
+
+DEDUP_MODES = ("off", "exact", "basic", "french")
+DEFAULT_MODE = "exact"      # lossless; basic/french are opt-in (merged qids get the text of the first one)
+
+WHITESPACE = re.compile(r"\s+")
+
+_french_analyzer = None
+
+
+def normalize_query(text: str) -> str:
+    """Casefold, strip accents, collapse whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return WHITESPACE.sub(" ", stripped).strip()
+
+
+def french_tokens(text: str) -> List[str]:
+    """Tokens of the Lucene FrenchAnalyzer (pyserini, starts the JVM on first use)."""
+    global _french_analyzer
+    if _french_analyzer is None:
+        from pyserini.analysis import Analyzer, get_lucene_analyzer
+        _french_analyzer = Analyzer(get_lucene_analyzer(language="fr"))
+    return _french_analyzer.analyze(text)
+
+
+def query_key(qid: str, text: str, mode: str = DEFAULT_MODE) -> str:
+    if mode == "off":
+        return f"qid:{qid}"
+    if mode == "exact":
+        return f"text:{text}"
+    if mode == "basic":
+        return normalize_query(text)
+    if mode == "french":
+        return normalize_query(" ".join(french_tokens(text)))
+    raise ValueError(f"unknown dedup mode {mode!r} (one of {', '.join(DEDUP_MODES)})")
+
+
+class RerankPlan:
+    """Unique (normalised query, docid) scoring jobs of a run and the way back to every (qid, docid)."""
+
+    def __init__(self, run: Dict[str, List[str]], queries: Dict[str, str],
+                 available: Optional[Container[str]] = None, mode: str = DEFAULT_MODE):
+        self.mode = mode
+        self.keys: Dict[str, str] = {}
+        self.texts: Dict[str, str] = {}                 # key -> query text of its first qid
+        self.jobs: List[Tuple[str, str]] = []           # (query text, docid)
+        self.index: Dict[Tuple[str, str], int] = {}
+        self.scores: List[Optional[float]] = []
+        self.pairs = 0
+        for qid, docids in run.items():
+            if qid not in queries:
+                continue
+            key = self.keys[qid] = query_key(qid, queries[qid], mode)
+            text = self.texts.setdefault(key, queries[qid])
+            for docid in docids:
+                if available is not None and docid not in available:
+                    continue
+                self.pairs += 1
+                if (key, docid) not in self.index:
+                    self.index[key, docid] = len(self.jobs)
+                    self.jobs.append((text, docid))
+                    self.scores.append(None)
+        self.scored = 0
+
+    @property
+    def saved(self) -> int:
+        return self.pairs - len(self.jobs)
+
+    @property
+    def ratio(self) -> float:
+        return self.pairs / len(self.jobs) if self.jobs else 1.0
+
+    def resolve(self, items: List[Tuple[str, List[str]]],
+                score_jobs: Callable[[List[Tuple[str, str]]], List[float]]) -> List[List[float]]:
+        """
+        Scores for [(qid, docids)]: jobs that were not scored before are passed to
+        `score_jobs` as (query text, docid), all at once and each only one time.
+        """
+        pending: Dict[int, None] = {}       # ordered set
+        for qid, docids in items:
+            for docid in docids:
+                job = self.index[self.keys[qid], docid]
+                if self.scores[job] is None:
+                    pending[job] = None
+        if pending:
+            for job, score in zip(pending, score_jobs([self.jobs[job] for job in pending])):
+                self.scores[job] = score
+            self.scored += len(pending)
+        return [[self.scores[self.index[self.keys[qid], d]] for d in docids] for qid, docids in items]
+
+    def print_summary(self) -> None:
+        queries = len(self.keys)
+        unique = len(self.texts)
+        print(f"🗂️  {self.pairs:,} (qid, doc) pairs → {len(self.jobs):,} scoring jobs "
+              f"({queries:,} queries, {unique:,} distinct after '{self.mode}' normalisation, "
+              f"dedup ×{self.ratio:.2f}, {self.saved:,} forward passes saved)")
+
+    def report(self, trace) -> None:
+        trace.count("pairs_planned", self.pairs)
+        trace.count("pairs_deduplicated", self.saved)
+        print(f"✅ dedup ({self.mode}): {self.scored:,} pairs scored for {self.pairs:,} (qid, doc) pairs, "
+              f"ratio ×{self.ratio:.2f}, {self.saved:,} forward passes saved")
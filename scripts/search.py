@@ -1,67 +1,117 @@
+import argparse
 import pandas as pd
-from pyserini.search.lucene import LuceneSearcher
 import os
+import sys
 import yaml
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.build_index import INDEX_LANGUAGE
+from scripts.instrumentation import Instrumentation
+
 config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yml')
-with open(config_path, 'r') as f:
-    config = yaml.safe_load(f)
 
-# Paths from config
-INDEX_DIR = config['bm25']['index_dir']
-QUERIES_FILE = os.path.join(config['data']['data_dir'], config['data']['queries_file'])
-RUN_FILE = os.path.join(config['general']['output_dir'], 'run_bm25.txt')
 RUN_ID = 'bm25-baseline'
 
-# BM25 parameters from config
-k1 = config['bm25'].get('k1', 0.9)
-b = config['bm25'].get('b', 0.4)
-top_k = config['bm25'].get('top_k', 25)
-
-# Load searcher
-searcher = LuceneSearcher(INDEX_DIR)
-
-# Parse queries.trec manually
-queries = []
-with open(QUERIES_FILE, 'r') as f:
-    qid, query = None, None
-    for line in f:
-        if line.startswith('<num>'):
-            qid = line.strip()
-            qid = qid.replace('<num>', '').replace('</num>', '')
-            qid = qid.replace('Number:', '').strip()
-        if line.startswith('<title>'):
-            query = line.replace('<title>', '').strip()
-            queries.append({'qid': qid, 'query': query})
-queries_df = pd.DataFrame(queries)
-
-# downsampling to 1000 queries for testing
-qrels_qids = set()
-
-QRELS_FILE = os.path.join(config['data']['data_dir'], 'LongEval Train Collection/qrels/2022-11_fr/qrels_processed.txt')
-with open(QRELS_FILE, 'r') as f:
-    for line in f:
-        qid, *_ = line.strip().split()
-        qrels_qids.add(qid)
-
-queries_df = queries_df[queries_df['qid'].isin(qrels_qids)]
-queries_df = queries_df.sample(n=1000, random_state=42)
-
-# Create runs/ if missing
-os.makedirs(os.path.dirname(RUN_FILE), exist_ok=True)
-
-# Write results in TREC format
-with open(RUN_FILE, 'w') as f_out:
-    for _, row in queries_df.iterrows():
-        qid, query = str(row.qid), row.query
-        hits = searcher.search(query, k=top_k)
-        print(f"Query {qid} → Top hits:", [hit.docid for hit in hits[:10]])
-        for rank, hit in enumerate(hits):
-            docid = hit.docid
-            if docid.startswith("doc"):
-                docid = docid[3:]  # strip "doc" prefix
-            f_out.write(f"{qid} Q0 {docid} {rank+1} {hit.score:.4f} {RUN_ID}\n")
-
-
-
-print(f"✅ Test run written to {RUN_FILE}")
+
+def parse_queries(queries_file):
+    # Parse queries.trec manually
+    queries = []
+    with open(queries_file, 'r') as f:
+        qid, query = None, None
+        for line in f:
+            if line.startswith('<num>'):
+                qid = line.strip()
+                qid = qid.replace('<num>', '').replace('</num>', '')
+                qid = qid.replace('Number:', '').strip()
+            if line.startswith('<title>'):
+                query = line.replace('<title>', '').strip()
+                queries.append({'qid': qid, 'query': query})
+    return pd.DataFrame(queries)
+
+
+def search(index_dir, queries_file, run_file, k1=None, b=None, top_k=25, qrels_file=None, sample=1000, seed=42,
+           language=None):
+    """
+    BM25 run in TREC format. If `qrels_file` is given, only judged queries are
+    searched; `sample` > 0 downsamples them (for testing). `language` is the
+    analyzer of the index ('fr' for the Java IndexBuilder, None = English).
+    k1/b = None keeps Pyserini's defaults (0.9 / 0.4), as runs/run_bm25.txt always used.
+    """
+    trace = Instrumentation("search", k1=k1, b=b, top_k=top_k, language=language, run_file=run_file)
+
+    # Load searcher
+    with trace.stage("searcher_init"):
+        from pyserini.search.lucene import LuceneSearcher  # starts the JVM
+        searcher = LuceneSearcher(index_dir)
+        if language:
+            searcher.set_language(language)
+
+    with trace.stage("query_parse"):
+        queries_df = parse_queries(queries_file)
+
+        # downsampling to judged queries for testing
+        if qrels_file:
+            qrels_qids = set()
+            with open(qrels_file, 'r') as f:
+                for line in f:
+                    qid, *_ = line.strip().split()
+                    qrels_qids.add(qid)
+            queries_df = queries_df[queries_df['qid'].isin(qrels_qids)]
+        if sample and len(queries_df) > sample:
+            queries_df = queries_df.sample(n=sample, random_state=seed)
+
+    # BM25 parameters (only if given explicitly)
+    if k1 is not None or b is not None:
+        searcher.set_bm25(k1=float(0.9 if k1 is None else k1), b=float(0.4 if b is None else b))
+
+    # Create runs/ if missing
+    os.makedirs(os.path.dirname(run_file) or ".", exist_ok=True)
+
+    # Write results in TREC format
+    with open(run_file, 'w') as f_out:
+        for _, row in queries_df.iterrows():
+            qid, query = str(row.qid), row.query
+            with trace.stage("search"):
+                hits = searcher.search(query, k=top_k)
+            print(f"Query {qid} → Top hits:", [hit.docid for hit in hits[:10]])
+            with trace.stage("write"):
+                for rank, hit in enumerate(hits):
+                    docid = hit.docid
+                    if docid.startswith("doc"):
+                        docid = docid[3:]  # strip "doc" prefix
+                    f_out.write(f"{qid} Q0 {docid} {rank+1} {hit.score:.4f} {RUN_ID}\n")
+            trace.count("queries")
+            trace.count("hits", len(hits))
+
+    trace.close()
+    print(f"✅ Test run written to {run_file}")
+
+
+def main(argv=None):
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+
+    # Paths from config
+    data_dir = config['data']['data_dir']
+    parser = argparse.ArgumentParser(description="BM25 search (TREC run file)")
+    parser.add_argument("--index", default=config['bm25']['index_dir'])
+    parser.add_argument("--queries", default=os.path.join(data_dir, config['data']['queries_file']))
+    parser.add_argument("--output", default=os.path.join(config['general']['output_dir'], 'run_bm25.txt'))
+    parser.add_argument("--k1", type=float, help="Default: Pyserini's 0.9 (bm25.k1 in config.yml is not applied here)")
+    parser.add_argument("--b", type=float, help="Default: Pyserini's 0.4 (bm25.b in config.yml is not applied here)")
+    parser.add_argument("--top_k", type=int, default=config['bm25'].get('top_k', 25))
+    parser.add_argument("--qrels", default=os.path.join(data_dir, config['data']['train_collection'], config['data']['lag6_qrels_dir'], 'qrels_processed.txt'),
+                        help="Only search queries judged in this qrels file ('' = all queries)")
+    parser.add_argument("--sample", type=int, default=1000, help="Downsample to n queries (0 = no sampling)")
+    parser.add_argument("--language", default=INDEX_LANGUAGE[config.get('index_builder', {}).get('backend', 'pyserini')],
+                        help="Analyzer of the index ('fr' for the Java IndexBuilder; default: from index_builder.backend)")
+    args = parser.parse_args(argv)
+
+    search(args.index, args.queries, args.output, args.k1, args.b, args.top_k, args.qrels or None, args.sample,
+           language=args.language)
+
+
+if __name__ == "__main__":
+    main()
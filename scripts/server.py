@@ -0,0 +1,392 @@
+"""
+Resident retrieval + rerank server (localhost, HTTP/JSON).
+
+Keeps the LuceneSearcher (JVM), the document store and the cross-encoder
+loaded, so repeated search / rerank calls do not pay the start-up costs of
+`scripts/search.py` or the rerankers again.
+
+Concurrent requests are grouped into micro-batches: the first request of a
+batch waits at most `--window-ms` for more requests (up to `--max-batch`),
+then the whole batch goes through one `batch_search` call or one series of
+cross-encoder forward passes.
+
+Endpoints:
+
+* POST /search   {"query": "...", "k": 25}
+* POST /rerank   {"query": "...", "docids": [...]}   or   {"query": "...", "docs": ["text", ...]}
+                 without docids/docs the BM25 top-k of the query is reranked
+* GET  /stats    request counts, p50/p95/p99 latency, throughput, mean batch size
+* GET  /health
+
+    python scripts/server.py --port 8765
+    python scripts/load_generator.py --endpoint rerank --concurrency 16
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.instrumentation import Instrumentation, NO_TRACE, peak_rss_mb
+
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yml')
+
+
+def latency_summary(latencies_s: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/mean/max in milliseconds."""
+    if not latencies_s:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+    ms = np.asarray(latencies_s) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+            "mean_ms": round(float(ms.mean()), 2), "max_ms": round(float(ms.max()), 2)}
+
+
+class LatencyStats:
+    """Thread-safe request latencies (last `keep` requests) and batch sizes of one endpoint."""
+
+    def __init__(self, keep: int = 100_000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=keep)
+        self.requests = self.errors = self.batches = self.batched_items = 0
+        self._first = self._last = None
+
+    def record(self, latency_s: float, ok: bool = True) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self._latencies.append(latency_s)
+            self.requests += 1
+            self.errors += not ok
+            self._first = self._first or now - latency_s
+            self._last = now
+
+    def record_batch(self, size: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batched_items += size
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latencies = list(self._latencies)
+            elapsed = (self._last - self._first) if self.requests else 0.0
+            snap = {"requests": self.requests, "errors": self.errors, "batches": self.batches,
+                    "mean_batch": round(self.batched_items / self.batches, 2) if self.batches else None,
+                    "throughput_rps": round(self.requests / elapsed, 2) if elapsed > 0 else None}
+        snap.update(latency_summary(latencies))
+        return snap
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for at most `window_ms` (or until `max_batch`
+    items are waiting) and processes them with one `process(items)` call on
+    a single worker thread. `process` returns one result per item.
+    """
+
+    def __init__(self, name: str, process: Callable[[List], List], max_batch: int = 32,
+                 window_ms: float = 5.0, stats: Optional[LatencyStats] = None):
+        self.name = name
+        self.process = process
+        self.max_batch = max_batch
+        self.window_s = window_ms / 1000
+        self.stats = stats or LatencyStats()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout: Optional[float] = None):
+        return self.submit(item).result(timeout)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first) -> List:
+        batch = [first]
+        deadline = time.perf_counter() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:           # shut down after this batch
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            self.stats.record_batch(len(batch))
+            try:
+                results = self.process([item for item, _ in batch])
+            except Exception:
+                # one bad request must not fail the others: fall back to one item at a time
+                for item, future in batch:
+                    try:
+                        future.set_result(self.process([item])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+# ------------------------------------------------------------------------- #
+# Backends                                                                  #
+# ------------------------------------------------------------------------- #
+class SearchBackend:
+    """BM25 over a warm LuceneSearcher; one batch_search call per micro-batch."""
+
+    def __init__(self, searcher, top_k: int = 25, threads: int = 4):
+        self.searcher = searcher
+        self.top_k = top_k
+        self.threads = threads
+
+    def __call__(self, requests: List[Dict]) -> List[List[Dict]]:
+        ks = [int(r.get("k", self.top_k)) for r in requests]
+        qids = [str(i) for i in range(len(requests))]
+        hits = self.searcher.batch_search([r["query"] for r in requests], qids, k=max(ks), threads=self.threads)
+        return [[{"docid": h.docid, "score": round(float(h.score), 4)} for h in hits.get(qid, [])[:k]]
+                for qid, k in zip(qids, ks)]
+
+
+class RerankBackend:
+    """Cross-encoder scoring; all (query, doc) pairs of a micro-batch share the forward passes."""
+
+    def __init__(self, model, tokenizer, docs=None, trace=NO_TRACE):
+        from systems.neural.rerank_luyu_hf import score_pairs
+
+        self.model = model
+        self.tokenizer = tokenizer
+        self.docs = docs
+        self.trace = trace
+        self._score_pairs = score_pairs
+
+    def __call__(self, requests: List[Dict]) -> List[List[Dict]]:
+        pairs, owners, ids = [], [], []
+        for i, r in enumerate(requests):
+            if "docs" in r:
+                docids, texts = [str(n) for n in range(len(r["docs"]))], r["docs"]
+            else:
+                if self.docs is None:
+                    raise ValueError("server has no document store; send 'docs' instead of 'docids'")
+                docids = [d for d in r["docids"] if d in self.docs]
+                self.trace.count("docs_missing", len(r["docids"]) - len(docids))
+                texts = [self.docs[d] for d in docids]
+            pairs.extend((r["query"], t) for t in texts)
+            owners.extend([i] * len(texts))
+            ids.extend(docids)
+        scores = self._score_pairs(self.model, self.tokenizer, pairs, self.trace) if pairs else []
+        rankings: List[List[Dict]] = [[] for _ in requests]
+        for i, docid, score in zip(owners, ids, scores):
+            rankings[i].append({"docid": docid, "score": round(float(score), 4)})
+        return [sorted(r, key=lambda h: h["score"], reverse=True) for r in rankings]
+
+
+# ------------------------------------------------------------------------- #
+# HTTP                                                                      #
+# ------------------------------------------------------------------------- #
+class LongEvalServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, search: Optional[SearchBackend] = None, rerank: Optional[RerankBackend] = None,
+                 max_batch: int = 32, window_ms: float = 5.0, trace=NO_TRACE):
+        self.started = time.perf_counter()
+        self.trace = trace
+        self.stats = {"search": LatencyStats(), "rerank": LatencyStats()}
+        self.batchers: Dict[str, MicroBatcher] = {}
+        super().__init__(address, _Handler)
+        if search is not None:
+            self.batchers["search"] = MicroBatcher("search", search, max_batch, window_ms, self.stats["search"])
+        if rerank is not None:
+            self.batchers["rerank"] = MicroBatcher("rerank", rerank, max_batch, window_ms, self.stats["rerank"])
+        self.top_k = search.top_k if search is not None else 25
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @staticmethod
+    def _validate(body: Dict) -> None:
+        """Reject malformed requests before they join a micro-batch (400 instead of failing the batch)."""
+        k = body.get("k")
+        if k is not None and (not isinstance(k, int) or isinstance(k, bool) or k < 1):
+            raise ValueError("'k' must be a positive integer")
+        for field in ("docids", "docs"):
+            if field in body and not (isinstance(body[field], list) and all(isinstance(x, str) for x in body[field])):
+                raise ValueError(f"'{field}' must be a list of strings")
+
+    def handle_search(self, body: Dict) -> Dict:
+        self._validate(body)
+        return {"hits": self._batcher("search")(body)}
+
+    def handle_rerank(self, body: Dict) -> Dict:
+        rerank = self._batcher("rerank")
+        self._validate(body)
+        if "docids" not in body and "docs" not in body:
+            hits = self._batcher("search")({"query": body["query"], "k": body.get("k", self.top_k)})
+            body = {"query": body["query"], "docids": [h["docid"] for h in hits]}
+        return {"ranking": rerank(body)}
+
+    def _batcher(self, name: str) -> MicroBatcher:
+        if name not in self.batchers:
+            raise LookupError(f"{name} is not enabled on this server")
+        return self.batchers[name]
+
+    def snapshot(self) -> Dict:
+        snap = {"uptime_s": round(time.perf_counter() - self.started, 1),
+                "peak_rss_mb": round(rss, 1) if (rss := peak_rss_mb()) is not None else None,
+                "endpoints": {name: s.snapshot() for name, s in self.stats.items() if s.requests}}
+        stages = getattr(self.trace, "stages", None)
+        if stages:
+            snap["stages_s"] = {name: round(s["wall_s"], 3) for name, s in stages.items()}
+        return snap
+
+    def server_close(self) -> None:
+        for batcher in self.batchers.values():
+            batcher.close()
+        super().server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # keep-alive for the load generator
+    disable_nagle_algorithm = True      # headers and body are separate writes
+    server: LongEvalServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.server.snapshot())
+        elif self.path == "/health":
+            self._reply(200, {"status": "ok", "endpoints": sorted(self.server.batchers)})
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        handlers = {"/search": self.server.handle_search, "/rerank": self.server.handle_rerank}
+        start = time.perf_counter()
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path not in handlers:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+            return
+        name = self.path.strip("/")
+        try:
+            body = json.loads(raw or b"{}")
+            if not isinstance(body.get("query"), str):
+                raise ValueError("'query' (string) is required")
+            status, payload = 200, handlers[self.path](body)
+        except LookupError as e:
+            status, payload = 503, {"error": str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            status, payload = 400, {"error": f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        latency = time.perf_counter() - start
+        self.server.stats[name].record(latency, ok=status == 200)
+        payload["latency_ms"] = round(latency * 1000, 2)
+        self._reply(status, payload)
+
+
+# ------------------------------------------------------------------------- #
+# Main                                                                      #
+# ------------------------------------------------------------------------- #
+def main(argv=None) -> None:
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    server_cfg = config.get('server', {})
+    default_docs = os.path.join(config['data']['data_dir'], config['data']['train_collection'], 'Trec', '2022-11_fr')
+
+    parser = argparse.ArgumentParser(description="Resident LongEval search + rerank server")
+    parser.add_argument("--host", default=server_cfg.get('host', '127.0.0.1'))
+    parser.add_argument("--port", type=int, default=server_cfg.get('port', 8765))
+    parser.add_argument("--index", default=config['bm25']['index_dir'])
+    parser.add_argument("--docs", default=server_cfg.get('docs_dir', default_docs), help="TREC documents for /rerank")
+    parser.add_argument("--model", default=server_cfg.get('model', 'cross-encoder/ms-marco-MiniLM-L-6-v2'))
+    parser.add_argument("--k1", type=float, default=config['bm25'].get('k1', 0.9))
+    parser.add_argument("--b", type=float, default=config['bm25'].get('b', 0.4))
+    parser.add_argument("--top_k", type=int, default=config['bm25'].get('top_k', 25))
+    parser.add_argument("--threads", type=int, default=server_cfg.get('search_threads', 4))
+    parser.add_argument("--max-batch", type=int, default=server_cfg.get('max_batch', 32))
+    parser.add_argument("--window-ms", type=float, default=server_cfg.get('batch_window_ms', 5.0))
+    parser.add_argument("--no-search", action="store_true", help="Do not start the JVM / LuceneSearcher")
+    parser.add_argument("--no-rerank", action="store_true", help="Do not load the cross-encoder")
+    args = parser.parse_args(argv)
+
+    trace = Instrumentation("server", model=args.model, max_batch=args.max_batch, window_ms=args.window_ms)
+    search = rerank = None
+    if not args.no_search:
+        print(f"⏳ loading searcher from {args.index} …")
+        with trace.stage("searcher_init"):
+            from pyserini.search.lucene import LuceneSearcher  # starts the JVM
+            searcher = LuceneSearcher(args.index)
+            searcher.set_bm25(k1=args.k1, b=args.b)
+        search = SearchBackend(searcher, top_k=args.top_k, threads=args.threads)
+    if not args.no_rerank:
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        from scripts.docstore import LazyDocStore
+        from systems.neural.rerank_luyu_hf import DEVICE
+
+        docs = None
+        if Path(args.docs).exists():
+            with trace.stage("doc_load"):
+                docs = LazyDocStore.from_trec(Path(args.docs))
+        else:
+            print(f"⚠️ no documents at {args.docs}, /rerank only accepts 'docs' texts")
+        print(f"⏳ loading {args.model} on {DEVICE} …")
+        with trace.stage("model_load"):
+            tok = AutoTokenizer.from_pretrained(args.model, use_fast=True)
+            model = AutoModelForSequenceClassification.from_pretrained(args.model).to(DEVICE).eval()
+        rerank = RerankBackend(model, tok, docs, trace)
+
+    server = LongEvalServer((args.host, args.port), search, rerank,
+                            max_batch=args.max_batch, window_ms=args.window_ms, trace=trace)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)    # `kill` stops like Ctrl+C (stats + trace)
+    print(f"✅ serving on {server.url} (window {args.window_ms} ms, max batch {args.max_batch}) – Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.snapshot(), indent=2))
+        trace.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Synthetic LongEval-shaped collection generator.
+
+Writes a small French-looking collection with the same layout as the real
+dev subset, so indexing, BM25, reranking and evaluation can be run (and
+benchmarked) without downloading anything:
+
+    <out>/French/queries.trec
+    <out>/French/LongEval Train Collection/Trec/<snapshot>_fr/*.trec
+    <out>/French/LongEval Train Collection/Trec/<snapshot>_fr/queries.trec
+    <out>/French/LongEval Train Collection/Json/<snapshot>_fr/*.json
+    <out>/French/LongEval Train Collection/qrels/<snapshot>_fr/qrels_processed.txt
+
+Documents use the `doc<N>` id scheme, qrels use the plain numeric id (as
+`scripts/evaluate.py` strips the prefix from run files).
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+# Common French words; the rest of the vocabulary is made of pseudo-words so
+# the term distribution has a realistic long tail.
+FRENCH_WORDS = [
+    "le", "la", "les", "de", "des", "du", "un", "une", "et", "en", "pour", "avec",
+    "dans", "sur", "par", "plus", "est", "sont", "pas", "qui", "que", "au", "aux",
+    "voyage", "hotel", "restaurant", "paris", "lyon", "marseille", "bordeaux",
+    "normandie", "bretagne", "tourisme", "plage", "montagne", "train", "billet",
+    "prix", "meteo", "recette", "cuisine", "fromage", "vin", "musee", "histoire",
+    "emploi", "banque", "assurance", "voiture", "location", "maison", "jardin",
+    "sante", "medecin", "pharmacie", "ecole", "universite", "formation", "sport",
+    "football", "rugby", "velo", "randonnee", "film", "musique", "concert",
+    "livre", "journal", "actualite", "politique", "economie", "impot", "retraite",
+    "mairie", "service", "public", "horaire", "adresse", "telephone", "gratuit",
+    "achat", "vente", "immobilier", "appartement", "loyer", "credit", "energie",
+    "electricite", "gaz", "internet", "mobile", "forfait", "meilleur", "cher",
+]
+SYLLABLES = ["ba", "be", "bi", "cha", "de", "di", "fa", "fe", "ga", "gu", "la",
+             "le", "li", "ma", "me", "mi", "na", "ne", "pa", "pe", "ra", "re",
+             "ri", "sa", "se", "ta", "te", "tou", "va", "ve", "zo", "ment", "tion",
+             "eur", "ette", "ique", "age", "oir"]
+
+SNAPSHOTS = ["2022-11", "2023-01"]
+
+
+def build_vocabulary(size: int, rng: random.Random) -> List[str]:
+    vocab = list(dict.fromkeys(FRENCH_WORDS))
+    seen = set(vocab)
+    while len(vocab) < size:
+        word = "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+
+def zipf_weights(n: int, s: float = 1.07) -> List[float]:
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def generate_collection(out_dir, num_docs: int = 10000, num_queries: int = 200,
+                        doc_length: int = 120, vocab_size: int = 20000,
+                        judged_per_query: int = 10, docs_per_file: int = 1000,
+                        snapshots: List[str] = None, seed: int = 42) -> Dict[str, str]:
+    """
+    Generate a synthetic collection below `out_dir`.
+
+    Every snapshot shares the same documents (lags only differ in their qrels,
+    which are re-drawn per snapshot to simulate relevance drift).
+    Returns the paths of the generated artefacts, keyed by name.
+    """
+    rng = random.Random(seed)
+    snapshots = snapshots or SNAPSHOTS
+    out_dir = Path(out_dir)
+    french_dir = out_dir / "French"
+    collection_dir = french_dir / "LongEval Train Collection"
+
+    vocab = build_vocabulary(vocab_size, rng)
+    rank = {term: i for i, term in enumerate(vocab)}
+    cum_weights = []
+    total = 0.0
+    for w in zipf_weights(len(vocab)):
+        total += w
+        cum_weights.append(total)
+
+    # --- Documents ---------------------------------------------------------- #
+    docs: List[str] = []
+    for _ in range(num_docs):
+        length = max(5, int(rng.gauss(doc_length, doc_length / 3)))
+        docs.append(" ".join(rng.choices(vocab, cum_weights=cum_weights, k=length)))
+
+    # --- Queries: built from the rarer terms of a "seed" document ----------- #
+    queries: Dict[str, str] = {}
+    seed_docs: Dict[str, int] = {}
+    for qid in range(1, num_queries + 1):
+        doc_idx = rng.randrange(num_docs)
+        terms = sorted(set(docs[doc_idx].split()), key=rank.__getitem__)[-8:]
+        query = " ".join(rng.sample(terms, k=min(len(terms), rng.randint(2, 4))))
+        queries[str(qid)] = query
+        seed_docs[str(qid)] = doc_idx
+
+    # --- Write queries ------------------------------------------------------ #
+    french_dir.mkdir(parents=True, exist_ok=True)
+    queries_text = "".join(
+        f"<top>\n<num>Number: {qid}</num>\n<title>{text}\n</top>\n\n"
+        for qid, text in queries.items()
+    )
+    (french_dir / "queries.trec").write_text(queries_text, encoding="utf-8")
+
+    paths = {"data_dir": str(french_dir), "queries": str(french_dir / "queries.trec")}
+
+    for snapshot in snapshots:
+        trec_dir = collection_dir / "Trec" / f"{snapshot}_fr"
+        json_dir = collection_dir / "Json" / f"{snapshot}_fr"
+        qrels_dir = collection_dir / "qrels" / f"{snapshot}_fr"
+        for d in (trec_dir, json_dir, qrels_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+        (trec_dir / "queries.trec").write_text(queries_text, encoding="utf-8")
+
+        for file_no, start in enumerate(range(0, num_docs, docs_per_file)):
+            chunk = range(start, min(start + docs_per_file, num_docs))
+            with open(trec_dir / f"collector_kodicare_{file_no}.txt.trec", "w", encoding="utf-8") as f:
+                for i in chunk:
+                    f.write(f"<DOC>\n<DOCNO>doc{i}</DOCNO>\n<TEXT>\n{docs[i]}\n</TEXT>\n</DOC>\n")
+            with open(json_dir / f"collector_kodicare_{file_no}.json", "w", encoding="utf-8") as f:
+                json.dump([{"id": f"doc{i}", "contents": docs[i]} for i in chunk], f, ensure_ascii=False)
+
+        with open(qrels_dir / "qrels_processed.txt", "w") as f:
+            for qid in queries:
+                judged = {seed_docs[qid]: 2}
+                while len(judged) < min(judged_per_query, num_docs):
+                    judged.setdefault(rng.randrange(num_docs), rng.choice([0, 0, 0, 1]))
+                for doc_idx, rel in judged.items():
+                    f.write(f"{qid} 0 {doc_idx} {rel}\n")
+
+        paths[f"trec_{snapshot}"] = str(trec_dir)
+        paths[f"json_{snapshot}"] = str(json_dir)
+        paths[f"qrels_{snapshot}"] = str(qrels_dir / "qrels_processed.txt")
+
+    print(f"✅ Synthetic collection ({num_docs} docs, {num_queries} queries) written to {out_dir}")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic LongEval-shaped French collection")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--num-docs", type=int, default=10000, help="Number of documents")
+    parser.add_argument("--num-queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--doc-length", type=int, default=120, help="Mean document length in tokens")
+    parser.add_argument("--vocab-size", type=int, default=20000, help="Vocabulary size")
+    parser.add_argument("--judged-per-query", type=int, default=10, help="Qrels entries per query")
+    parser.add_argument("--docs-per-file", type=int, default=1000, help="Documents per TREC/JSON file")
+    parser.add_argument("--snapshots", default=",".join(SNAPSHOTS), help="Comma-separated snapshots, e.g. 2022-11,2023-01")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+
+    args = parser.parse_args()
+    generate_collection(args.output, args.num_docs, args.num_queries, args.doc_length,
+                        args.vocab_size, args.judged_per_query, args.docs_per_file,
+                        args.snapshots.split(","), args.seed)
@@ -1,6 +1,11 @@
 import pandas as pd
-from pyserini.search.lucene import LuceneSearcher
 import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.instrumentation import Instrumentation
 
 # BM25 baseline + traditional model as a class
 # based on script/search.py + instructions in Word
@@ -12,10 +17,12 @@ class BM25Baseline:
     run_id = 'bm25-baseline+traditional'
 
 
-    def __init__(self, index_path: str, queries_file_path: str, run_file_path: str):
+    def __init__(self, index_path: str, queries_file_path: str, run_file_path: str, language: str = None):
         self.index_path = index_path
         self.queries_file_path = queries_file_path
         self.run_file_path = run_file_path
+        # analyzer of the index: None = Pyserini default (English), 'fr' for the Java IndexBuilder (FrenchAnalyzer)
+        self.language = language
 
     def parse_queries(self) -> pd.DataFrame:
         # Parse queries.trec manually
@@ -35,10 +42,18 @@ class BM25Baseline:
         return pd.DataFrame(queries)
 
     def run_search(self, k1, b, top_k):
+        trace = Instrumentation("bm25_baseline", k1=k1, b=b, top_k=top_k, language=self.language,
+                                run_file=self.run_file_path)
+
         # Load searcher
-        searcher = LuceneSearcher(self.index_path)
+        with trace.stage("searcher_init"):
+            from pyserini.search.lucene import LuceneSearcher  # starts the JVM
+            searcher = LuceneSearcher(self.index_path)
+            if self.language:
+                searcher.set_language(self.language)
 
-        queries_df = self.parse_queries()
+        with trace.stage("query_parse"):
+            queries_df = self.parse_queries()
 
         # Set BM25 parameters (if not set, they stay at k1 = 0.9, b = 0.4)
         searcher.set_bm25(k1=k1, b=b)
@@ -50,9 +65,14 @@ class BM25Baseline:
         with open(self.run_file_path, 'w') as f_out:
             for _, row in queries_df.iterrows():
                 qid, query = str(row.qid), row.query
-                hits = searcher.search(query, k=top_k)
-                for rank, hit in enumerate(hits):
-                    docid = hit.docid
-                    f_out.write(f"{qid} Q0 {docid} {rank+1} {hit.score:.4f} {self.run_id}\n")
+                with trace.stage("search"):
+                    hits = searcher.search(query, k=top_k)
+                with trace.stage("write"):
+                    for rank, hit in enumerate(hits):
+                        docid = hit.docid
+                        f_out.write(f"{qid} Q0 {docid} {rank+1} {hit.score:.4f} {self.run_id}\n")
+                trace.count("queries")
+                trace.count("hits", len(hits))
 
+        trace.close()
         print(f"✅ Test run written to {self.run_file_path}")
\ No newline at end of file
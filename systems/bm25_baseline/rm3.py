@@ -0,0 +1,320 @@
+"""
+BM25 + RM3-style pseudo-relevance feedback.
+
+1. First pass: BM25 top-`fb_docs` for all queries via `LuceneSearcher.batch_search`.
+2. The term vectors of all feedback documents are read once from the index
+   (`--storeDocvectors`, see scripts/build_index.py); a document shared by
+   several queries is fetched only once. A missing vector is an error, not an
+   empty feedback set. For a Java IndexBuilder index pass `--language fr` so
+   queries go through the same FrenchAnalyzer as the documents.
+3. The relevance model of every query is accumulated in one vectorised pass:
+   each document vector is L1-normalised, weighted with the document's BM25
+   score and summed per (query, term); the top-`fb_terms` terms are kept and
+   L1-normalised again.
+4. Second pass: original query terms (weight `original_query_weight`) and
+   feedback terms (weight 1 - `original_query_weight`) as a boosted Lucene
+   BooleanQuery.
+
+Feedback term sets are cached per (query, fb_docs, fb_terms), so sweeping
+`original_query_weight` only repeats step 4. With `cache_file` set the cache
+is kept on disk; it is discarded automatically if the index (path or Lucene commit)
+or the BM25 parameters change.
+
+    python systems/bm25_baseline/rm3.py --weights 0.3,0.5,0.7
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from scripts.build_index import INDEX_LANGUAGE
+from scripts.instrumentation import Instrumentation
+from systems.bm25_baseline.bm25_baseline import BM25Baseline
+
+FeedbackTerms = Dict[str, float]
+
+
+def keep_term(term: str) -> bool:
+    """Same filter as Anserini's RM3: 2-20 characters, letters/digits only."""
+    return 2 <= len(term) <= 20 and term.isalnum()
+
+
+def relevance_model(pair_query: np.ndarray, pair_doc: np.ndarray, pair_score: np.ndarray,
+                    indptr: np.ndarray, term_ids: np.ndarray, term_weights: np.ndarray,
+                    n_terms: int, fb_terms: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Accumulate feedback term weights for many queries at once.
+
+    (pair_query[i], pair_doc[i], pair_score[i]) are the first-pass hits; the
+    document vectors are in CSR form (indptr, term_ids, term_weights) with
+    L1-normalised weights. Returns (query, term, weight) arrays sorted by query
+    and descending weight, at most `fb_terms` entries per query, L1-normalised.
+    """
+    starts, lengths = indptr[pair_doc], indptr[pair_doc + 1] - indptr[pair_doc]
+    total = int(lengths.sum())
+    if total == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    # positions of all (hit, term) entries: start of the hit's vector + offset inside it
+    first = np.cumsum(lengths) - lengths
+    pos = np.repeat(starts - first, lengths) + np.arange(total)
+
+    keys = np.repeat(pair_query.astype(np.int64), lengths) * n_terms + term_ids[pos]
+    weights = term_weights[pos] * np.repeat(pair_score, lengths)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    weights = np.bincount(inverse, weights=weights)
+    queries, terms = keys // n_terms, keys % n_terms
+
+    order = np.lexsort((-weights, queries))
+    queries, terms, weights = queries[order], terms[order], weights[order]
+    rank = np.arange(len(queries)) - np.searchsorted(queries, queries, side="left")
+    keep = rank < fb_terms
+    queries, terms, weights = queries[keep], terms[keep], weights[keep]
+
+    norm = np.bincount(queries, weights=weights, minlength=int(queries.max()) + 1)
+    return queries, terms, weights / norm[queries]
+
+
+def index_fingerprint(index_path: str) -> Dict:
+    """Current Lucene commit of an index: segments_N file name, its size and mtime."""
+    names = [n for n in os.listdir(index_path) if n.startswith("segments_")]
+    if not names:
+        return {}
+    latest = max(names, key=lambda n: int(n[len("segments_"):], 36))     # generation is base 36
+    stat = os.stat(os.path.join(index_path, latest))
+    return {"segments": latest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class FeedbackCache:
+    """(query, fb_docs, fb_terms) -> {term: weight}, optionally persisted as JSON."""
+
+    def __init__(self, path: Optional[str] = None, context: Optional[Dict] = None):
+        self.path = path
+        self.context = context or {}
+        self.entries: Dict[str, FeedbackTerms] = {}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            if stored.get("context") == self.context:
+                self.entries = stored.get("entries", {})
+            else:
+                print(f"⚠️ feedback cache {path} was built with other settings, starting empty")
+
+    @staticmethod
+    def key(query: str, fb_docs: int, fb_terms: int) -> str:
+        return f"{fb_docs}|{fb_terms}|{query}"
+
+    def get(self, query: str, fb_docs: int, fb_terms: int) -> Optional[FeedbackTerms]:
+        return self.entries.get(self.key(query, fb_docs, fb_terms))
+
+    def put(self, query: str, fb_docs: int, fb_terms: int, terms: FeedbackTerms) -> None:
+        self.entries[self.key(query, fb_docs, fb_terms)] = terms
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({"context": self.context, "entries": self.entries}, f)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class BM25RM3(BM25Baseline):
+    """
+    BM25 with RM3-style query expansion from stored document vectors
+    """
+    run_id = 'bm25-rm3'
+
+    def __init__(self, index_path: str, queries_file_path: str, run_file_path: str,
+                 cache_file: Optional[str] = None, language: Optional[str] = None):
+        super().__init__(index_path, queries_file_path, run_file_path, language)
+        self.cache_file = cache_file
+        self.cache: Optional[FeedbackCache] = None
+        self._searcher = None
+        self._reader = None
+        self._analyzer = None       # query analyzer of the index (None = reader default)
+        self._bm25 = None
+
+    def _open(self, k1, b, trace) -> None:
+        """Open searcher and index reader once; reused across expansion weights."""
+        with trace.stage("searcher_init"):
+            if self._searcher is None:
+                from pyserini.index.lucene import LuceneIndexReader  # starts the JVM
+                from pyserini.search.lucene import LuceneSearcher
+                self._searcher = LuceneSearcher(self.index_path)
+                self._reader = LuceneIndexReader(self.index_path)
+                if self.language:
+                    from pyserini.analysis import get_lucene_analyzer
+                    self._searcher.set_language(self.language)
+                    self._analyzer = get_lucene_analyzer(language=self.language)
+            if self._bm25 != (float(k1), float(b)):
+                self._searcher.set_bm25(k1=float(k1), b=float(b))
+                self._bm25 = (float(k1), float(b))
+                # a corpus rebuilt into the same directory is a new commit (and usually a new doc count)
+                context = {"index": os.path.abspath(self.index_path), "k1": float(k1), "b": float(b),
+                           "commit": index_fingerprint(self.index_path), "docs": self._searcher.num_docs}
+                if self.language:
+                    context["language"] = self.language
+                self.cache = FeedbackCache(self.cache_file, context)
+
+    def feedback(self, queries: List[Tuple[str, str]], fb_docs: int, fb_terms: int,
+                 threads: int, trace) -> Dict[str, FeedbackTerms]:
+        """Feedback terms for every (qid, query); only cache misses are searched."""
+        result: Dict[str, FeedbackTerms] = {}
+        todo: List[Tuple[str, str]] = []
+        pending = set()
+        for qid, query in queries:
+            cached = self.cache.get(query, fb_docs, fb_terms)
+            if cached is not None:
+                result[qid] = cached
+            elif query not in pending:
+                pending.add(query)
+                todo.append((qid, query))
+        trace.count("feedback_cache_hits", len(result))
+        if todo:
+            with trace.stage("feedback_search"):
+                hits = self._searcher.batch_search([q for _, q in todo], [qid for qid, _ in todo],
+                                                   k=fb_docs, threads=threads)
+
+            # one document vector per distinct feedback document, in CSR form
+            with trace.stage("docvectors"):
+                doc_slot: Dict[str, int] = {}
+                term_slot: Dict[str, int] = {}
+                vocab: List[str] = []
+                indptr, term_ids, term_weights = [0], [], []
+                pair_query, pair_doc, pair_score = [], [], []
+                for row, (qid, _) in enumerate(todo):
+                    for hit in hits.get(qid, []):
+                        if hit.docid not in doc_slot:
+                            vector = self._reader.get_document_vector(hit.docid)
+                            if vector is None:
+                                raise RuntimeError(
+                                    f"no document vector for {hit.docid} in {self.index_path}: RM3 needs term "
+                                    "vectors (pyserini --storeDocvectors, java IndexBuilder stores them on contents)")
+                            vector = {t: tf for t, tf in vector.items() if keep_term(t)}
+                            length = sum(vector.values()) or 1
+                            for term, tf in vector.items():
+                                if term not in term_slot:
+                                    term_slot[term] = len(vocab)
+                                    vocab.append(term)
+                                term_ids.append(term_slot[term])
+                                term_weights.append(tf / length)
+                            indptr.append(len(term_ids))
+                            doc_slot[hit.docid] = len(doc_slot)
+                        pair_query.append(row)
+                        pair_doc.append(doc_slot[hit.docid])
+                        pair_score.append(hit.score)
+                trace.count("feedback_docvectors", len(doc_slot))
+                trace.count("feedback_hits", len(pair_doc))
+
+            with trace.stage("accumulate"):
+                rows, terms, weights = relevance_model(
+                    np.asarray(pair_query, dtype=np.int64), np.asarray(pair_doc, dtype=np.int64),
+                    np.asarray(pair_score, dtype=np.float64), np.asarray(indptr, dtype=np.int64),
+                    np.asarray(term_ids, dtype=np.int64), np.asarray(term_weights, dtype=np.float64),
+                    max(len(vocab), 1), fb_terms)
+                expanded: List[FeedbackTerms] = [{} for _ in todo]
+                for row, term, weight in zip(rows.tolist(), terms.tolist(), weights.tolist()):
+                    expanded[row][vocab[term]] = weight
+                for (qid, query), terms_ in zip(todo, expanded):
+                    self.cache.put(query, fb_docs, fb_terms, terms_)
+        for qid, query in queries:
+            result.setdefault(qid, self.cache.get(query, fb_docs, fb_terms))
+        return result
+
+    def expanded_query(self, query: str, feedback: FeedbackTerms, original_query_weight: float):
+        """Interpolate the (analysed) original query with its feedback terms as a boosted BooleanQuery."""
+        from pyserini.search.lucene import querybuilder
+
+        original: Dict[str, float] = {}
+        for term in self._reader.analyze(query, analyzer=self._analyzer):
+            original[term] = original.get(term, 0.0) + 1.0
+        norm = sum(original.values()) or 1.0
+        weights = {t: original_query_weight * w / norm for t, w in original.items()}
+        for term, w in feedback.items():
+            weights[term] = weights.get(term, 0.0) + (1.0 - original_query_weight) * w
+
+        # terms are already analysed index terms: build TermQuerys directly instead of re-analysing them
+        should = querybuilder.JBooleanClauseOccur.should.value
+        builder = querybuilder.get_boolean_query_builder()
+        for term, w in weights.items():
+            if w > 0:
+                term_query = querybuilder.JTermQuery(querybuilder.JTerm("contents", term))
+                builder.add(querybuilder.get_boost_query(term_query, w), should)
+        return builder.build()
+
+    def run_search(self, k1, b, top_k, fb_docs=10, fb_terms=10, original_query_weight=0.5, threads=4):
+        trace = Instrumentation("bm25_rm3", k1=k1, b=b, top_k=top_k, fb_docs=fb_docs, fb_terms=fb_terms,
+                                original_query_weight=original_query_weight, language=self.language,
+                                run_file=self.run_file_path)
+        self._open(k1, b, trace)
+
+        with trace.stage("query_parse"):
+            queries_df = self.parse_queries()
+            queries = [(str(row.qid), row.query) for _, row in queries_df.iterrows()]
+
+        feedback = self.feedback(queries, fb_docs, fb_terms, threads, trace)
+        with trace.stage("cache_save"):
+            self.cache.save()
+
+        # Create runs/ output directory if missing
+        os.makedirs(os.path.dirname(self.run_file_path), exist_ok=True)
+
+        # Write results in TREC format
+        with open(self.run_file_path, 'w') as f_out:
+            for qid, query in queries:
+                with trace.stage("expand"):
+                    jquery = self.expanded_query(query, feedback[qid], original_query_weight)
+                with trace.stage("search"):
+                    hits = self._searcher.search(jquery, k=top_k)
+                with trace.stage("write"):
+                    for rank, hit in enumerate(hits):
+                        f_out.write(f"{qid} Q0 {hit.docid} {rank+1} {hit.score:.4f} {self.run_id}\n")
+                trace.count("queries")
+                trace.count("hits", len(hits))
+
+        trace.close()
+        print(f"✅ RM3 run written to {self.run_file_path}")
+
+
+def main(argv=None):
+    config_path = os.path.join(PROJECT_ROOT, 'scripts', 'config.yml')
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    rm3 = config.get('rm3', {})
+
+    parser = argparse.ArgumentParser(description="BM25 + RM3 pseudo-relevance feedback")
+    parser.add_argument("--index", default=config['bm25']['index_dir'])
+    parser.add_argument("--queries", default=os.path.join(config['data']['data_dir'], config['data']['queries_file']))
+    parser.add_argument("--output_dir", default=config['general']['output_dir'])
+    parser.add_argument("--k1", type=float, default=config['bm25'].get('k1', 0.9))
+    parser.add_argument("--b", type=float, default=config['bm25'].get('b', 0.4))
+    parser.add_argument("--top_k", type=int, default=config['bm25'].get('top_k', 25))
+    parser.add_argument("--fb-docs", type=int, default=rm3.get('fb_docs', 10))
+    parser.add_argument("--fb-terms", type=int, default=rm3.get('fb_terms', 10))
+    parser.add_argument("--weights", default=str(rm3.get('original_query_weight', 0.5)),
+                        help="Comma-separated original query weights; one run file per weight")
+    parser.add_argument("--cache", default=rm3.get('cache_file'), help="JSON feedback cache (optional)")
+    parser.add_argument("--threads", type=int, default=rm3.get('threads', 4))
+    parser.add_argument("--language", default=INDEX_LANGUAGE[config.get('index_builder', {}).get('backend', 'pyserini')],
+                        help="Analyzer of the index ('fr' for the Java IndexBuilder; default: from index_builder.backend)")
+    args = parser.parse_args(argv)
+
+    system = BM25RM3(args.index, args.queries, "", cache_file=args.cache, language=args.language)
+    for weight in [float(w) for w in args.weights.split(",")]:
+        system.run_file_path = os.path.join(args.output_dir, f"run_bm25_rm3_w{weight:g}.txt")
+        system.run_search(k1=args.k1, b=args.b, top_k=args.top_k, fb_docs=args.fb_docs,
+                          fb_terms=args.fb_terms, original_query_weight=weight, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
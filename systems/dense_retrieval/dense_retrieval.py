@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dense retrieval (representation learning model) for LongEval WebRetrieval.
+
+* encodes the JSON collection with a HuggingFace encoder (mean pooling, L2-normalised)
+* stores the embeddings as a memory-mapped float16 matrix, written in resumable shards
+* exact search: chunked matmul over the matrix + argpartition top-k, many queries at once
+* optional IVF index (k-means clusters) for sub-linear search
+* writes the run in TREC format, like BM25Baseline
+
+Index layout (<index_dir>/):
+    manifest.json        model, dim, shard size, completed shards
+    shards/              shard_00000.npy + shard_00000.ids.npy, ... (while encoding)
+    embeddings.npy       (N, dim) float16, memory-mapped at search time
+    docids.npy           (N,) int64, normalised docids (doc123 -> 123)
+    ivf_*.npy            centroids, row order and list offsets (optional)
+
+Usage:
+    python systems/dense_retrieval/dense_retrieval.py encode
+    python systems/dense_retrieval/dense_retrieval.py build-ivf --lists 1024
+    python systems/dense_retrieval/dense_retrieval.py search --nprobe 32
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import yaml
+from tqdm import tqdm
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from scripts.docstore import normalize_docid
+from scripts.instrumentation import Instrumentation, NO_TRACE
+
+CFG_PATH = PROJECT_ROOT / "scripts" / "config.yml"
+
+
+# --------------------------------------------------------------------------- #
+# Encoder                                                                     #
+# --------------------------------------------------------------------------- #
+class Encoder:
+    """HuggingFace encoder with mean pooling and L2 normalisation."""
+
+    def __init__(self, model, tokenizer, device: str = "cpu", max_length: int = 256,
+                 batch_size: int = 64, name: str = "custom"):
+        self.model, self.tokenizer = model, tokenizer
+        self.device, self.max_length, self.batch_size, self.name = device, max_length, batch_size, name
+
+    @classmethod
+    def from_pretrained(cls, model_name: str, device: Optional[str] = None, **kwargs) -> "Encoder":
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        device = device or ("cuda" if torch.cuda.is_available()
+                            else ("mps" if torch.backends.mps.is_available() else "cpu"))
+        model = AutoModel.from_pretrained(
+            model_name, torch_dtype=torch.float16 if device == "cuda" else None
+        ).to(device).eval()
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        return cls(model, tokenizer, device=device, name=model_name, **kwargs)
+
+    @property
+    def dim(self) -> int:
+        return self.model.config.hidden_size
+
+    def encode(self, texts: List[str], trace=NO_TRACE) -> np.ndarray:
+        """(len(texts), dim) float32, unit length rows."""
+        import torch
+
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i in range(0, len(texts), self.batch_size):
+            with trace.stage("tokenize"):
+                enc = self.tokenizer(texts[i:i + self.batch_size], padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="pt").to(self.device)
+            trace.count_padding(enc["attention_mask"])
+            with trace.stage("forward"), torch.no_grad():
+                hidden = self.model(**enc).last_hidden_state
+                mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1)
+                pooled = torch.nn.functional.normalize(pooled.float(), dim=-1)
+                out[i:i + len(pooled)] = pooled.cpu().numpy()
+        return out
+
+
+# --------------------------------------------------------------------------- #
+# Index                                                                       #
+# --------------------------------------------------------------------------- #
+def iter_json_docs(corpus_dir: Path) -> Iterator[Tuple[str, str]]:
+    """Yield (docid, contents) from the JSON collection in a stable order."""
+    for fp in sorted(Path(corpus_dir).rglob("*.json")):
+        with fp.open(encoding="utf-8") as f:
+            data = json.load(f)
+        for doc in data if isinstance(data, list) else [data]:
+            yield doc["id"], doc.get("contents", "")
+
+
+def topk_merge(best_scores: np.ndarray, best_rows: np.ndarray,
+               scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge (Q, k) running top-k with (Q, m) new candidates; results are unsorted."""
+    all_scores = np.concatenate([best_scores, scores], axis=1)
+    all_rows = np.concatenate([best_rows, rows], axis=1)
+    if all_scores.shape[1] <= k:
+        return all_scores, all_rows
+    idx = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(all_scores, idx, 1), np.take_along_axis(all_rows, idx, 1)
+
+
+class DenseIndex:
+    """Memory-mapped float16 embedding matrix with exact and IVF top-k search."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = Path(index_dir)
+        self.shard_dir = self.index_dir / "shards"
+        self.manifest_path = self.index_dir / "manifest.json"
+        self._embeddings = None
+        self._docids = None
+
+    # ------------------------------------------------------------------ #
+    # Encoding                                                           #
+    # ------------------------------------------------------------------ #
+    def _load_manifest(self) -> Dict:
+        if self.manifest_path.exists():
+            return json.loads(self.manifest_path.read_text())
+        return {}
+
+    def _save_manifest(self, manifest: Dict) -> None:
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(manifest, indent=2))
+        os.replace(tmp, self.manifest_path)
+
+    def encode_corpus(self, corpus_dir: str, encoder: Encoder, shard_size: int = 50000,
+                      trace=NO_TRACE) -> None:
+        """
+        Encode the collection shard by shard. Every finished shard is recorded in
+        the manifest, so an interrupted run resumes at the first missing shard.
+        """
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self._load_manifest()
+        expected = {"model": encoder.name, "dim": encoder.dim, "max_length": encoder.max_length,
+                    "shard_size": shard_size, "corpus": str(corpus_dir)}
+        if manifest.get("settings", expected) != expected:
+            raise ValueError(f"{self.index_dir} was encoded with {manifest['settings']}, "
+                             f"not {expected}; use another index directory")
+        if manifest.get("complete"):
+            print(f"✅ Index at {self.index_dir} is already complete")
+            return
+        done = set(manifest.get("shards", []))
+        manifest.update(settings=expected, shards=sorted(done), complete=False)
+        self._save_manifest(manifest)
+        if done:
+            print(f"↩️  resuming, {len(done)} shard(s) already encoded")
+
+        def flush(shard_no: int, ids: List[int], texts: List[str]) -> None:
+            emb = encoder.encode(texts, trace=trace).astype(np.float16)
+            with trace.stage("write"):
+                base = self.shard_dir / f"shard_{shard_no:05d}"
+                np.save(f"{base}.tmp.npy", emb)
+                np.save(f"{base}.ids.tmp.npy", np.asarray(ids, dtype=np.int64))
+                os.replace(f"{base}.tmp.npy", f"{base}.npy")
+                os.replace(f"{base}.ids.tmp.npy", f"{base}.ids.npy")
+            manifest["shards"] = sorted(set(manifest["shards"]) | {shard_no})
+            self._save_manifest(manifest)
+            trace.count("docs_encoded", len(ids))
+
+        ids: List[int] = []
+        texts: List[str] = []
+        shard_no = 0
+        for n, (docid, text) in enumerate(tqdm(iter_json_docs(corpus_dir), desc="🧮 encoding")):
+            shard_no = n // shard_size
+            if shard_no in done:
+                continue
+            ids.append(normalize_docid(docid))
+            texts.append(text)
+            if len(ids) == shard_size:
+                flush(shard_no, ids, texts)
+                ids, texts = [], []
+        if ids:
+            flush(shard_no, ids, texts)
+        self.finalize()
+
+    def finalize(self) -> None:
+        """Concatenate the shards into embeddings.npy / docids.npy and drop them."""
+        manifest = self._load_manifest()
+        shards = sorted(manifest["shards"])
+        sizes = [len(np.load(self.shard_dir / f"shard_{s:05d}.ids.npy", mmap_mode="r")) for s in shards]
+        dim = manifest["settings"]["dim"]
+        emb = np.lib.format.open_memmap(self.index_dir / "embeddings.npy", mode="w+",
+                                        dtype=np.float16, shape=(sum(sizes), dim))
+        docids = np.empty(sum(sizes), dtype=np.int64)
+        pos = 0
+        for s, size in zip(shards, sizes):
+            base = self.shard_dir / f"shard_{s:05d}"
+            emb[pos:pos + size] = np.load(f"{base}.npy", mmap_mode="r")
+            docids[pos:pos + size] = np.load(f"{base}.ids.npy")
+            pos += size
+        emb.flush()
+        del emb
+        np.save(self.index_dir / "docids.npy", docids)
+        for s in shards:
+            for suffix in (".npy", ".ids.npy"):
+                (self.shard_dir / f"shard_{s:05d}{suffix}").unlink()
+        self.shard_dir.rmdir()
+        manifest["complete"] = True
+        manifest["num_docs"] = int(len(docids))
+        self._save_manifest(manifest)
+        print(f"✅ Dense index with {len(docids):,} documents written to {self.index_dir}")
+
+    # ------------------------------------------------------------------ #
+    # Search                                                             #
+    # ------------------------------------------------------------------ #
+    @property
+    def embeddings(self) -> np.ndarray:
+        if self._embeddings is None:
+            self._embeddings = np.load(self.index_dir / "embeddings.npy", mmap_mode="r")
+        return self._embeddings
+
+    @property
+    def docids(self) -> np.ndarray:
+        if self._docids is None:
+            self._docids = np.load(self.index_dir / "docids.npy")
+        return self._docids
+
+    def search(self, queries: np.ndarray, k: int, chunk_size: int = 16384,
+               query_batch: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact inner-product top-k for (Q, dim) query embeddings.
+        Returns (Q, k) scores and row indices, sorted by descending score.
+        """
+        emb = self.embeddings
+        k = min(k, len(emb))
+        all_scores = np.empty((len(queries), k), dtype=np.float32)
+        all_rows = np.empty((len(queries), k), dtype=np.int64)
+        for q0 in range(0, len(queries), query_batch):
+            q = np.ascontiguousarray(queries[q0:q0 + query_batch], dtype=np.float32)
+            best_scores = np.empty((len(q), 0), dtype=np.float32)
+            best_rows = np.empty((len(q), 0), dtype=np.int64)
+            for start in range(0, len(emb), chunk_size):
+                chunk = np.asarray(emb[start:start + chunk_size], dtype=np.float32)
+                scores = q @ chunk.T                                    # (Q, chunk)
+                kk = min(k, scores.shape[1])
+                idx = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+                best_scores, best_rows = topk_merge(best_scores, best_rows,
+                                                    np.take_along_axis(scores, idx, 1), idx + start, k)
+            order = np.argsort(-best_scores, axis=1)
+            all_scores[q0:q0 + len(q)] = np.take_along_axis(best_scores, order, 1)
+            all_rows[q0:q0 + len(q)] = np.take_along_axis(best_rows, order, 1)
+        return all_scores, all_rows
+
+    # ------------------------------------------------------------------ #
+    # IVF                                                                #
+    # ------------------------------------------------------------------ #
+    def build_ivf(self, n_lists: int, sample_size: int = 100000, iterations: int = 10,
+                  chunk_size: int = 65536, seed: int = 42) -> None:
+        """Spherical k-means on a sample, then assign every row to its nearest centroid."""
+        emb = self.embeddings
+        rng = np.random.default_rng(seed)
+        n_lists = min(n_lists, len(emb))
+        sample = np.asarray(emb[np.sort(rng.choice(len(emb), min(sample_size, len(emb)), replace=False))],
+                            dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in tqdm(range(iterations), desc="🧭 k-means"):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]   # re-seed empty lists
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(min=1e-12)
+
+        assign = np.empty(len(emb), dtype=np.int64)
+        for start in range(0, len(emb), chunk_size):
+            chunk = np.asarray(emb[start:start + chunk_size], dtype=np.float32)
+            assign[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        np.save(self.index_dir / "ivf_centroids.npy", centroids.astype(np.float32))
+        np.save(self.index_dir / "ivf_order.npy", order)
+        np.save(self.index_dir / "ivf_offsets.npy", offsets)
+        print(f"✅ IVF index with {n_lists} lists written to {self.index_dir}")
+
+    def search_ivf(self, queries: np.ndarray, k: int, nprobe: int = 16) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k: each query only scores the rows of its `nprobe` closest
+        lists. Queries probing the same list are scored together in one matmul.
+        """
+        centroids = np.load(self.index_dir / "ivf_centroids.npy")
+        order = np.load(self.index_dir / "ivf_order.npy", mmap_mode="r")
+        offsets = np.load(self.index_dir / "ivf_offsets.npy")
+        emb = self.embeddings
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        nprobe = min(nprobe, len(centroids))
+
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]   # (Q, nprobe)
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+
+        # invert (query -> lists) into (list -> queries)
+        flat_lists = probes.ravel()
+        flat_queries = np.repeat(np.arange(len(queries)), nprobe)
+        by_list = np.argsort(flat_lists, kind="stable")
+        bounds = np.searchsorted(flat_lists[by_list], np.arange(len(centroids) + 1))
+        for lst in range(len(centroids)):
+            q_idx = flat_queries[by_list[bounds[lst]:bounds[lst + 1]]]
+            if len(q_idx) == 0 or offsets[lst] == offsets[lst + 1]:
+                continue
+            rows = np.sort(order[offsets[lst]:offsets[lst + 1]])
+            scores = queries[q_idx] @ np.asarray(emb[rows], dtype=np.float32).T   # (q, rows)
+            kk = min(k, len(rows))
+            idx = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            merged_scores, merged_rows = topk_merge(best_scores[q_idx], best_rows[q_idx],
+                                                    np.take_along_axis(scores, idx, 1), rows[idx], k)
+            best_scores[q_idx], best_rows[q_idx] = merged_scores, merged_rows
+        ranking = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, ranking, 1), np.take_along_axis(best_rows, ranking, 1)
+
+    @property
+    def has_ivf(self) -> bool:
+        return (self.index_dir / "ivf_centroids.npy").exists()
+
+
+# --------------------------------------------------------------------------- #
+# Retrieval system                                                            #
+# --------------------------------------------------------------------------- #
+class DenseRetrieval:
+    """
+    Class implementing the dense (representation learning) model
+    """
+    run_id = 'dense'
+
+    def __init__(self, index_path: str, queries_file_path: str, run_file_path: str, encoder: Encoder):
+        self.index = DenseIndex(index_path)
+        self.queries_file_path = queries_file_path
+        self.run_file_path = run_file_path
+        self.encoder = encoder
+
+    def parse_queries(self) -> Dict[str, str]:
+        mapping, qid = {}, None
+        with open(self.queries_file_path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith('<num>'):
+                    qid = line.replace('<num>', '').replace('</num>', '').replace('Number:', '').strip()
+                elif line.startswith('<title>'):
+                    mapping[qid] = line.replace('<title>', '').strip()
+        return mapping
+
+    def run_search(self, top_k: int, nprobe: Optional[int] = None, chunk_size: int = 16384) -> None:
+        """Exact search, or IVF search with `nprobe` lists if an IVF index exists."""
+        use_ivf = nprobe is not None and self.index.has_ivf
+        trace = Instrumentation("dense_retrieval", top_k=top_k, nprobe=nprobe if use_ivf else None,
+                                model=self.encoder.name)
+        with trace.stage("query_parse"):
+            queries = self.parse_queries()
+        qids = list(queries)
+        query_emb = self.encoder.encode([queries[q] for q in qids], trace=trace)
+        with trace.stage("search"):
+            if use_ivf:
+                scores, rows = self.index.search_ivf(query_emb, top_k, nprobe=nprobe)
+            else:
+                scores, rows = self.index.search(query_emb, top_k, chunk_size=chunk_size)
+        trace.count("queries", len(qids))
+
+        os.makedirs(os.path.dirname(self.run_file_path) or ".", exist_ok=True)
+        docids = self.index.docids
+        with trace.stage("write"), open(self.run_file_path, 'w') as f_out:
+            for qid, q_scores, q_rows in zip(qids, scores, rows):
+                for rank, (score, row) in enumerate(zip(q_scores, q_rows), 1):
+                    if row < 0:
+                        break
+                    f_out.write(f"{qid} Q0 {docids[row]} {rank} {score:.4f} {self.run_id}\n")
+        trace.close()
+        print(f"✅ Dense run written to {self.run_file_path}")
+
+
+# --------------------------------------------------------------------------- #
+# Main                                                                        #
+# --------------------------------------------------------------------------- #
+def main() -> None:
+    cfg = yaml.safe_load(CFG_PATH.read_text())
+    dense = cfg.get("dense", {})
+    data_dir = Path(cfg["data"]["data_dir"])
+
+    parser = argparse.ArgumentParser(description="Dense retrieval for LongEval WebRetrieval")
+    parser.add_argument("command", choices=["encode", "build-ivf", "search"])
+    parser.add_argument("--corpus", default=str(data_dir / cfg["data"]["train_collection"] / "Json" / "2022-11_fr"),
+                        help="JSON collection to encode")
+    parser.add_argument("--index", default=dense.get("index_dir", "./index/dense/"), help="Dense index directory")
+    parser.add_argument("--model", default=dense.get("model"), help="HuggingFace encoder")
+    parser.add_argument("--batch-size", type=int, default=dense.get("batch_size", 64))
+    parser.add_argument("--max-length", type=int, default=dense.get("max_length", 256))
+    parser.add_argument("--shard-size", type=int, default=dense.get("shard_size", 50000))
+    parser.add_argument("--lists", type=int, default=dense.get("ivf_lists", 1024), help="IVF lists")
+    parser.add_argument("--nprobe", type=int, default=None, help="Search the IVF index with this many lists")
+    parser.add_argument("--queries", default=str(data_dir / cfg["data"]["queries_file"]))
+    parser.add_argument("--run", default=os.path.join(cfg["general"]["output_dir"], "run_dense.txt"))
+    parser.add_argument("--top-k", type=int, default=dense.get("top_k", 25))
+    args = parser.parse_args()
+
+    if args.command == "build-ivf":
+        DenseIndex(args.index).build_ivf(args.lists)
+        return
+
+    encoder = Encoder.from_pretrained(args.model, batch_size=args.batch_size, max_length=args.max_length)
+    if args.command == "encode":
+        trace = Instrumentation("dense_encode", model=args.model)
+        DenseIndex(args.index).encode_corpus(args.corpus, encoder, shard_size=args.shard_size, trace=trace)
+        trace.close()
+    else:
+        DenseRetrieval(args.index, args.queries, args.run, encoder).run_search(args.top_k, nprobe=args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
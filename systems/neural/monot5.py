@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+monoT5 scoring engine (Nogueira et al., 2020).
+
+monoT5 is a seq2seq model fine-tuned to answer
+"Query: q Document: d Relevant:" with the single token "true" or "false";
+the relevance score is log P(true) of the 2-way softmax over these tokens.
+
+Fast path (`MonoT5Scorer`):
+
+* fast tokenizer, all pairs tokenised in one call, batches formed from
+  length-sorted inputs (little padding)
+* encoder in batches, exactly one decoder step (decoder start token only)
+* only the "true"/"false" rows of the LM head are projected
+  (2 x d_model instead of vocab x d_model per pair)
+
+`generate_scores` is the straightforward `model.generate()` reference used to
+validate scores (see stage `rerank:monoT5` in scripts/benchmark.py).
+"""
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+import sys, torch
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from scripts.instrumentation import NO_TRACE
+
+PROMPT = "Query: {query} Document: {document} Relevant:"
+
+
+def monot5_prompt(query: str, document: str) -> str:
+    return PROMPT.format(query=query, document=document)
+
+
+def token_id(tokenizer, word: str) -> int:
+    """Vocabulary id of `word` as the first generated token ("▁true" for SentencePiece T5)."""
+    unk = tokenizer.unk_token_id
+    for token in ("▁" + word, word):
+        tid = tokenizer.convert_tokens_to_ids(token)
+        if tid is not None and tid != unk:
+            return tid
+    ids = tokenizer(word, add_special_tokens=False)["input_ids"]
+    if not ids or ids[0] == unk:
+        raise ValueError(f"token {word!r} is not in the tokenizer vocabulary")
+    return ids[0]
+
+
+class MonoT5Scorer:
+    """Scores (query, document) pairs with a T5ForConditionalGeneration monoT5 checkpoint."""
+
+    def __init__(self, model, tokenizer, device: str = "cpu", batch_size: int = 64,
+                 max_length: int = 512, fp16: bool = False,
+                 true_token: str = "true", false_token: str = "false"):
+        self.model = model.to(device).eval()
+        self.tokenizer = tokenizer
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.fp16 = fp16 and device == "cuda"       # autocast only on CUDA
+
+        config = model.config
+        self.decoder_start = config.decoder_start_token_id
+        if self.decoder_start is None:
+            self.decoder_start = config.pad_token_id
+        # T5ForConditionalGeneration rescales the decoder output before the (tied) LM head;
+        # the flag is `scale_decoder_outputs` in transformers >= 5, `tie_word_embeddings` before
+        scale = getattr(config, "scale_decoder_outputs", getattr(config, "tie_word_embeddings", True))
+        self.output_scale = config.d_model ** -0.5 if scale else 1.0
+
+        ids = torch.tensor([token_id(tokenizer, false_token), token_id(tokenizer, true_token)])
+        self.token_ids = ids
+        # (2, d_model): rows of the LM head for [false, true]
+        self.head = model.get_output_embeddings().weight.detach()[ids].to(device)
+
+    @classmethod
+    def from_pretrained(cls, model_name: str, device: str = "cpu", batch_size: int = 64,
+                        max_length: int = 512, fp16: bool = False) -> "MonoT5Scorer":
+        from transformers import AutoTokenizer, T5ForConditionalGeneration
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        dtype = torch.float16 if fp16 and device == "cuda" else None
+        model = T5ForConditionalGeneration.from_pretrained(model_name, torch_dtype=dtype)
+        return cls(model, tokenizer, device, batch_size, max_length, fp16)
+
+    # ------------------------------------------------------------------ #
+    def _batches(self, pairs: Sequence[Tuple[str, str]], trace) -> List[Tuple[List[int], dict]]:
+        """Tokenise once, sort by length and yield (original positions, padded batch)."""
+        with trace.stage("tokenize"):
+            encoded = self.tokenizer([monot5_prompt(q, d) for q, d in pairs],
+                                     truncation=True, max_length=self.max_length)["input_ids"]
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        batches = []
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            with trace.stage("tokenize"):
+                batch = self.tokenizer.pad({"input_ids": [encoded[i] for i in idx]}, return_tensors="pt")
+            trace.count_padding(batch["attention_mask"])
+            batches.append((idx, batch))
+        return batches
+
+    @torch.no_grad()
+    def _true_false_logits(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        encoder_states = self.model.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        start = torch.full((input_ids.size(0), 1), self.decoder_start, dtype=torch.long, device=input_ids.device)
+        hidden = self.model.decoder(input_ids=start, encoder_hidden_states=encoder_states,
+                                    encoder_attention_mask=attention_mask, use_cache=False).last_hidden_state
+        hidden = hidden[:, 0] * self.output_scale
+        return hidden @ self.head.to(hidden.dtype).T           # (batch, 2) = [false, true]
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]], trace=NO_TRACE) -> List[float]:
+        """log P(true) for every (query, document) pair, in input order."""
+        scores: List[Optional[float]] = [None] * len(pairs)
+        for idx, batch in self._batches(pairs, trace):
+            input_ids = batch["input_ids"].to(self.device)
+            attention_mask = batch["attention_mask"].to(self.device)
+            with trace.stage("forward"):
+                if self.fp16:
+                    with torch.autocast("cuda", dtype=torch.float16):
+                        logits = self._true_false_logits(input_ids, attention_mask)
+                else:
+                    logits = self._true_false_logits(input_ids, attention_mask)
+                log_probs = torch.log_softmax(logits.float(), dim=-1)[:, 1].cpu().tolist()
+            for i, s in zip(idx, log_probs):
+                scores[i] = s
+            trace.count("pairs_scored", len(idx))
+        return scores
+
+    def score(self, query: str, documents: Sequence[str], trace=NO_TRACE) -> List[float]:
+        return self.score_pairs([(query, d) for d in documents], trace)
+
+
+@torch.no_grad()
+def generate_scores(model, tokenizer, pairs: Sequence[Tuple[str, str]], device: str = "cpu",
+                    batch_size: int = 16, max_length: int = 512,
+                    true_token: str = "true", false_token: str = "false") -> List[float]:
+    """Reference: one `generate()` step with output scores, full vocabulary projection."""
+    ids = [token_id(tokenizer, false_token), token_id(tokenizer, true_token)]
+    scores: List[float] = []
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        enc = tokenizer([monot5_prompt(q, d) for q, d in batch], padding=True, truncation=True,
+                        max_length=max_length, return_tensors="pt").to(device)
+        out = model.generate(**enc, max_new_tokens=1, do_sample=False, num_beams=1,
+                             output_scores=True, return_dict_in_generate=True)
+        logits = out.scores[0][:, ids]
+        scores.extend(torch.log_softmax(logits.float(), dim=-1)[:, 1].cpu().tolist())
+    return scores
@@ -9,26 +9,26 @@ Cohere Rerank (up to 100 docs) for LongEval WebRetrieval ‑ French, June‑22.
 * schreibt runs/run_neural_cohere.txt im TREC‑Format
 """
 from pathlib import Path
-from typing import Dict, List, Set
-import re, os, yaml, cohere, tqdm, textwrap
+from typing import Dict, List
+import os, sys, yaml, tqdm
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from scripts.docstore import DocStore, normalize_docid
+from scripts.instrumentation import Instrumentation
+from scripts.rerank_plan import DEFAULT_MODE, RerankPlan
 
 # --------------------------------------------------------------------------- #
 # Konfigpfade                                                                 #
 # --------------------------------------------------------------------------- #
 CFG_PATH = Path(__file__).resolve().parents[2] / "scripts" / "config.yml"
-cfg      = yaml.safe_load(CFG_PATH.read_text())
-
-DATA_DIR   = Path(cfg["data"]["data_dir"])
-OUTPUT_DIR = Path(cfg["general"]["output_dir"])
 
 DOCUMENT_DIR = Path(
     "data/release_2025_june_subset/release_2025_p1/"
     "French/LongEval Train Collection/Trec/2022-06_fr"
 )
 
-BM25_RUN   = OUTPUT_DIR / "run_bm25.txt"
-OUT_FILE   = OUTPUT_DIR / "run_neural_cohere.txt"
-
 COHERE_MODEL = "rerank-multilingual-v3.0"
 TOP_K        = 25                     # docs per query to rerank (kommt aus BM25‑Run)
 BATCH_SIZE   = 100                    # Cohere akzeptiert bis 100 Paarungen pro Call
@@ -36,9 +36,6 @@ BATCH_SIZE   = 100                    # Cohere akzeptiert bis 100 Paarungen pro
 # --------------------------------------------------------------------------- #
 # kleine Helfer                                                               #
 # --------------------------------------------------------------------------- #
-DOC_START = re.compile(r"<DOC>");  DOC_END = re.compile(r"</DOC>")
-DOCNO     = re.compile(r"<DOCNO>(.*?)</DOCNO>", re.I)
-
 def load_bm25(path: Path, k: int = TOP_K) -> Dict[str, List[str]]:
     run: Dict[str, List[str]] = {}
     for ln in path.read_text().splitlines():
@@ -56,40 +53,26 @@ def parse_queries(trec: Path) -> Dict[str, str]:
             mapping[qid] = ln.replace("<title>","").strip()
     return mapping
 
-def load_docs(directory: Path, needed: Set[str]) -> Dict[str, str]:
-    plain = {d.lstrip("doc") for d in needed}
-    corpus: Dict[str, str] = {}
-    for fp in tqdm.tqdm(list(directory.rglob("*.trec")), desc="📖 reading .trec"):
-        with fp.open(encoding="utf-8") as f:
-            in_doc, buf, did = False, [], None
-            for ln in f:
-                if DOC_START.match(ln):
-                    in_doc, buf, did = True, [], None;  continue
-                if in_doc and DOC_END.match(ln):
-                    in_doc = False
-                    if did and did.lstrip("doc") in plain:
-                        corpus[did] = " ".join(buf)
-                        corpus[did.lstrip("doc")] = corpus[did]   # dup‑key ohne "doc"
-                    continue
-                if in_doc:
-                    if did is None and (m := DOCNO.search(ln)):
-                        did = m.group(1).strip()
-                    else:
-                        buf.append(ln.strip())
-        if len(corpus) >= 2 * len(needed):
-            break
-    print(f"✅ loaded {len(corpus)//2} documents")
-    return corpus
-
 # --------------------------------------------------------------------------- #
 # Hauptlogik                                                                  #
 # --------------------------------------------------------------------------- #
-def main() -> None:
+def rerank_run(run_file: Path, document_dir: Path, queries_file: Path, out_file: Path,
+               model_name: str = COHERE_MODEL, top_k: int = TOP_K, dedup: str = DEFAULT_MODE) -> None:
+    import cohere
+
+    trace = Instrumentation("rerank_cohere", model=model_name, dedup=dedup)
     # --- Dateien laden ----------------------------------------------------- #
-    bm25    = load_bm25(BM25_RUN)
+    with trace.stage("run_load"):
+        bm25    = load_bm25(run_file, top_k)
     needed  = {d for lst in bm25.values() for d in lst}
-    docs    = load_docs(DOCUMENT_DIR, needed)
-    queries = parse_queries(DATA_DIR / cfg["data"]["queries_file"])
+    with trace.stage("doc_load"):
+        docs    = DocStore.from_trec(document_dir, needed)
+    with trace.stage("query_parse"):
+        queries = parse_queries(queries_file)
+    # gleiche (normalisierte Query, Doc)-Paare verschiedener qids nur einmal an die API schicken
+    with trace.stage("plan"):
+        plan    = RerankPlan(bm25, queries, available=docs, mode=dedup)
+    plan.print_summary()
 
     # --- Cohere‑Client ----------------------------------------------------- #
     api_key = os.getenv("COHERE_API_KEY")
@@ -97,29 +80,49 @@ def main() -> None:
         raise RuntimeError("Bitte COHERE_API_KEY als Umgebungsvariable setzen!")
     coh = cohere.Client(api_key)
 
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    with OUT_FILE.open("w") as fout:
-        for qid, docids in tqdm.tqdm(bm25.items(), desc="⚡ Cohere rerank"):
-            if qid not in queries: continue
-            texts = [docs[d] for d in docids if d in docs]
-            if not texts: continue
-
-            # --- API‑Call --------------------------------------------------- #
+    # --- API‑Call (nur neue Paare; alle mit dem Query‑Text ihres Keys) ----- #
+    def score_jobs(jobs):
+        with trace.stage("api_call"):
             resp = coh.rerank(
-                query       = queries[qid],
-                documents   = texts,
-                top_n       = len(texts),          # vollständige Sortierung
-                model       = COHERE_MODEL,
+                query       = jobs[0][0],
+                documents   = [docs[d] for _, d in jobs],
+                top_n       = len(jobs),           # vollständige Sortierung
+                model       = model_name,
                 return_documents = False
             )
-            # resp.results enthält eine Liste mit index + relevance_score
-
-            ranked = [(docids[r.index], r.relevance_score) for r in resp.results]
-
-            for rank, (docid, score) in enumerate(ranked, 1):
-                fout.write(f"{qid} Q0 {docid.lstrip('doc')} {rank} {score:.4f} cohere\n")
+        # resp.results enthält eine Liste mit index + relevance_score
+        trace.count("pairs_scored", len(jobs))
+        scores = [0.0] * len(jobs)
+        for r in resp.results:
+            scores[r.index] = r.relevance_score
+        return scores
+
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with out_file.open("w") as fout:
+        for qid, docids in tqdm.tqdm(bm25.items(), desc="⚡ Cohere rerank"):
+            if qid not in queries:
+                trace.count("queries_missing"); continue
+            # nur Docs mit Text, damit r.index auf die richtige docid zeigt
+            docids = [d for d in docids if d in docs]
+            trace.count("docs_missing", len(bm25[qid]) - len(docids))
+            if not docids: continue
+            scores = plan.resolve([(qid, docids)], score_jobs)[0]
+            ranked = sorted(zip(docids, scores), key=lambda x: x[1], reverse=True)
+
+            with trace.stage("write"):
+                for rank, (docid, score) in enumerate(ranked, 1):
+                    fout.write(f"{qid} Q0 {normalize_docid(docid)} {rank} {score:.4f} cohere\n")
+
+    plan.report(trace)
+    trace.close()
+    print(f"🏁 Finished → {out_file}")
 
-    print(f"🏁 Finished → {OUT_FILE}")
+def main() -> None:
+    cfg = yaml.safe_load(CFG_PATH.read_text())
+    data_dir   = Path(cfg["data"]["data_dir"])
+    output_dir = Path(cfg["general"]["output_dir"])
+    rerank_run(output_dir / "run_bm25.txt", DOCUMENT_DIR,
+               data_dir / cfg["data"]["queries_file"], output_dir / "run_neural_cohere.txt")
 
 # --------------------------------------------------------------------------- #
 if __name__ == "__main__":
@@ -14,30 +14,27 @@ Expected speed    : ≈ 900 query–doc pairs / s  →  75 k queries × 25 doc
 """
 
 from pathlib import Path
-from typing import Dict, List, Set
-import re, json, yaml, torch
+from typing import Dict, List
+import sys, yaml
 from tqdm import tqdm
 
-from pygaggle.rerank.transformer import TransformerReranker
-from pygaggle.data.text import Text
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from scripts.docstore import DocStore
+from scripts.instrumentation import Instrumentation
+from scripts.rerank_plan import DEFAULT_MODE, RerankPlan
 
 # --------------------------------------------------------------------------- #
 # Config paths                                                                #
 # --------------------------------------------------------------------------- #
 CFG_PATH = Path(__file__).resolve().parents[2] / "scripts" / "config.yml"
-cfg = yaml.safe_load(CFG_PATH.read_text())
-
-DATA_DIR   = Path(cfg["data"]["data_dir"])
-OUTPUT_DIR = Path(cfg["general"]["output_dir"])
 
 DOCUMENT_DIR = Path(
     "data/release_2025_june_subset/release_2025_p1/"
     "French/LongEval Train Collection/Trec/2022-06_fr"
 )
 
-BM25_RUN   = OUTPUT_DIR / "run_bm25.txt"
-OUTFILE    = OUTPUT_DIR / "run_neural_luyu.txt"
-
 # --------------------------------------------------------------------------- #
 # Hyper‑params                                                                #
 # --------------------------------------------------------------------------- #
@@ -49,9 +46,6 @@ BATCH_SIZE   = 128                               # fits A40 in FP16
 # --------------------------------------------------------------------------- #
 # Utility functions                                                           #
 # --------------------------------------------------------------------------- #
-DOC_START = re.compile(r"<DOC>") ; DOC_END = re.compile(r"</DOC>")
-DOCNO     = re.compile(r"<DOCNO>(.*?)</DOCNO>", re.I)
-
 def load_run(path: Path, k: int = TOP_K) -> Dict[str, List[str]]:
     run: Dict[str, List[str]] = {}
     for ln in path.read_text().splitlines():
@@ -73,64 +67,68 @@ def parse_queries(path: Path) -> Dict[str, str]:
             mapping[qid] = ln.replace("<title>","").strip()
     return mapping
 
-def load_docs(directory: Path, needed: Set[str]) -> Dict[str, str]:
-    """Return {docid:text} for all IDs in `needed`."""
-    plain = {d.lstrip("doc") for d in needed}
-    corpus: Dict[str, str] = {}
-    for fp in tqdm(directory.rglob("*.trec"), desc="📖 load TREC"):
-        with fp.open(encoding="utf-8") as f:
-            in_doc, buf, did = False, [], None
-            for ln in f:
-                if DOC_START.match(ln):
-                    in_doc, buf, did = True, [], None ; continue
-                if in_doc and DOC_END.match(ln):
-                    in_doc = False
-                    if did and did.lstrip("doc") in plain:
-                        text = " ".join(buf)
-                        corpus[did] = text
-                        corpus[did.lstrip("doc")] = text
-                    continue
-                if in_doc:
-                    if did is None and (m:=DOCNO.search(ln)):
-                        did = m.group(1).strip()
-                    else:
-                        buf.append(ln.strip())
-        if len(corpus) >= 2 * len(needed):
-            break
-    print(f"✅ documents loaded: {len(corpus)//2}")
-    return corpus
-
 # --------------------------------------------------------------------------- #
 # Main                                                                        #
 # --------------------------------------------------------------------------- #
-def main() -> None:
-    bm25      = load_run(BM25_RUN)
+def rerank_run(run_file: Path, document_dir: Path, queries_file: Path, out_file: Path,
+               model_name: str = MODEL_NAME, top_k: int = TOP_K, dedup: str = DEFAULT_MODE) -> None:
+    from pygaggle.rerank.transformer import TransformerReranker
+    from pygaggle.data.text import Text
+
+    trace = Instrumentation("rerank_luyu", model=model_name, device=DEVICE, batch_size=BATCH_SIZE, dedup=dedup)
+    with trace.stage("run_load"):
+        bm25      = load_run(run_file, top_k)
     needed    = {d for lst in bm25.values() for d in lst}
-    docs      = load_docs(DOCUMENT_DIR, needed)
-    queries   = parse_queries(DATA_DIR / cfg["data"]["queries_file"])
+    with trace.stage("doc_load"):
+        docs      = DocStore.from_trec(document_dir, needed)
+    with trace.stage("query_parse"):
+        queries   = parse_queries(queries_file)
+    with trace.stage("plan"):
+        plan      = RerankPlan(bm25, queries, available=docs, mode=dedup)
+    plan.print_summary()
 
     print("⏳ loading Luyu reranker …")
-    reranker = TransformerReranker(
-        MODEL_NAME,
-        batch_size=BATCH_SIZE,
-        device=DEVICE,
-        use_fp16=True            # halves VRAM, speeds up 1.7×
-    )
-
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    with OUTFILE.open("w") as fout:
+    with trace.stage("model_load"):
+        reranker = TransformerReranker(
+            model_name,
+            batch_size=BATCH_SIZE,
+            device=DEVICE,
+            use_fp16=True            # halves VRAM, speeds up 1.7×
+        )
+
+    # all new jobs of one qid share the query text of its key
+    def score_jobs(jobs):
+        texts = [Text(docs[d], {'docid': d}, 0) for _, d in jobs]
+        # PyGaggle tokenises and scores internally
+        with trace.stage("forward"):
+            reranked = reranker.rerank(jobs[0][0], texts)
+        trace.count("pairs_scored", len(texts))
+        by_docid = {txt.metadata['docid']: txt.score for txt in reranked}
+        return [by_docid[d] for _, d in jobs]
+
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with out_file.open("w") as fout:
         for qid, docids in tqdm(bm25.items(), desc="⚡ rerank"):
-            if qid not in queries: continue
-            query_text = queries[qid]
-            texts = [Text(docs[d], {'docid': d}, 0) for d in docids if d in docs]
-            if not texts: continue
-            reranked = reranker.rerank(query_text, texts)
-            for rank, txt in enumerate(reranked, 1):
-                fout.write(
-                    f"{qid} Q0 {txt.metadata['docid']} {rank} "
-                    f"{txt.score:.4f} luyu20w06\n"
-                )
-    print(f"🏁 done → {OUTFILE}")
+            if qid not in queries:
+                trace.count("queries_missing"); continue
+            found = [d for d in docids if d in docs]
+            trace.count("docs_missing", len(docids) - len(found))
+            if not found: continue
+            scores = plan.resolve([(qid, found)], score_jobs)[0]
+            ranked = sorted(zip(found, scores), key=lambda x: x[1], reverse=True)
+            with trace.stage("write"):
+                for rank, (docid, score) in enumerate(ranked, 1):
+                    fout.write(f"{qid} Q0 {docid} {rank} {score:.4f} luyu20w06\n")
+    plan.report(trace)
+    trace.close()
+    print(f"🏁 done → {out_file}")
+
+def main() -> None:
+    cfg = yaml.safe_load(CFG_PATH.read_text())
+    data_dir   = Path(cfg["data"]["data_dir"])
+    output_dir = Path(cfg["general"]["output_dir"])
+    rerank_run(output_dir / "run_bm25.txt", DOCUMENT_DIR,
+               data_dir / cfg["data"]["queries_file"], output_dir / "run_neural_luyu.txt")
 
 if __name__ == "__main__":
     main()
@@ -12,25 +12,27 @@ Output : runs/run_neural_luyu.txt  (TREC‑format)
 """
 
 from pathlib import Path
-from typing import Dict, List, Set
-import re, yaml, torch
+from typing import Dict, List, Tuple
+import sys, torch
 from tqdm import tqdm
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from scripts.docstore import DocStore, normalize_docid
+from scripts.instrumentation import Instrumentation, NO_TRACE
+from scripts.rerank_plan import DEFAULT_MODE, RerankPlan
+
 # ------------------------------------------------------------------------- #
 # Config                                                                    #
 # ------------------------------------------------------------------------- #
-CFG_PATH = Path(__file__).resolve().parents[2] / "scripts" / "config.yml"
-cfg      = yaml.safe_load(CFG_PATH.read_text())
-
-DATA_DIR   = Path(cfg["data"]["data_dir"])
-OUTPUT_DIR = Path(cfg["general"]["output_dir"])
-
 DOCUMENT_DIR = Path("data/lag6_lag8_subset/release_2025_p1/French/LongEval Train Collection/Trec/2022-11_fr")
 
 
 BM25_RUN = Path("runs/run_bm25.txt")
 OUT_FILE = Path("runs/run_neural_luyu_opt_2.txt")
+QUERIES_FILE = Path("data/lag6_lag8_subset/release_2025_p1/French/queries.trec")
 
 MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"   # frei verfügbar
 TOP_K      = 25
@@ -45,9 +47,6 @@ USE_FP16 = DEVICE == "cuda"                  # AMP only safe on CUDA
 # ------------------------------------------------------------------------- #
 # Helpers                                                                   #
 # ------------------------------------------------------------------------- #
-DOC_START = re.compile(r"<DOC>");  DOC_END = re.compile(r"</DOC>")
-DOCNO     = re.compile(r"<DOCNO>(.*?)</DOCNO>", re.I)
-
 def load_run(path: Path, k: int = TOP_K) -> Dict[str, List[str]]:
     run: Dict[str, List[str]] = {}
     for ln in path.read_text().splitlines():
@@ -67,85 +66,87 @@ def parse_queries_trec(trec: Path) -> Dict[str, str]:
             mapping[qid] = ln.replace("<title>","").strip()
     return mapping
 
-def load_docs(directory: Path, needed: Set[str]) -> Dict[str, str]:
-    plain = {d.lstrip("doc") for d in needed}
-    corpus: Dict[str,str] = {}
-    for fp in tqdm(directory.rglob("*.trec"), desc="📖 scanning TREC"):
-        with fp.open(encoding="utf-8") as f:
-            in_doc, buf, did = False, [], None
-            for ln in f:
-                if DOC_START.match(ln):
-                    in_doc, buf, did = True, [], None;  continue
-                if in_doc and DOC_END.match(ln):
-                    in_doc = False
-                    if did and did.lstrip("doc") in plain:
-                        text = " ".join(buf)
-                        corpus[did] = text
-                        corpus[did.lstrip("doc")] = text
-                    continue
-                if in_doc:
-                    if did is None and (m:=DOCNO.search(ln)):
-                        did = m.group(1).strip()
-                    else:
-                        buf.append(ln.strip())
-        if len(corpus) >= 2*len(needed):
-            break
-    print(f"✅ loaded {len(corpus)//2} documents")
-    return corpus
-
-def rerank(model, tok, query: str, docs: List[str]) -> List[float]:
+def rerank(model, tok, query: str, docs: List[str], trace=NO_TRACE) -> List[float]:
+    return score_pairs(model, tok, [(query, d) for d in docs], trace)
+
+def score_pairs(model, tok, pairs: List[Tuple[str, str]], trace=NO_TRACE) -> List[float]:
+    """Score (query, document) pairs, possibly from different queries, in batches of BATCH_SIZE."""
     scores: List[float] = []
-    for i in range(0, len(docs), BATCH_SIZE):
-        batch = docs[i:i+BATCH_SIZE]
-        enc = tok(
-            [f"Query: {query} Document: {d}" for d in batch],
-            padding = True,
-            truncation = True,
-            max_length = 256,
-            return_tensors = "pt"
-        ).to(DEVICE)
-
-        with torch.no_grad():
+    for i in range(0, len(pairs), BATCH_SIZE):
+        batch = pairs[i:i+BATCH_SIZE]
+        with trace.stage("tokenize"):
+            enc = tok(
+                [f"Query: {q} Document: {d}" for q, d in batch],
+                padding = True,
+                truncation = True,
+                max_length = 256,
+                return_tensors = "pt"
+            ).to(DEVICE)
+        trace.count_padding(enc["attention_mask"])
+
+        with trace.stage("forward"), torch.no_grad():
             if USE_FP16:
                 with torch.autocast("cuda", dtype=torch.float16):
                     logits = model(**enc).logits
             else:
                 logits = model(**enc).logits
-        # binary classifier: positive class is index 1
-        logits = logits[:, 1] if logits.size(-1) > 1 else logits.squeeze(-1)
-        scores.extend(logits.float().cpu().tolist())
+            # binary classifier: positive class is index 1
+            logits = logits[:, 1] if logits.size(-1) > 1 else logits.squeeze(-1)
+            scores.extend(logits.float().cpu().tolist())
+        trace.count("pairs_scored", len(batch))
     return scores
 
 # ------------------------------------------------------------------------- #
 # Main                                                                      #
 # ------------------------------------------------------------------------- #
-def main() -> None:
-    bm25   = load_run(BM25_RUN)
+def rerank_run(run_file: Path = BM25_RUN, document_dir: Path = DOCUMENT_DIR, queries_file: Path = QUERIES_FILE,
+               out_file: Path = OUT_FILE, model_name: str = MODEL_NAME, top_k: int = TOP_K,
+               dedup: str = DEFAULT_MODE) -> None:
+    trace = Instrumentation("rerank_luyu_hf", model=model_name, device=DEVICE, batch_size=BATCH_SIZE, dedup=dedup)
+    with trace.stage("run_load"):
+        bm25   = load_run(run_file, top_k)
     needed = {d for lst in bm25.values() for d in lst}
-    docs   = load_docs(DOCUMENT_DIR, needed)
-    queries = parse_queries_trec( Path("data/lag6_lag8_subset/release_2025_p1/French/queries.trec")
-    )
-    print(f"⏳ loading {MODEL_NAME} on {DEVICE} …")
-    tok = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
-    model = (
-        AutoModelForSequenceClassification
-        .from_pretrained(MODEL_NAME, torch_dtype=torch.float16 if USE_FP16 else None)
-        .to(DEVICE)
-        .eval()
-    )
-
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    with OUT_FILE.open("w") as fout:
+    with trace.stage("doc_load"):
+        docs   = DocStore.from_trec(document_dir, needed)
+    with trace.stage("query_parse"):
+        queries = parse_queries_trec(queries_file)
+    with trace.stage("plan"):
+        plan = RerankPlan(bm25, queries, available=docs, mode=dedup)
+    plan.print_summary()
+    print(f"⏳ loading {model_name} on {DEVICE} …")
+    with trace.stage("model_load"):
+        tok = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        model = (
+            AutoModelForSequenceClassification
+            .from_pretrained(model_name, torch_dtype=torch.float16 if USE_FP16 else None)
+            .to(DEVICE)
+            .eval()
+        )
+
+    # only (query, doc) pairs not scored for an identical query before go through the model
+    def score_jobs(jobs):
+        return score_pairs(model, tok, [(q, docs[d]) for q, d in jobs], trace)
+
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with out_file.open("w") as fout:
         for qid, docids in tqdm(bm25.items(), desc="⚡ reranking"):
-            if qid not in queries: continue
-            texts = [docs[d] for d in docids if d in docs]
-            if not texts: continue
-            scores = rerank(model, tok, queries[qid], texts)
+            if qid not in queries:
+                trace.count("queries_missing"); continue
+            docids = [d for d in docids if d in docs]
+            trace.count("docs_missing", len(bm25[qid]) - len(docids))
+            if not docids: continue
+            scores = plan.resolve([(qid, docids)], score_jobs)[0]
             ranked = sorted(zip(docids, scores), key=lambda x: x[1], reverse=True)
-            for rank, (docid, score) in enumerate(ranked, 1):
-                fout.write(f"{qid} Q0 {docid.lstrip('doc')} {rank} {score:.4f} luyuHF\n")
+            with trace.stage("write"):
+                for rank, (docid, score) in enumerate(ranked, 1):
+                    fout.write(f"{qid} Q0 {normalize_docid(docid)} {rank} {score:.4f} luyuHF\n")
 
-    print(f"🏁 Finished → {OUT_FILE}")
+    plan.report(trace)
+    trace.close()
+    print(f"🏁 Finished → {out_file}")
+
+def main() -> None:
+    rerank_run()
 
 if __name__ == "__main__":
     main()
@@ -7,35 +7,43 @@ Fast‑path tweaks
 ----------------
 * rerank depth     : 25 docs / query  (TOP_K)
 * distilled model  : castorini/monot5-base-msmarco-10k  (~110 M params)
-* batch size       : 16, FP16 on CUDA / MPS
-* AMP on CUDA      : torch.cuda.amp.autocast() for ~2× speed‑up
+* batch size       : 64, FP16 on CUDA
+* scoring          : systems/neural/monot5.py – T5ForConditionalGeneration,
+                     one decoder step, only the "true"/"false" logits
+* batching         : pairs of several queries, length‑sorted (CHUNK_PAIRS)
+* dedup            : (query, doc) pairs of different qids with identical query text
+                     are scored once (scripts/rerank_plan.py, --dedup exact)
+* AMP on CUDA      : torch.autocast() for ~2× speed‑up
 * tokenisation uses the fast T5 tokenizer
 
-All paths except DOCUMENT_DIR come from scripts/config.yml.
+When run as a script, all paths except DOCUMENT_DIR come from scripts/config.yml
+(QUERIES_FILE is only the default of rerank_run).
 """
 
 from pathlib import Path
-from typing import Dict, List, Set
-import json, re, yaml, torch
+from typing import Dict, List
+import sys, yaml, torch
 from tqdm import tqdm
-from transformers import AutoModelForSequenceClassification, T5Tokenizer
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from scripts.docstore import DocStore
+from scripts.instrumentation import Instrumentation, NO_TRACE
+from scripts.rerank_plan import DEFAULT_MODE, RerankPlan
+from systems.neural.monot5 import MonoT5Scorer
 
 # --------------------------------------------------------------------------- #
 # Config & constants                                                          #
 # --------------------------------------------------------------------------- #
 CFG_PATH = Path(__file__).resolve().parents[2] / "scripts" / "config.yml"
-cfg = yaml.safe_load(CFG_PATH.read_text())
-
-DATA_DIR   = Path(cfg["data"]["data_dir"])
-OUTPUT_DIR = Path(cfg["general"]["output_dir"])
 
 DOCUMENT_DIR = Path(
     "data/release_2025_june_subset/release_2025_p1/"
     "French/LongEval Train Collection/Trec/2022-06_fr"
 )
 
-BM25_RUN_FILE  = OUTPUT_DIR / "run_bm25.txt"
-OUTPUT_RUNFILE = OUTPUT_DIR / "run_neural_monoT5_2.txt"
+QUERIES_FILE = Path("data/lag6_lag8_subset/release_2025_p1/French/queries.trec")
 
 MODEL_NAME = "castorini/monot5-base-msmarco-10k"   # distilled 110 M
 DEVICE     = (
@@ -46,6 +54,8 @@ DEVICE     = (
 TOP_K      = 25            # docs per query to rerank
 BATCH_SIZE = 64            # fits 16 GB with FP16
 AMP        = DEVICE == "cuda"   # autocast works only on CUDA reliably
+MAX_LENGTH = 256           # prompt tokens (query + document + "Relevant:")
+CHUNK_PAIRS = BATCH_SIZE * 16   # pairs of several queries scored together
 
 # --------------------------------------------------------------------------- #
 # Helpers                                                                     #
@@ -77,109 +87,73 @@ def parse_queries_trec(trec_path: Path) -> Dict[str, str]:
     return mapping
 
 
-# Quick‑and‑dirty TREC parser -------------------------------------------------
-DOC_START = re.compile(r"<DOC>")
-DOC_END   = re.compile(r"</DOC>")
-DOCNO     = re.compile(r"<DOCNO>(.*?)</DOCNO>", re.I)
-
-def collect_needed_texts(directory: Path, needed: Set[str]) -> Dict[str, str]:
-    """
-    Scan *.trec files, return {docid/text} for docs in `needed`.
-    Adds both 'doc123' and '123' keys so look‑ups always hit.
-    """
-    corpus, needed_plain = {}, {d.lstrip("doc") for d in needed}
-    for fp in tqdm(directory.rglob("*.trec"), desc="📖 Scanning TREC"):
-        with fp.open(encoding="utf-8") as f:
-            in_doc, buf, doc_id = False, [], None
-            for line in f:
-                if DOC_START.match(line):
-                    in_doc, buf, doc_id = True, [], None
-                    continue
-                if in_doc and DOC_END.match(line):
-                    in_doc = False
-                    if doc_id and doc_id.lstrip("doc") in needed_plain:
-                        text = " ".join(buf)
-                        corpus[doc_id] = text
-                        corpus[doc_id.lstrip('doc')] = text
-                    continue
-                if in_doc:
-                    if doc_id is None and (m := DOCNO.search(line)):
-                        doc_id = m.group(1).strip()
-                    else:
-                        buf.append(line.strip())
-        if len(corpus) >= 2 * len(needed):
-            break
-    missing = needed - corpus.keys()
-    print(f"✅ Docs loaded: {len(corpus)//2} | missing: {len(missing)}")
-    return corpus
-
-
-def rerank(
-    model, tokenizer, query: str, docs: List[str], batch_size: int = BATCH_SIZE
-) -> List[float]:
-    """Return monoT5 scores for (query, docs)."""
-    scores: List[float] = []
-    for i in range(0, len(docs), batch_size):
-        batch_inputs = [f"Query: {query} Document: {d}" for d in docs[i : i + batch_size]]
-        enc = tokenizer(
-            batch_inputs,
-            padding=True,
-            truncation=True,
-            max_length=256,
-            return_tensors="pt",
-        ).to(DEVICE)
-
-
-        use_amp = DEVICE in ["cuda", "mps"]
-
-        with torch.no_grad():
-            if use_amp:
-                with torch.autocast(device_type=DEVICE, dtype=torch.float16):
-                    logits = model(**enc).logits
-            else:
-                logits = model(**enc).logits
-        
-            logits = logits[:, 1] if logits.size(-1) > 1 else logits.squeeze(-1)
-            scores.extend(logits.cpu().float().tolist())
-
-
-    return scores
+def rerank(scorer: MonoT5Scorer, query: str, docs: List[str], trace=NO_TRACE) -> List[float]:
+    """Return monoT5 scores (log P(true)) for (query, docs)."""
+    return scorer.score(query, docs, trace)
 
 # --------------------------------------------------------------------------- #
 # Main                                                                        #
 # --------------------------------------------------------------------------- #
-def main() -> None:
-    bm25_run   = load_run(BM25_RUN_FILE)
+def rerank_run(run_file: Path, document_dir: Path = DOCUMENT_DIR, queries_file: Path = QUERIES_FILE,
+               out_file: Path = Path("runs/run_neural_monoT5_2.txt"), model_name: str = MODEL_NAME,
+               top_k: int = TOP_K, dedup: str = DEFAULT_MODE) -> None:
+    trace = Instrumentation("rerank_monoT5", model=model_name, device=DEVICE, batch_size=BATCH_SIZE, dedup=dedup)
+    with trace.stage("run_load"):
+        bm25_run   = load_run(run_file, top_k)
     needed_ids = {d for lst in bm25_run.values() for d in lst}
     print(f"🗂️  documents to load: {len(needed_ids):,}")
 
-    corpus  = collect_needed_texts(DOCUMENT_DIR, needed_ids)
-    queries = parse_queries_trec(Path("data/lag6_lag8_subset/release_2025_p1/French/queries.trec"))
-
-    print(f"⏳ Loading model {MODEL_NAME} on {DEVICE} …")
-    tokenizer = T5Tokenizer.from_pretrained(MODEL_NAME, use_fast=True)
-    model = (
-        AutoModelForSequenceClassification
-        .from_pretrained(MODEL_NAME, torch_dtype=torch.float16)
-        .to(DEVICE)
-        .eval()
-    )
-
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    with OUTPUT_RUNFILE.open("w") as fout:
+    with trace.stage("doc_load"):
+        corpus  = DocStore.from_trec(document_dir, needed_ids)
+    with trace.stage("query_parse"):
+        queries = parse_queries_trec(queries_file)
+    with trace.stage("plan"):
+        plan = RerankPlan(bm25_run, queries, available=corpus, mode=dedup)
+    plan.print_summary()
+
+    print(f"⏳ Loading model {model_name} on {DEVICE} …")
+    with trace.stage("model_load"):
+        scorer = MonoT5Scorer.from_pretrained(model_name, DEVICE, BATCH_SIZE, MAX_LENGTH, fp16=AMP)
+
+    def flush(chunk, fout):
+        """Score the new pairs of several queries together (length-sorted batches across queries)."""
+        chunk_scores = plan.resolve(chunk, lambda jobs: scorer.score_pairs([(q, corpus[d]) for q, d in jobs], trace))
+        with trace.stage("write"):
+            for (qid, found), scores in zip(chunk, chunk_scores):
+                ranked = sorted(zip(found, scores), key=lambda x: x[1], reverse=True)
+                for rank, (doc, score) in enumerate(ranked, 1):
+                    fout.write(f"{qid} Q0 {doc} {rank} {score:.4f} monoT5\n")
+
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with out_file.open("w") as fout:
+        chunk, pending = [], 0
         for qid, docids in tqdm(bm25_run.items(), desc="⚡ Re‑ranking"):
             if qid not in queries:
+                trace.count("queries_missing")
                 continue
-            docs_text = [corpus[d] for d in docids if d in corpus]
-            if not docs_text:
+            found = [d for d in docids if d in corpus]
+            trace.count("docs_missing", len(docids) - len(found))
+            if not found:
                 continue
-            scores = rerank(model, tokenizer, queries[qid], docs_text)
-            ranked = sorted(zip(docids, scores), key=lambda x: x[1], reverse=True)
-            for rank, (doc, score) in enumerate(ranked, 1):
-                fout.write(f"{qid} Q0 {doc} {rank} {score:.4f} monoT5\n")
+            chunk.append((qid, found))
+            pending += len(found)
+            if pending >= CHUNK_PAIRS:
+                flush(chunk, fout)
+                chunk, pending = [], 0
+        if chunk:
+            flush(chunk, fout)
+
+    plan.report(trace)
+    trace.close()
+    print(f"🏁 Finished → {out_file}")
 
 
-    print(f"🏁 Finished → {OUTPUT_RUNFILE}")
+def main() -> None:
+    cfg = yaml.safe_load(CFG_PATH.read_text())
+    data_dir   = Path(cfg["data"]["data_dir"])
+    output_dir = Path(cfg["general"]["output_dir"])
+    rerank_run(output_dir / "run_bm25.txt", queries_file=data_dir / cfg["data"]["queries_file"],
+               out_file=output_dir / "run_neural_monoT5_2.txt")
 
 
 if __name__ == "__main__":
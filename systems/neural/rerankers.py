@@ -0,0 +1,14 @@
+"""
+Registry of the rerankers: command-line name -> module with
+`rerank_run(run_file, document_dir, queries_file, out_file, model_name=..., top_k=..., dedup=...)`.
+
+Shared by longeval.py and scripts/experiments.py; the modules themselves
+are imported only by whoever runs them (torch, transformers, cohere ...).
+"""
+
+RERANKERS = {
+    "luyu_hf": "systems.neural.rerank_luyu_hf",
+    "monoT5": "systems.neural.rerank_monoT5",
+    "luyu": "systems.neural.rerank_luyu",
+    "cohere": "systems.neural.rerank_cohere",
+}